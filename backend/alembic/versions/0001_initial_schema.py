@@ -0,0 +1,161 @@
+"""initial schema
+
+Baseline matching the tables that init_db() used to create with
+Base.metadata.create_all. Tables that already exist are left untouched, so a
+database created before migrations were introduced can be brought under
+Alembic with a plain `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 08:28:50.388913
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_table(name: str, *columns) -> None:
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns)
+
+
+def upgrade() -> None:
+    _create_table('api_key_storage',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('encrypted_key', sa.Text(), nullable=True),
+    sa.Column('is_valid', sa.Boolean(), nullable=True),
+    sa.Column('last_validated', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('provider')
+    )
+    _create_table('app_settings',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('value', sa.Text(), nullable=True),
+    sa.Column('value_type', sa.String(length=50), nullable=True),
+    sa.Column('category', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    _create_table('knowledge_spaces',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('color', sa.String(length=7), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    _create_table('model_configs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('model_id', sa.String(length=255), nullable=False),
+    sa.Column('api_key', sa.Text(), nullable=True),
+    sa.Column('base_url', sa.String(length=500), nullable=True),
+    sa.Column('default_temperature', sa.String(length=10), nullable=True),
+    sa.Column('default_max_tokens', sa.String(length=10), nullable=True),
+    sa.Column('extra_params', sa.JSON(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('is_default', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('projects',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('color', sa.String(length=7), nullable=True),
+    sa.Column('icon', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('topics',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('color', sa.String(length=7), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('conversations',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=False),
+    sa.Column('model_provider', sa.Enum('OPENAI', 'ANTHROPIC', 'GOOGLE', 'OLLAMA', name='modelprovider'), nullable=False),
+    sa.Column('model_name', sa.String(length=100), nullable=False),
+    sa.Column('project_id', sa.String(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('messages',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('conversation_id', sa.String(length=36), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('knowledge_points',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('conversation_id', sa.String(length=36), nullable=False),
+    sa.Column('message_id', sa.String(length=36), nullable=False),
+    sa.Column('selected_text', sa.Text(), nullable=False),
+    sa.Column('start_offset', sa.Integer(), nullable=False),
+    sa.Column('end_offset', sa.Integer(), nullable=False),
+    sa.Column('understanding_level', sa.Enum('NOT_UNDERSTOOD', 'PARTIALLY_UNDERSTOOD', 'MASTERED', name='understandinglevel'), nullable=False),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('questions', sa.JSON(), nullable=True),
+    sa.Column('topic_id', sa.String(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+    sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ),
+    sa.ForeignKeyConstraint(['topic_id'], ['topics.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('exploration_links',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('parent_conversation_id', sa.String(length=36), nullable=False),
+    sa.Column('child_conversation_id', sa.String(length=36), nullable=False),
+    sa.Column('knowledge_point_id', sa.String(length=36), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['child_conversation_id'], ['conversations.id'], ),
+    sa.ForeignKeyConstraint(['knowledge_point_id'], ['knowledge_points.id'], ),
+    sa.ForeignKeyConstraint(['parent_conversation_id'], ['conversations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('exploration_links')
+    op.drop_table('knowledge_points')
+    op.drop_table('messages')
+    op.drop_table('conversations')
+    op.drop_table('topics')
+    op.drop_table('projects')
+    op.drop_table('model_configs')
+    op.drop_table('knowledge_spaces')
+    op.drop_table('app_settings')
+    op.drop_table('api_key_storage')
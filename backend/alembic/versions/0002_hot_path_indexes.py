@@ -0,0 +1,58 @@
+"""hot path indexes
+
+Secondary indexes for the queries issued on every chat turn and every
+conversation list; see app/db/query_plans.py for the queries they serve.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 08:29:08.426415
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_index('ix_conversations_project_id', ['project_id'], unique=False)
+        batch_op.create_index('ix_conversations_updated_at_id', ['updated_at', 'id'], unique=False)
+
+    with op.batch_alter_table('exploration_links', schema=None) as batch_op:
+        batch_op.create_index('ix_exploration_links_child_conversation_id', ['child_conversation_id'], unique=False)
+        batch_op.create_index('ix_exploration_links_knowledge_point_id', ['knowledge_point_id'], unique=False)
+        batch_op.create_index('ix_exploration_links_parent_conversation_id', ['parent_conversation_id'], unique=False)
+
+    with op.batch_alter_table('knowledge_points', schema=None) as batch_op:
+        batch_op.create_index('ix_knowledge_points_conversation_id', ['conversation_id'], unique=False)
+        batch_op.create_index('ix_knowledge_points_message_id', ['message_id'], unique=False)
+        batch_op.create_index('ix_knowledge_points_topic_id', ['topic_id'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_conversation_id_created_at', ['conversation_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_conversation_id_created_at')
+
+    with op.batch_alter_table('knowledge_points', schema=None) as batch_op:
+        batch_op.drop_index('ix_knowledge_points_topic_id')
+        batch_op.drop_index('ix_knowledge_points_message_id')
+        batch_op.drop_index('ix_knowledge_points_conversation_id')
+
+    with op.batch_alter_table('exploration_links', schema=None) as batch_op:
+        batch_op.drop_index('ix_exploration_links_parent_conversation_id')
+        batch_op.drop_index('ix_exploration_links_knowledge_point_id')
+        batch_op.drop_index('ix_exploration_links_child_conversation_id')
+
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversations_updated_at_id')
+        batch_op.drop_index('ix_conversations_project_id')
@@ -0,0 +1,62 @@
+"""conversation counters
+
+Adds denormalized message/knowledge point counters and the last-message
+preview to conversations and backfills them from existing rows. updated_at
+becomes "last activity", so it is moved forward to the latest message.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 08:30:49.977454
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('knowledge_point_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_preview', sa.String(length=120), nullable=True))
+
+    bind = op.get_bind()
+    bind.execute(sa.text("""
+        UPDATE conversations SET
+            message_count = (SELECT count(*) FROM messages m WHERE m.conversation_id = conversations.id),
+            knowledge_point_count = (SELECT count(*) FROM knowledge_points k WHERE k.conversation_id = conversations.id),
+            last_message_at = (SELECT max(m.created_at) FROM messages m WHERE m.conversation_id = conversations.id)
+    """))
+    bind.execute(sa.text("""
+        UPDATE conversations SET updated_at = last_message_at
+        WHERE last_message_at IS NOT NULL AND (updated_at IS NULL OR updated_at < last_message_at)
+    """))
+
+    latest = bind.execute(sa.text("""
+        SELECT c.id, m.content FROM conversations c
+        JOIN messages m ON m.conversation_id = c.id AND m.created_at = c.last_message_at
+    """)).all()
+    for conversation_id, content in latest:
+        preview = " ".join((content or "").split())
+        if len(preview) > 120:
+            preview = preview[:119] + "…"
+        bind.execute(
+            sa.text("UPDATE conversations SET last_message_preview = :preview WHERE id = :id"),
+            {"preview": preview, "id": conversation_id}
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_column('last_message_preview')
+        batch_op.drop_column('last_message_at')
+        batch_op.drop_column('knowledge_point_count')
+        batch_op.drop_column('message_count')
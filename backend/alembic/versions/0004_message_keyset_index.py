@@ -0,0 +1,32 @@
+"""message keyset index
+
+Extends the message history index with id so keyset pagination on
+(created_at, id) within a conversation is served without a sort.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 08:34:12.104311
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_conversation_id_created_at')
+        batch_op.create_index('ix_messages_conversation_id_created_at_id', ['conversation_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_conversation_id_created_at_id')
+        batch_op.create_index('ix_messages_conversation_id_created_at', ['conversation_id', 'created_at'], unique=False)
@@ -0,0 +1,86 @@
+"""full text search
+
+Creates the FTS5 index (search_fts) and its rowid map (search_documents),
+and indexes existing conversations, messages and knowledge points. The
+tokenizer comes from KS_SEARCH_TOKENIZER; switch it later with
+`python -m app.db.maintenance rebuild-search`.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 08:41:37.512018
+"""
+from typing import Sequence, Union
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import config
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _decode(value):
+    """Bodies may already be stored compressed (header byte + payload)"""
+    if value is None or isinstance(value, str):
+        return value or ""
+    value = bytes(value)
+    if value[:1] == b"\x01":
+        return zlib.decompress(value[1:]).decode("utf-8")
+    if value[:1] == b"\x02":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(value[1:]).decode("utf-8")
+    return value[1:].decode("utf-8")
+
+
+def upgrade() -> None:
+    op.create_table('search_documents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('ref_id', sa.String(length=36), nullable=False),
+    sa.Column('conversation_id', sa.String(length=36), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('search_documents', schema=None) as batch_op:
+        batch_op.create_index('ix_search_documents_conversation_id_created_at', ['conversation_id', 'created_at'], unique=False)
+        batch_op.create_index('ux_search_documents_kind_ref_id', ['kind', 'ref_id'], unique=True)
+
+    op.execute(f"CREATE VIRTUAL TABLE search_fts USING fts5(title, body, tokenize='{config.search_tokenizer}')")
+
+    bind = op.get_bind()
+    sources = (
+        ("conversation", "SELECT id, id, created_at, title, NULL FROM conversations"),
+        ("message", "SELECT id, conversation_id, created_at, NULL, content FROM messages"),
+        ("knowledge_point",
+         "SELECT id, conversation_id, created_at, NULL, selected_text, notes FROM knowledge_points"),
+    )
+    for kind, query in sources:
+        for row in bind.execute(sa.text(query)).all():
+            if kind == "knowledge_point":
+                body = "\n".join(part for part in (row[4], _decode(row[5])) if part)
+            else:
+                body = _decode(row[4])
+            rowid = bind.execute(
+                sa.text("INSERT INTO search_documents (kind, ref_id, conversation_id, created_at) "
+                        "VALUES (:kind, :ref_id, :conversation_id, :created_at)"),
+                {"kind": kind, "ref_id": row[0], "conversation_id": row[1], "created_at": row[2]}
+            ).lastrowid
+            bind.execute(
+                sa.text("INSERT INTO search_fts (rowid, title, body) VALUES (:rowid, :title, :body)"),
+                {"rowid": rowid, "title": row[3] or "", "body": body}
+            )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS search_fts")
+    with op.batch_alter_table('search_documents', schema=None) as batch_op:
+        batch_op.drop_index('ux_search_documents_kind_ref_id')
+        batch_op.drop_index('ix_search_documents_conversation_id_created_at')
+
+    op.drop_table('search_documents')
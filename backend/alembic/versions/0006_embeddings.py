@@ -0,0 +1,45 @@
+"""embeddings
+
+Table of float32 embedding vectors for semantic search. Existing rows are
+embedded by the vector indexer's catch-up pass on the next start, since the
+embedding model is configurable.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 08:41:09.706511
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('embeddings',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('ref_id', sa.String(length=36), nullable=False),
+    sa.Column('conversation_id', sa.String(length=36), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('embeddings', schema=None) as batch_op:
+        batch_op.create_index('ix_embeddings_conversation_id', ['conversation_id'], unique=False)
+        batch_op.create_index('ux_embeddings_kind_ref_id', ['kind', 'ref_id'], unique=True)
+
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('embeddings', schema=None) as batch_op:
+        batch_op.drop_index('ux_embeddings_kind_ref_id')
+        batch_op.drop_index('ix_embeddings_conversation_id')
+
+    op.drop_table('embeddings')
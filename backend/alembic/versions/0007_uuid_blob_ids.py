@@ -0,0 +1,102 @@
+"""uuid blob ids
+
+Stores every id and id reference as the 16 raw bytes of the UUID instead of
+its 36-character text form. Values are converted in Python batch by batch
+(SQLite 3.40 has no unhex()); ids that do not parse as UUIDs are left as
+text. New ids are UUIDv7 unless KS_ID_VERSION=4.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 09:02:51.317220
+"""
+from typing import Sequence, Union
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> (column, nullable)
+ID_COLUMNS = {
+    'projects': [('id', False)],
+    'conversations': [('id', False), ('project_id', True)],
+    'messages': [('id', False), ('conversation_id', False)],
+    'topics': [('id', False)],
+    'knowledge_points': [('id', False), ('conversation_id', False), ('message_id', False), ('topic_id', True)],
+    'exploration_links': [
+        ('id', False), ('parent_conversation_id', False),
+        ('child_conversation_id', False), ('knowledge_point_id', False),
+    ],
+    'model_configs': [('id', False)],
+    'app_settings': [('id', False)],
+    'api_key_storage': [('id', False)],
+    'knowledge_spaces': [('id', False)],
+    'search_documents': [('ref_id', False), ('conversation_id', False)],
+    'embeddings': [('ref_id', False), ('conversation_id', False)],
+}
+
+BATCH_SIZE = 5000
+
+
+def _to_blob(value):
+    if isinstance(value, str):
+        try:
+            return uuid.UUID(value).bytes
+        except ValueError:
+            return value
+    return value
+
+
+def _to_text(value):
+    if isinstance(value, bytes) and len(value) == 16:
+        return str(uuid.UUID(bytes=value))
+    return value
+
+
+def _convert_values(table: str, columns: list, convert) -> None:
+    bind = op.get_bind()
+    names = [name for name, _ in columns]
+    select = sa.text(
+        f"SELECT rowid, {', '.join(names)} FROM {table} WHERE rowid > :last ORDER BY rowid LIMIT {BATCH_SIZE}"
+    )
+    update = sa.text(
+        f"UPDATE {table} SET {', '.join(f'{name} = :{name}' for name in names)} WHERE rowid = :_rowid"
+    )
+    last = 0
+    while True:
+        rows = bind.execute(select, {"last": last}).all()
+        if not rows:
+            break
+        bind.execute(update, [
+            {"_rowid": row[0], **{name: convert(value) for name, value in zip(names, row[1:])}}
+            for row in rows
+        ])
+        last = rows[-1][0]
+
+
+def upgrade() -> None:
+    for table, columns in ID_COLUMNS.items():
+        _convert_values(table, columns, _to_blob)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, nullable in columns:
+                batch_op.alter_column(name,
+                       existing_type=sa.VARCHAR(length=36),
+                       type_=sa.LargeBinary(length=16),
+                       existing_nullable=nullable)
+
+
+def downgrade() -> None:
+    for table, columns in ID_COLUMNS.items():
+        _convert_values(table, columns, _to_text)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, nullable in columns:
+                batch_op.alter_column(name,
+                       existing_type=sa.LargeBinary(length=16),
+                       type_=sa.VARCHAR(length=36),
+                       existing_nullable=nullable)
@@ -0,0 +1,47 @@
+"""settings revision
+
+Single-row counter bumped by triggers on every write to model_configs,
+app_settings and api_key_storage, so the in-process settings cache of any
+worker can tell whether the settings changed.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 08:50:31.048865
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SETTINGS_TABLES = ('model_configs', 'app_settings', 'api_key_storage')
+EVENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def upgrade() -> None:
+    op.create_table('settings_revision',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO settings_revision (id, revision) VALUES (1, 0)")
+    for table in SETTINGS_TABLES:
+        for event in EVENTS:
+            op.execute(
+                f"CREATE TRIGGER trg_{table}_{event.lower()}_revision AFTER {event} ON {table} "
+                f"BEGIN UPDATE settings_revision SET revision = revision + 1 WHERE id = 1; END"
+            )
+
+
+def downgrade() -> None:
+    for table in SETTINGS_TABLES:
+        for event in EVENTS:
+            op.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{event.lower()}_revision")
+    op.drop_table('settings_revision')
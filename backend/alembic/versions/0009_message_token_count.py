@@ -0,0 +1,31 @@
+"""message token count
+
+Adds messages.token_count. Existing rows stay NULL and are counted when the
+history is loaded; `python -m app.db.maintenance count-tokens` stores them.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 08:54:00.420696
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('token_count')
+
@@ -0,0 +1,47 @@
+"""response cache
+
+Adds the response_cache side table for completions that are safe to reuse
+(temperature 0 or explicitly opted in). Starts empty.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 08:59:00.417664
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('response_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('model_name', sa.String(length=100), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('usage', sa.JSON(), nullable=True),
+    sa.Column('size_bytes', sa.Integer(), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('response_cache', schema=None) as batch_op:
+        batch_op.create_index('ix_response_cache_expires_at', ['expires_at'], unique=False)
+        batch_op.create_index('ix_response_cache_last_used_at_size_bytes', ['last_used_at', 'size_bytes'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('response_cache', schema=None) as batch_op:
+        batch_op.drop_index('ix_response_cache_last_used_at_size_bytes')
+        batch_op.drop_index('ix_response_cache_expires_at')
+
+    op.drop_table('response_cache')
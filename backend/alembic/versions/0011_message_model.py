@@ -0,0 +1,32 @@
+"""message model
+
+Adds messages.model_provider / model_name: the model that actually produced an
+assistant reply. Existing rows stay NULL (the model was not recorded).
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 09:05:55.687149
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_provider', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('model_name', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('model_name')
+        batch_op.drop_column('model_provider')
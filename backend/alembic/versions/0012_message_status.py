@@ -0,0 +1,32 @@
+"""message status
+
+Adds messages.status (complete / streaming / failed) so streamed replies can be
+checkpointed while they are generated. Existing rows are complete.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 09:11:42.323132
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), server_default='complete', nullable=False))
+        batch_op.create_index('ix_messages_streaming', ['status'], unique=False, sqlite_where=sa.text("status = 'streaming'"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_streaming', sqlite_where=sa.text("status = 'streaming'"))
+        batch_op.drop_column('status')
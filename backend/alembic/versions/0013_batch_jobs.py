@@ -0,0 +1,70 @@
+"""batch jobs
+
+Adds batch_jobs and batch_items for POST /api/chat/batch: one row per job
+and one per prompt with its status and result. Starts empty.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 09:23:31.101309
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0013'
+down_revision: Union[str, None] = '0012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('batch_jobs',
+    sa.Column('id', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('model_provider', sa.String(length=50), nullable=False),
+    sa.Column('model_name', sa.String(length=100), nullable=False),
+    sa.Column('temperature', sa.Float(), nullable=False),
+    sa.Column('max_tokens', sa.Integer(), nullable=True),
+    sa.Column('cache', sa.Boolean(), nullable=True),
+    sa.Column('concurrency', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('batch_jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_batch_jobs_status', ['status'], unique=False)
+
+    op.create_table('batch_items',
+    sa.Column('id', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('job_id', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.LargeBinary(length=16), nullable=True),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('message_id', sa.LargeBinary(length=16), nullable=True),
+    sa.Column('model_provider', sa.String(length=50), nullable=True),
+    sa.Column('model_name', sa.String(length=100), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+    sa.ForeignKeyConstraint(['job_id'], ['batch_jobs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('batch_items', schema=None) as batch_op:
+        batch_op.create_index('ix_batch_items_job_id_position', ['job_id', 'position'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('batch_items', schema=None) as batch_op:
+        batch_op.drop_index('ix_batch_items_job_id_position')
+
+    op.drop_table('batch_items')
+    with op.batch_alter_table('batch_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_batch_jobs_status')
+
+    op.drop_table('batch_jobs')
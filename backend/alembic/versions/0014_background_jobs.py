@@ -0,0 +1,55 @@
+"""background jobs
+
+Adds background_jobs, the durable queue of deferred work run by the in-process
+workers (app/services/job_queue.py). Starts empty.
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18 09:28:36.564966
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0014'
+down_revision: Union[str, None] = '0013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('background_jobs',
+    sa.Column('id', sa.LargeBinary(length=16), nullable=False),
+    sa.Column('kind', sa.String(length=100), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('dedup_key', sa.String(length=255), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_background_jobs_dedup_key', ['dedup_key'], unique=True, sqlite_where=sa.text("status = 'queued'"))
+        batch_op.create_index('ix_background_jobs_finished_at', ['finished_at'], unique=False)
+        batch_op.create_index('ix_background_jobs_leased', ['locked_until'], unique=False, sqlite_where=sa.text("status = 'running'"))
+        batch_op.create_index('ix_background_jobs_ready', ['priority', 'run_at'], unique=False, sqlite_where=sa.text("status = 'queued'"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_background_jobs_ready', sqlite_where=sa.text("status = 'queued'"))
+        batch_op.drop_index('ix_background_jobs_leased', sqlite_where=sa.text("status = 'running'"))
+        batch_op.drop_index('ix_background_jobs_finished_at')
+        batch_op.drop_index('ix_background_jobs_dedup_key', sqlite_where=sa.text("status = 'queued'"))
+
+    op.drop_table('background_jobs')
@@ -1,20 +1,36 @@
 """
 Chat API endpoints with LiteLLM integration
 """
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
-from typing import Optional
-import json
-
-from app.db.database import get_db
+from typing import Dict, List, Optional
+from datetime import datetime
+import math
+
+from app.api.sse import sse_response
+from app.db.database import async_session_maker, get_read_db
+from app.db.write_queue import write_queue
+from app.models.batch import BatchItem, BatchJob
 from app.models.conversation import Conversation, Message, ModelProvider
 from app.services.llm_service import LLMService
+from app.services.history_cache import history_cache
+from app.services.context_window import context_window
+from app.services.llm_scheduler import llm_scheduler, LLMRateLimited
+from app.services.model_router import model_router
+from app.services.fanout import fanout_registry
+from app.services.durable_stream import durable_streams
+from app.services.batch_runner import batch_runner
+from app.services.settings_cache import settings_cache
+from app.config import config
 
 router = APIRouter()
 
+def _rate_limited(e: LLMRateLimited) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
 # Pydantic schemas
 class ChatRequest(BaseModel):
     model_config = {"protected_namespaces": ()}
@@ -27,25 +43,90 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     max_tokens: Optional[int] = None
     stream: bool = False
+    cache: Optional[bool] = None  # 回复缓存:None 仅在 temperature=0 时使用,True/False 强制开关
 
 class ChatResponse(BaseModel):
+    model_config = {"protected_namespaces": ()}
+
     message_id: str
     content: str
     role: str = "assistant"
+    model_provider: Optional[str] = None  # 实际回答的模型
+    model_name: Optional[str] = None
+
+class FanoutTarget(BaseModel):
+    model_config = {"protected_namespaces": ()}
+
+    model_provider: ModelProvider
+    model_name: str
+    api_key: Optional[str] = None
+
+class FanoutRequest(BaseModel):
+    conversation_id: str
+    content: str
+    targets: List[FanoutTarget]
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    cache: Optional[bool] = None
+
+class BatchItemRequest(BaseModel):
+    content: str
+    conversation_id: Optional[str] = None  # 有对话时带上对话历史,问答保存到对话中
+
+class BatchRequest(BaseModel):
+    model_config = {"protected_namespaces": ()}
+
+    items: List[BatchItemRequest]
+    model_provider: ModelProvider
+    model_name: str
+    api_key: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    cache: Optional[bool] = None
+    concurrency: Optional[int] = None  # 默认 batch_max_concurrency
+
+class BatchItemResponse(BaseModel):
+    model_config = {"protected_namespaces": (), "from_attributes": True}
+
+    id: str
+    position: int
+    conversation_id: Optional[str] = None
+    content: str
+    status: str
+    result: Optional[str] = None
+    error: Optional[str] = None
+    message_id: Optional[str] = None
+    model_provider: Optional[str] = None
+    model_name: Optional[str] = None
+
+class BatchJobResponse(BaseModel):
+    model_config = {"protected_namespaces": ()}
+
+    id: str
+    status: str
+    model_provider: str
+    model_name: str
+    concurrency: int
+    created_at: str
+    finished_at: Optional[str] = None
+    total: int
+    counts: Dict[str, int]  # 各状态的条目数
+    items: List[BatchItemResponse]
 
 class MessageCreate(BaseModel):
     content: str
     role: str
 
 class MessageResponse(BaseModel):
+    model_config = {"protected_namespaces": (), "from_attributes": True}
+
     id: str
     conversation_id: str
     role: str
     content: str
     created_at: str
-
-    class Config:
-        from_attributes = True
+    model_provider: Optional[str] = None
+    model_name: Optional[str] = None
 
 class SendMessageResponse(BaseModel):
     user_message: MessageResponse
@@ -54,13 +135,13 @@ class SendMessageResponse(BaseModel):
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    db: AsyncSession = Depends(get_db)
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """
     发送消息并获取 AI 回复(非流式)
     """
     # 验证对话是否存在
-    result = await db.execute(
+    result = await read_db.execute(
         select(Conversation).where(Conversation.id == request.conversation_id)
     )
     conversation = result.scalar_one_or_none()
@@ -74,206 +155,465 @@ async def chat(
             detail=f"Model {request.model_name} not supported for provider {request.model_provider.value}"
         )
 
-    # 保存用户消息
+    # 用户消息先留在内存里,和 AI 回复一起提交,避免在 LLM 调用期间占用写连接
     user_message = Message(
         conversation_id=request.conversation_id,
         role="user",
-        content=request.content
+        content=request.content,
+        created_at=datetime.utcnow()
     )
-    db.add(user_message)
-    await db.flush()
-
-    # 获取对话历史
-    messages_result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == request.conversation_id)
-        .order_by(Message.created_at.asc())
-    )
-    history = messages_result.scalars().all()
 
-    # 构建消息列表
-    messages = [
-        {"role": msg.role, "content": msg.content}
-        for msg in history
-    ]
+    # 获取对话历史并构建消息列表
+    history = await history_cache.get(read_db, request.conversation_id)
+    messages = await context_window.build_prompt(
+        history,
+        [{"role": "user", "content": request.content}],
+        request.model_provider.value,
+        request.model_name,
+        max_tokens=request.max_tokens
+    )
+    await read_db.close()
+    chain = await model_router.chain(request.model_provider.value, request.model_name, request.api_key)
 
     try:
-        # 调用 LLM
-        response = await LLMService.chat_completion(
-            provider=request.model_provider.value,
-            model_name=request.model_name,
-            messages=messages,
-            api_key=request.api_key,
+        # 调用 LLM(主模型出错或过慢时使用回退链上的模型)
+        response, target = await model_router.completion(
+            chain,
+            messages,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
-            stream=False
+            cache=request.cache
         )
 
         # 提取回复内容
         assistant_content = response.choices[0].message.content
 
-        # 保存 AI 回复
+        # 保存用户消息和 AI 回复
         assistant_message = Message(
             conversation_id=request.conversation_id,
             role="assistant",
-            content=assistant_content
+            content=assistant_content,
+            model_provider=target.provider,
+            model_name=target.model_name
         )
-        db.add(assistant_message)
-        await db.flush()
-        await db.refresh(assistant_message)
+        await write_queue.submit(user_message, assistant_message)
 
         return ChatResponse(
             message_id=assistant_message.id,
             content=assistant_content,
-            role="assistant"
+            role="assistant",
+            model_provider=target.provider,
+            model_name=target.model_name
         )
 
+    except LLMRateLimited as e:
+        raise _rate_limited(e)
     except Exception as e:
-        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/stream")
 async def chat_stream(
     request: ChatRequest,
-    db: AsyncSession = Depends(get_db)
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """
     发送消息并获取 AI 流式回复
     """
+    message_id = await start_stream(
+        read_db,
+        request.conversation_id,
+        request.model_provider.value,
+        request.model_name,
+        content=request.content,
+        api_key=request.api_key,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        cache=request.cache
+    )
+    return sse_response(_sse_events(message_id, 0))
+
+async def start_stream(
+    read_db: AsyncSession,
+    conversation_id: str,
+    provider: str,
+    model_name: str,
+    content: Optional[str] = None,
+    regenerate: Optional[str] = None,
+    api_key: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    cache: Optional[bool] = None
+) -> str:
+    """
+    开始一轮流式回复,返回 AI 回复的消息 id(SSE 和 WebSocket 接口共用)
+
+    content 为新的用户消息;regenerate 为要重新生成的 AI 回复(对话的最后一条消息),
+    旧回复标记为 superseded,不再出现在历史中。
+    """
     # 验证对话是否存在
-    result = await db.execute(
-        select(Conversation).where(Conversation.id == request.conversation_id)
+    result = await read_db.execute(
+        select(Conversation).where(Conversation.id == conversation_id)
     )
     conversation = result.scalar_one_or_none()
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     # 验证模型是否支持
-    if not LLMService.validate_model(request.model_provider.value, request.model_name):
+    if not LLMService.validate_model(provider, model_name):
         raise HTTPException(
             status_code=400,
-            detail=f"Model {request.model_name} not supported for provider {request.model_provider.value}"
+            detail=f"Model {model_name} not supported for provider {provider}"
+        )
+
+    if regenerate is not None:
+        latest = (await read_db.execute(
+            select(Message.id, Message.role)
+            .where(Message.conversation_id == conversation_id, Message.status != "superseded")
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+        )).first()
+        if latest is None or str(latest.id) != regenerate or latest.role != "assistant":
+            raise HTTPException(status_code=400, detail="Only the latest assistant reply can be regenerated")
+        if durable_streams.active(regenerate):
+            raise HTTPException(status_code=409, detail="The reply is still being generated")
+
+    # 模型队列已满时在保存消息、开始推流之前直接拒绝
+    try:
+        llm_scheduler.check_admission(provider, model_name)
+    except LLMRateLimited as e:
+        raise _rate_limited(e)
+
+    if regenerate is not None:
+        await _supersede(regenerate)
+
+    # 获取对话历史并构建消息列表
+    history = await history_cache.get(read_db, conversation_id)
+    messages = await context_window.build_prompt(
+        history,
+        [{"role": "user", "content": content}] if content is not None else [],
+        provider,
+        model_name,
+        max_tokens=max_tokens
+    )
+    await read_db.close()
+    chain = await model_router.chain(provider, model_name, api_key)
+
+    # 保存用户消息,同时以 streaming 状态创建 AI 回复,生成过程中定期写回
+    new_messages = []
+    if content is not None:
+        new_messages.append(Message(
+            conversation_id=conversation_id,
+            role="user",
+            content=content,
+            created_at=datetime.utcnow()
+        ))
+    assistant_message = Message(
+        conversation_id=conversation_id,
+        role="assistant",
+        content="",
+        status="streaming",
+        model_provider=chain[0].provider,
+        model_name=chain[0].model_name,
+        created_at=datetime.utcnow()
+    )
+    await write_queue.submit(*new_messages, assistant_message)
+
+    async def produce():
+        # 调用 LLM (流式,主模型首 token 过慢时对冲到回退链上的模型)
+        stream, target = await model_router.stream(
+            chain,
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cache=cache
         )
+        return stream, {"model_provider": target.provider, "model_name": target.model_name}
+
+    # 生成在后台进行,客户端断线后可以在宽限时间内用 GET /stream/{message_id} 接着读,超时后取消生成
+    durable_streams.start(assistant_message.id, produce, budget=max_tokens)
+    return assistant_message.id
+
+async def _supersede(message_id: str) -> None:
+    async with async_session_maker() as session:
+        message = await session.get(Message, message_id)
+        if message is not None:
+            message.status = "superseded"
+            await session.commit()
+
+@router.get("/stream/{message_id}")
+async def resume_chat_stream(
+    message_id: str,
+    last_event_id: Optional[str] = Header(None),
+    offset: int = Query(0, ge=0)
+):
+    """
+    断线后继续读取流式回复
+
+    Last-Event-ID(或 offset 参数)是客户端已经收到的字符数,从这里接着返回;
+    回复已经结束时返回剩余内容和结束事件。
+    """
+    if last_event_id:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return sse_response(_sse_events(message_id, offset))
+
+@router.post("/stream/{message_id}/cancel")
+async def cancel_chat_stream(message_id: str):
+    """
+    停止生成流式回复,已生成的部分保存为 interrupted
+    """
+    return {"cancelled": durable_streams.cancel(message_id)}
+
+async def _sse_events(message_id: str, offset: int):
+    if offset == 0:
+        yield 0, {"type": "start", "message_id": message_id}
+    async for position, event in durable_streams.events(message_id, offset):
+        yield position, event
+
+@router.post("/fanout")
+async def chat_fanout(
+    request: FanoutRequest,
+    read_db: AsyncSession = Depends(get_read_db)
+):
+    """
+    同一条消息同时发给多个模型,多路流式回复合并成一个 SSE 流
+
+    每个事件带 index(对应 targets 中的位置);第一个事件 start 返回 fanout_id,
+    可用于取消单个模型。每个模型完成后各自保存一条 assistant 消息,被取消的模型已生成的部分
+    以 interrupted 状态保存。
+    """
+    result = await read_db.execute(
+        select(Conversation).where(Conversation.id == request.conversation_id)
+    )
+    conversation = result.scalar_one_or_none()
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    if not request.targets:
+        raise HTTPException(status_code=400, detail="At least one target model is required")
+    if len(request.targets) > config.fanout_max_models:
+        raise HTTPException(status_code=400, detail=f"At most {config.fanout_max_models} models per request")
+    for target in request.targets:
+        if not LLMService.validate_model(target.model_provider.value, target.model_name):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Model {target.model_name} not supported for provider {target.model_provider.value}"
+            )
+
+    # 各模型的上下文窗口不同,分别截取历史
+    history = await history_cache.get(read_db, request.conversation_id)
+    prompts = [
+        await context_window.build_prompt(
+            history,
+            [{"role": "user", "content": request.content}],
+            target.model_provider.value,
+            target.model_name,
+            max_tokens=request.max_tokens
+        )
+        for target in request.targets
+    ]
+    await read_db.close()
+
+    try:
+        for target in request.targets:
+            llm_scheduler.check_admission(target.model_provider.value, target.model_name)
+    except LLMRateLimited as e:
+        raise _rate_limited(e)
 
-    # 保存用户消息
     user_message = Message(
         conversation_id=request.conversation_id,
         role="user",
-        content=request.content
-    )
-    db.add(user_message)
-    await db.flush()
-
-    # 获取对话历史
-    messages_result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == request.conversation_id)
-        .order_by(Message.created_at.asc())
+        content=request.content,
+        created_at=datetime.utcnow()
     )
-    history = messages_result.scalars().all()
+    await write_queue.submit(user_message)
+
+    async def produce(stream):
+        target = request.targets[stream.index]
+        api_key = target.api_key or await settings_cache.api_key_for(stream.provider, stream.model_name)
+        return await LLMService.chat_completion(
+            provider=stream.provider,
+            model_name=stream.model_name,
+            messages=prompts[stream.index],
+            api_key=api_key,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+            stream=True,
+            cache=request.cache
+        )
 
-    # 构建消息列表
-    messages = [
-        {"role": msg.role, "content": msg.content}
-        for msg in history
-    ]
+    async def finish(stream, content: str, status: str) -> dict:
+        assistant_message = Message(
+            conversation_id=request.conversation_id,
+            role="assistant",
+            content=content,
+            status=status,
+            model_provider=stream.provider,
+            model_name=stream.model_name
+        )
+        await write_queue.submit(assistant_message)
+        return {"message_id": assistant_message.id}
 
     async def generate():
-        full_content = ""
-        message_id = None
+        async for event in fanout_registry.run(
+            [(t.model_provider.value, t.model_name) for t in request.targets], produce, finish,
+            budget=request.max_tokens
+        ):
+            yield None, event
 
-        try:
-            # 调用 LLM (流式)
-            stream = await LLMService.chat_completion(
-                provider=request.model_provider.value,
-                model_name=request.model_name,
-                messages=messages,
-                api_key=request.api_key,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                stream=True
-            )
+    return sse_response(generate())
 
-            # 流式返回内容
-            async for chunk in stream:
-                if chunk.get("type") == "content":
-                    content = chunk.get("content", "")
-                    full_content += content
-                    yield f"data: {json.dumps({'content': content})}\n\n"
-
-            # 保存完整的 AI 回复
-            assistant_message = Message(
-                conversation_id=request.conversation_id,
-                role="assistant",
-                content=full_content
-            )
-            db.add(assistant_message)
-            await db.flush()
-            await db.refresh(assistant_message)
-            message_id = assistant_message.id
-
-            # 发送完成信号
-            yield f"data: {json.dumps({'type': 'done', 'message_id': message_id})}\n\n"
+@router.post("/fanout/{fanout_id}/streams/{index}/cancel")
+async def cancel_fanout_stream(fanout_id: str, index: int):
+    """
+    取消多模型对比中的单个模型,其余模型继续
+    """
+    run = fanout_registry.get(fanout_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Fan-out not found or already finished")
+    if not 0 <= index < len(run.streams):
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return {"cancelled": run.cancel(index)}
+
+def _batch_job_response(job: BatchJob) -> BatchJobResponse:
+    counts: Dict[str, int] = {}
+    for item in job.items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    return BatchJobResponse(
+        id=job.id,
+        status=job.status,
+        model_provider=job.model_provider,
+        model_name=job.model_name,
+        concurrency=job.concurrency,
+        created_at=job.created_at.isoformat(),
+        finished_at=job.finished_at.isoformat() if job.finished_at else None,
+        total=len(job.items),
+        counts=counts,
+        items=[BatchItemResponse.model_validate(item) for item in job.items]
+    )
 
-        except Exception as e:
-            await db.rollback()
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+@router.post("/batch", response_model=BatchJobResponse, status_code=202)
+async def create_batch(
+    request: BatchRequest,
+    read_db: AsyncSession = Depends(get_read_db)
+):
+    """
+    批量发送提示词,在后台以有限并发执行(客户端断开不影响),用 GET /batch/{job_id} 轮询
+    或 GET /batch/{job_id}/events 订阅结果
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    if len(request.items) > config.batch_max_items:
+        raise HTTPException(status_code=400, detail=f"At most {config.batch_max_items} items per batch")
+    concurrency = request.concurrency or config.batch_max_concurrency
+    if not 1 <= concurrency <= config.batch_max_concurrency:
+        raise HTTPException(
+            status_code=400, detail=f"concurrency must be between 1 and {config.batch_max_concurrency}"
+        )
+    if not LLMService.validate_model(request.model_provider.value, request.model_name):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Model {request.model_name} not supported for provider {request.model_provider.value}"
+        )
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream"
+    conversation_ids = {item.conversation_id for item in request.items if item.conversation_id}
+    if conversation_ids:
+        result = await read_db.execute(select(Conversation.id).where(Conversation.id.in_(conversation_ids)))
+        missing = conversation_ids - set(result.scalars().all())
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Conversation not found: {sorted(missing)[0]}")
+    await read_db.close()
+
+    job = BatchJob(
+        model_provider=request.model_provider.value,
+        model_name=request.model_name,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        cache=request.cache,
+        concurrency=concurrency,
+        created_at=datetime.utcnow(),
+        items=[
+            BatchItem(position=i, conversation_id=item.conversation_id, content=item.content, status="pending")
+            for i, item in enumerate(request.items)
+        ]
     )
+    await batch_runner.submit(job, request.api_key)
+    return _batch_job_response(job)
+
+@router.get("/batch/{job_id}", response_model=BatchJobResponse)
+async def get_batch(job_id: str, read_db: AsyncSession = Depends(get_read_db)):
+    """
+    批量任务的状态和每个条目的结果
+    """
+    job = (await read_db.execute(
+        select(BatchJob).options(selectinload(BatchJob.items)).where(BatchJob.id == job_id)
+    )).scalar_one_or_none()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return _batch_job_response(job)
+
+@router.get("/batch/{job_id}/events")
+async def batch_events(job_id: str):
+    """
+    以 SSE 订阅批量任务:每个完成的条目一个 item 事件(包括订阅前已完成的),最后是 done
+    """
+    async def generate():
+        async for event in batch_runner.events(job_id):
+            yield None, event
+
+    return sse_response(generate())
+
+@router.post("/batch/{job_id}/cancel")
+async def cancel_batch(job_id: str):
+    """
+    取消批量任务,未完成的条目标记为 cancelled
+    """
+    return {"cancelled": batch_runner.cancel(job_id)}
 
 @router.post("/{conversation_id}", response_model=SendMessageResponse)
 async def send_message(
     conversation_id: str,
     message: MessageCreate,
-    db: AsyncSession = Depends(get_db)
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """
     发送消息到对话并获取 AI 回复
     """
     # 验证对话是否存在
-    result = await db.execute(
+    result = await read_db.execute(
         select(Conversation).where(Conversation.id == conversation_id)
     )
     conversation = result.scalar_one_or_none()
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # 保存用户消息
+    provider = conversation.model_provider.value
+    model_name = conversation.model_name
+
+    # 用户消息先留在内存里,和 AI 回复一起提交
     user_message = Message(
         conversation_id=conversation_id,
         role=message.role,
-        content=message.content
+        content=message.content,
+        created_at=datetime.utcnow()
     )
-    db.add(user_message)
-    await db.flush()
-    await db.refresh(user_message)
-
-    # 获取对话历史
-    messages_result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
-    )
-    history = messages_result.scalars().all()
 
-    # 构建消息列表
-    messages = [
-        {"role": msg.role, "content": msg.content}
-        for msg in history
-    ]
+    # 获取对话历史并构建消息列表
+    history = await history_cache.get(read_db, conversation_id)
+    messages = await context_window.build_prompt(
+        history,
+        [{"role": message.role, "content": message.content}],
+        provider,
+        model_name
+    )
+    await read_db.close()
+    chain = await model_router.chain(provider, model_name)
 
     try:
         # 调用 LLM
-        response = await LLMService.chat_completion(
-            provider=conversation.model_provider.value,
-            model_name=conversation.model_name,
-            messages=messages,
-            temperature=0.7,
-            stream=False
-        )
+        response, target = await model_router.completion(chain, messages, temperature=0.7)
 
         # 提取回复内容
         assistant_content = response.choices[0].message.content
@@ -282,11 +622,11 @@ async def send_message(
         assistant_message = Message(
             conversation_id=conversation_id,
             role="assistant",
-            content=assistant_content
+            content=assistant_content,
+            model_provider=target.provider,
+            model_name=target.model_name
         )
-        db.add(assistant_message)
-        await db.commit()
-        await db.refresh(assistant_message)
+        await write_queue.submit(user_message, assistant_message)
 
         return SendMessageResponse(
             user_message=MessageResponse(
@@ -301,10 +641,13 @@ async def send_message(
                 conversation_id=assistant_message.conversation_id,
                 role=assistant_message.role,
                 content=assistant_content,
-                created_at=assistant_message.created_at.isoformat()
+                created_at=assistant_message.created_at.isoformat(),
+                model_provider=target.provider,
+                model_name=target.model_name
             )
         )
 
+    except LLMRateLimited as e:
+        raise _rate_limited(e)
     except Exception as e:
-        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,209 @@
+"""
+WebSocket chat channel
+
+一个连接上可以同时进行多个对话的多轮流式回复,连接只在会话开始时建立一次。
+客户端发送的每一帧都是 JSON,带一个客户端生成的 id,服务端的事件带回同一个 id:
+
+- {"type": "chat", "id", "conversation_id", "content", "model_provider", "model_name", ...}
+  发送消息并流式返回回复(其余字段同 POST /api/chat/stream);
+- {"type": "regenerate", "id", "conversation_id", "message_id", "model_provider", "model_name", ...}
+  重新生成对话最后一条 AI 回复;
+- {"type": "resume", "id", "message_id", "offset"} 从字符偏移量继续读取一条回复;
+- {"type": "cancel", "id"} 停止 id 对应的回复,已生成的部分保存为 interrupted;回复还在创建时
+  收到的 cancel 等创建完成后生效,客户端照常收到带 message_id 的 start 和 interrupted。
+
+服务端事件:start(带 message_id)、content(带 offset)、done / interrupted / error。
+生成走和 SSE 接口相同的路径(start_stream / durable_streams)。发送队列有上限,客户端读得慢时
+转发任务在队列上等待,期间生成的内容在下次读取时合并成一帧发送,不会无限积压。接收循环和
+取消路径上的错误 / interrupted 帧不等待队列,队列已满时丢弃,避免读取 cancel 帧或关闭连接时卡住。
+连接断开后仍在生成的回复按 stream_disconnect_grace_seconds 处理。
+"""
+import asyncio
+import json
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+
+from app.api.chat import start_stream
+from app.api.sse import dumps
+from app.config import config
+from app.db.database import read_session_maker
+from app.models.conversation import ModelProvider
+from app.services.durable_stream import durable_streams
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+class TurnFrame(BaseModel):
+    model_config = {"protected_namespaces": ()}
+
+    id: str
+    conversation_id: str
+    model_provider: ModelProvider
+    model_name: str
+    content: Optional[str] = None
+    message_id: Optional[str] = None  # regenerate:要重新生成的回复
+    api_key: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    cache: Optional[bool] = None
+
+class ResumeFrame(BaseModel):
+    id: str
+    message_id: str
+    offset: int = 0
+
+@dataclass
+class _Turn:
+    task: asyncio.Task
+    message_id: Optional[str] = None
+    cancelled: bool = False  # 回复创建完成前收到了 cancel
+
+class _Session:
+    """One WebSocket connection and the turns multiplexed over it"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=config.ws_send_queue_size)
+        self.turns: dict[str, _Turn] = {}
+
+    async def send_loop(self) -> None:
+        while True:
+            await self.websocket.send_text(await self.outbox.get())
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        # 队列满时在这里等待,反压传到各个转发任务
+        await self.outbox.put(dumps(event).decode("utf-8"))
+
+    def send_nowait(self, event: Dict[str, Any]) -> None:
+        try:
+            self.outbox.put_nowait(dumps(event).decode("utf-8"))
+        except asyncio.QueueFull:
+            logger.warning("WebSocket send queue full, dropped %s frame for %s", event["type"], event.get("id"))
+
+    def handle(self, text: str) -> None:
+        try:
+            frame = json.loads(text)
+            kind = frame.get("type")
+            turn_id = frame.get("id")
+        except (ValueError, AttributeError):
+            self.send_nowait({"type": "error", "error": "Frames must be JSON objects"})
+            return
+        if not isinstance(turn_id, str):
+            self.send_nowait({"type": "error", "error": "Missing frame id"})
+            return
+
+        if kind == "cancel":
+            turn = self.turns.get(turn_id)
+            if turn is None:
+                self.send_nowait({"type": "error", "id": turn_id, "error": "Unknown id"})
+            elif turn.message_id is None:
+                turn.cancelled = True
+            elif not durable_streams.cancel(turn.message_id):
+                turn.task.cancel()
+            return
+        if kind not in ("chat", "regenerate", "resume"):
+            self.send_nowait({"type": "error", "id": turn_id, "error": f"Unknown frame type: {kind}"})
+            return
+        if turn_id in self.turns:
+            self.send_nowait({"type": "error", "id": turn_id, "error": "Id is already in use"})
+            return
+        try:
+            parsed = ResumeFrame(**frame) if kind == "resume" else TurnFrame(**frame)
+        except ValidationError as e:
+            self.send_nowait({"type": "error", "id": turn_id, "error": str(e)})
+            return
+        if kind == "chat" and parsed.content is None:
+            self.send_nowait({"type": "error", "id": turn_id, "error": "chat frames need content"})
+            return
+        if kind == "regenerate" and parsed.message_id is None:
+            self.send_nowait({"type": "error", "id": turn_id, "error": "regenerate frames need message_id"})
+            return
+
+        self.turns[turn_id] = _Turn(task=asyncio.create_task(self._run(kind, parsed)))
+
+    async def _run(self, kind: str, frame) -> None:
+        turn = self.turns[frame.id]
+        offset = 0
+        try:
+            if kind == "resume":
+                turn.message_id, offset = frame.message_id, frame.offset
+            else:
+                # start_stream 不能从中间打断:消息可能已经写入(重新生成时旧回复也已标记 superseded)。
+                # 连接关闭时让它在后台完成,再通过 durable stream 停止生成,已写入的消息以 interrupted 收尾
+                starting = asyncio.ensure_future(self._start_stream(kind, frame))
+                try:
+                    turn.message_id = await asyncio.shield(starting)
+                except asyncio.CancelledError:
+                    starting.add_done_callback(_cancel_started)
+                    raise
+                await self.send({"type": "start", "id": frame.id, "message_id": turn.message_id})
+            if turn.cancelled:
+                durable_streams.cancel(turn.message_id)
+            async for position, event in durable_streams.events(turn.message_id, offset):
+                if "content" in event:
+                    await self.send({"type": "content", "id": frame.id, "content": event["content"], "offset": position})
+                else:
+                    await self.send({**event, "id": frame.id})
+        except HTTPException as e:
+            error = {"type": "error", "id": frame.id, "status": e.status_code, "error": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                error["retry_after"] = math.ceil(float(e.headers["Retry-After"]))
+            await self.send(error)
+        except asyncio.CancelledError:
+            if turn.message_id is None:
+                self.send_nowait({"type": "interrupted", "id": frame.id})
+            raise
+        except Exception as e:
+            logger.exception("WebSocket turn %s failed", frame.id)
+            await self.send({"type": "error", "id": frame.id, "error": str(e)})
+        finally:
+            self.turns.pop(frame.id, None)
+
+    async def _start_stream(self, kind: str, frame: TurnFrame) -> str:
+        async with read_session_maker() as read_db:
+            return await start_stream(
+                read_db,
+                frame.conversation_id,
+                frame.model_provider.value,
+                frame.model_name,
+                content=frame.content if kind == "chat" else None,
+                regenerate=frame.message_id if kind == "regenerate" else None,
+                api_key=frame.api_key,
+                temperature=frame.temperature,
+                max_tokens=frame.max_tokens,
+                cache=frame.cache
+            )
+
+    async def close(self) -> None:
+        tasks = [turn.task for turn in self.turns.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _cancel_started(starting: asyncio.Future) -> None:
+    if not starting.cancelled() and starting.exception() is None:
+        durable_streams.cancel(starting.result())
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket):
+    """
+    WebSocket 对话通道,帧格式见模块说明
+    """
+    await websocket.accept()
+    session = _Session(websocket)
+    sender = asyncio.create_task(session.send_loop())
+    try:
+        while True:
+            session.handle(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
@@ -1,15 +1,19 @@
 """
 Conversations API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
-from typing import List
+from sqlalchemy import select
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import json
 
-from app.db.database import get_db
+from app.config import config
+from app.db.database import get_db, get_read_db, read_session_maker
+from app.db.write_queue import write_queue
+from app.api.pagination import fetch_keyset_page, fetch_around
 from app.models.conversation import Conversation, Message, ModelProvider
 
 router = APIRouter()
@@ -28,13 +32,15 @@ class ConversationCreate(BaseModel):
     project_id: str | None = None
 
 class MessageResponse(BaseModel):
+    model_config = {"protected_namespaces": (), "from_attributes": True}
+
     id: str
     role: str
     content: str
     created_at: datetime
-
-    class Config:
-        from_attributes = True
+    model_provider: Optional[str] = None
+    model_name: Optional[str] = None
+    status: str = "complete"
 
 class ConversationResponse(BaseModel):
     model_config = {"protected_namespaces": (), "from_attributes": True}
@@ -46,7 +52,16 @@ class ConversationResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     message_count: int = 0
+    knowledge_point_count: int = 0
     has_knowledge: bool = False
+    last_message_at: datetime | None = None
+    last_message_preview: str | None = None
+
+def _conversation_response(conversation: Conversation) -> ConversationResponse:
+    """Build the response from the denormalized counters on the row"""
+    response = ConversationResponse.model_validate(conversation)
+    response.has_knowledge = response.knowledge_point_count > 0
+    return response
 
 @router.post("/", response_model=ConversationResponse)
 async def create_conversation(
@@ -59,74 +74,64 @@ async def create_conversation(
     await db.flush()
     await db.refresh(db_conversation)
 
-    return ConversationResponse(
-        **db_conversation.__dict__,
-        message_count=0,
-        has_knowledge=False
-    )
+    return _conversation_response(db_conversation)
 
 @router.get("/", response_model=List[ConversationResponse])
 async def list_conversations(
+    response: Response,
     skip: int = 0,
-    limit: int = 50,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """List all conversations"""
-    result = await db.execute(
-        select(Conversation)
-        .options(
-            selectinload(Conversation.messages),
-            selectinload(Conversation.knowledge_points)
+    """
+    List conversations, most recently active first.
+
+    Keyset pagination on (updated_at, id): pass the X-Next-Cursor or
+    X-Prev-Cursor response header back as `cursor`. `skip` is still
+    honoured (offset paging) for older clients.
+    """
+    if skip and cursor is None:
+        result = await db.execute(
+            select(Conversation)
+            .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+            .offset(skip)
+            .limit(limit)
         )
-        .order_by(Conversation.updated_at.desc())
-        .offset(skip)
-        .limit(limit)
+        return [_conversation_response(conv) for conv in result.scalars().all()]
+
+    page = await fetch_keyset_page(
+        db,
+        select(Conversation),
+        (Conversation.updated_at, Conversation.id),
+        descending=True,
+        limit=limit,
+        cursor=cursor
     )
-    conversations = result.scalars().all()
-
-    response_items: List[ConversationResponse] = []
-    for conv in conversations:
-        knowledge_count = len(conv.knowledge_points or [])
-        response_items.append(
-            ConversationResponse(
-                **conv.__dict__,
-                message_count=len(conv.messages) if conv.messages else 0,
-                has_knowledge=knowledge_count > 0
-            )
-        )
-    return response_items
+    page.apply_headers(response)
+    return [_conversation_response(conv) for conv in page.items]
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get a conversation by ID"""
     result = await db.execute(
-        select(Conversation)
-        .options(
-            selectinload(Conversation.messages),
-            selectinload(Conversation.knowledge_points)
-        )
-        .where(Conversation.id == conversation_id)
+        select(Conversation).where(Conversation.id == conversation_id)
     )
     conversation = result.scalar_one_or_none()
 
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    knowledge_count = len(conversation.knowledge_points or [])
-    return ConversationResponse(
-        **conversation.__dict__,
-        message_count=len(conversation.messages) if conversation.messages else 0,
-        has_knowledge=knowledge_count > 0
-    )
+    return _conversation_response(conversation)
 
 @router.post("/{conversation_id}/messages", response_model=MessageResponse)
 async def add_message(
     conversation_id: str,
     message: MessageCreate,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Add a message to a conversation"""
     # Verify conversation exists
@@ -138,31 +143,108 @@ async def add_message(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # Create message
+    # Create message (committed through the group-commit write queue)
     db_message = Message(
         conversation_id=conversation_id,
         **message.model_dump()
     )
-    db.add(db_message)
-    await db.flush()
-    await db.refresh(db_message)
+    await write_queue.submit(db_message)
 
     return MessageResponse(**db_message.__dict__)
 
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
 async def get_messages(
     conversation_id: str,
-    db: AsyncSession = Depends(get_db)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    around: Optional[str] = None,
+    window: int = Query(20, ge=0, le=200),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all messages in a conversation"""
+    """
+    Get messages in a conversation, oldest first.
+
+    - no parameters: the whole history
+    - `limit`: the latest `limit` messages; page with `cursor` taken from the
+      X-Prev-Cursor (older) / X-Next-Cursor (newer) response headers
+    - `around`: `window` messages before and after the given message id
+    """
+    stmt = select(Message).where(Message.conversation_id == conversation_id)
+    key_columns = (Message.created_at, Message.id)
+
+    if around is not None:
+        anchor = (await db.execute(
+            select(Message.created_at, Message.id)
+            .where(Message.id == around, Message.conversation_id == conversation_id)
+        )).first()
+        if anchor is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+        page = await fetch_around(db, stmt, key_columns, tuple(anchor), window=window)
+    elif limit is not None or cursor is not None:
+        page = await fetch_keyset_page(
+            db,
+            stmt,
+            key_columns,
+            descending=False,
+            limit=limit or 50,
+            cursor=cursor,
+            from_end=True
+        )
+    else:
+        result = await db.execute(stmt.order_by(*key_columns))
+        return [MessageResponse(**msg.__dict__) for msg in result.scalars().all()]
+
+    page.apply_headers(response)
+    return [MessageResponse(**msg.__dict__) for msg in page.items]
+
+async def _message_ndjson(conversation_id: str):
+    """Yield the conversation's messages as NDJSON, one partition per chunk"""
+    partition_size = config.message_stream_partition_size
+    # 依赖注入的会话在响应开始前就会关闭,流式读取使用自己的只读会话
+    async with read_session_maker() as session:
+        result = await session.stream(
+            select(Message.id, Message.role, Message.content, Message.created_at,
+                   Message.model_provider, Message.model_name, Message.status)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+            .execution_options(yield_per=partition_size)
+        )
+        async for partition in result.partitions(partition_size):
+            yield "".join(
+                json.dumps({
+                    "id": row.id,
+                    "role": row.role,
+                    "content": row.content,
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                    "model_provider": row.model_provider,
+                    "model_name": row.model_name,
+                    "status": row.status
+                }, ensure_ascii=False) + "\n"
+                for row in partition
+            )
+
+@router.get("/{conversation_id}/messages/stream")
+async def stream_messages(
+    conversation_id: str,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Stream all messages in a conversation as NDJSON (application/x-ndjson).
+
+    Rows are read through a server-side cursor in fixed-size partitions, so
+    memory stays flat regardless of history length.
+    """
     result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
+        select(Conversation.id).where(Conversation.id == conversation_id)
     )
-    messages = result.scalars().all()
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-    return [MessageResponse(**msg.__dict__) for msg in messages]
+    return StreamingResponse(
+        _message_ndjson(conversation_id),
+        media_type="application/x-ndjson"
+    )
 
 @router.delete("/{conversation_id}")
 async def delete_conversation(
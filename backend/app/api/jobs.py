@@ -0,0 +1,88 @@
+"""
+Background job inspection endpoints
+"""
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import get_read_db
+from app.models.job import BackgroundJob
+
+router = APIRouter()
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    payload: Optional[Dict[str, Any]] = None
+    priority: int
+    status: str
+    dedup_key: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    run_at: str
+    locked_until: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+class JobListResponse(BaseModel):
+    counts: Dict[str, int]  # 各状态的任务数
+    jobs: List[JobResponse]
+
+def _job_response(job: BackgroundJob) -> JobResponse:
+    def iso(value):
+        return value.isoformat() if value else None
+
+    return JobResponse(
+        id=job.id,
+        kind=job.kind,
+        payload=job.payload,
+        priority=job.priority,
+        status=job.status,
+        dedup_key=job.dedup_key,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        run_at=job.run_at.isoformat(),
+        locked_until=iso(job.locked_until),
+        last_error=job.last_error,
+        created_at=job.created_at.isoformat(),
+        started_at=iso(job.started_at),
+        finished_at=iso(job.finished_at)
+    )
+
+@router.get("/", response_model=JobListResponse)
+async def list_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    查看后台任务队列:各状态的任务数,以及最近创建的任务(可按 status、kind 过滤)
+    """
+    result = await db.execute(
+        select(BackgroundJob.status, func.count()).group_by(BackgroundJob.status)
+    )
+    counts = {row[0]: row[1] for row in result.all()}
+
+    query = select(BackgroundJob)
+    if status:
+        query = query.where(BackgroundJob.status == status)
+    if kind:
+        query = query.where(BackgroundJob.kind == kind)
+    result = await db.execute(query.order_by(BackgroundJob.created_at.desc()).limit(limit))
+    return JobListResponse(counts=counts, jobs=[_job_response(job) for job in result.scalars().all()])
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, db: AsyncSession = Depends(get_read_db)):
+    """
+    获取单个后台任务
+    """
+    job = await db.get(BackgroundJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
@@ -0,0 +1,41 @@
+"""
+Runtime metrics endpoints
+"""
+from fastapi import APIRouter
+
+from app.db.write_queue import write_queue
+from app.db.vector_index import vector_indexer
+from app.services.batch_runner import batch_runner
+from app.services.context_window import context_window
+from app.services.durable_stream import durable_streams
+from app.services.fanout import fanout_registry
+from app.services.history_cache import history_cache
+from app.services.job_queue import job_queue
+from app.services.llm_scheduler import llm_scheduler
+from app.services.model_router import model_router
+from app.services.prompt_cache import prompt_cache
+from app.services.provider_clients import provider_clients
+from app.services.response_cache import response_cache
+from app.services.settings_cache import settings_cache
+
+router = APIRouter()
+
+@router.get("/")
+async def get_metrics():
+    """Counters of in-process components"""
+    return {
+        "write_queue": write_queue.stats(),
+        "vector_index": vector_indexer.stats(),
+        "settings_cache": settings_cache.stats(),
+        "history_cache": history_cache.stats(),
+        "context_window": context_window.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "provider_clients": provider_clients.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "model_router": model_router.stats(),
+        "fanout": fanout_registry.stats(),
+        "durable_streams": durable_streams.stats(),
+        "batch": batch_runner.stats(),
+        "job_queue": job_queue.stats(),
+    }
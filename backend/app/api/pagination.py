@@ -0,0 +1,143 @@
+"""
+Keyset (cursor) pagination helpers
+
+Cursors are opaque to clients: a urlsafe-base64 JSON payload holding the
+direction of travel and the sort-key values of the row the page starts
+after. Pages are fetched with a row-value comparison on the sort key, so the
+cost of a page does not depend on how deep it is.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Literal, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+Direction = Literal["next", "prev"]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+
+@dataclass
+class Page:
+    items: list = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+    def apply_headers(self, response: Response):
+        if self.next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = self.next_cursor
+        if self.prev_cursor:
+            response.headers[PREV_CURSOR_HEADER] = self.prev_cursor
+
+def _encode_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _decode_value(column, value: Any) -> Any:
+    if value is not None and column.type.python_type is datetime:
+        return datetime.fromisoformat(value)
+    return value
+
+def encode_cursor(direction: Direction, values: Sequence[Any]) -> str:
+    payload = json.dumps({"d": direction, "k": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, key_columns: Sequence) -> tuple[Direction, list]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        direction = payload["d"]
+        values = payload["k"]
+        if direction not in ("next", "prev") or len(values) != len(key_columns):
+            raise ValueError
+        return direction, [_decode_value(col, v) for col, v in zip(key_columns, values)]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _key_of(item, key_columns: Sequence) -> list:
+    return [getattr(item, col.key) for col in key_columns]
+
+def _ordered(stmt: Select, key_columns: Sequence, descending: bool) -> Select:
+    return stmt.order_by(*[col.desc() if descending else col.asc() for col in key_columns])
+
+async def fetch_keyset_page(
+    db: AsyncSession,
+    stmt: Select,
+    key_columns: Sequence,
+    *,
+    descending: bool,
+    limit: int,
+    cursor: Optional[str] = None,
+    from_end: bool = False,
+) -> Page:
+    """
+    Fetch one page of `stmt` (a select of ORM entities) in key order.
+
+    Without a cursor the first page starts at the beginning of the sort order,
+    or at its end when `from_end` is set (e.g. the latest messages).
+    """
+    key = tuple_(*key_columns)
+    direction: Direction = "prev" if from_end else "next"
+    has_cursor = cursor is not None
+    if has_cursor:
+        direction, values = decode_cursor(cursor, key_columns)
+        # 沿排序方向前进时取"之后"的行,反向时取"之前"的行
+        forward_in_sql = (direction == "next") != descending
+        stmt = stmt.where(key > tuple(values) if forward_in_sql else key < tuple(values))
+
+    reverse = direction == "prev"
+    result = await db.execute(
+        _ordered(stmt, key_columns, descending != reverse).limit(limit + 1)
+    )
+    items = list(result.scalars().all())
+    has_more = len(items) > limit
+    items = items[:limit]
+    if reverse:
+        items.reverse()
+
+    page = Page(items=items)
+    if not items:
+        return page
+    first, last = _key_of(items[0], key_columns), _key_of(items[-1], key_columns)
+    if reverse:
+        page.prev_cursor = encode_cursor("prev", first) if has_more else None
+        page.next_cursor = encode_cursor("next", last) if has_cursor else None
+    else:
+        page.next_cursor = encode_cursor("next", last) if has_more else None
+        page.prev_cursor = encode_cursor("prev", first) if has_cursor else None
+    return page
+
+async def fetch_around(
+    db: AsyncSession,
+    stmt: Select,
+    key_columns: Sequence,
+    anchor_key: Sequence,
+    *,
+    window: int,
+) -> Page:
+    """Fetch `window` rows before and after the anchor key, plus the anchor itself (ascending order)"""
+    key = tuple_(*key_columns)
+    before = await db.execute(
+        _ordered(stmt.where(key < tuple(anchor_key)), key_columns, descending=True).limit(window + 1)
+    )
+    after = await db.execute(
+        _ordered(stmt.where(key >= tuple(anchor_key)), key_columns, descending=False).limit(window + 2)
+    )
+    before_items = list(before.scalars().all())
+    after_items = list(after.scalars().all())
+
+    has_before = len(before_items) > window
+    has_after = len(after_items) > window + 1
+    items = list(reversed(before_items[:window])) + after_items[:window + 1]
+
+    page = Page(items=items)
+    if items:
+        if has_before:
+            page.prev_cursor = encode_cursor("prev", _key_of(items[0], key_columns))
+        if has_after:
+            page.next_cursor = encode_cursor("next", _key_of(items[-1], key_columns))
+    return page
@@ -0,0 +1,132 @@
+"""
+Full-text search API endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+from app.db.database import get_read_db
+from app.db.counters import make_preview
+from app.db.search_index import search
+from app.db.vector_index import vector_indexer
+from app.models.conversation import Conversation, Message
+from app.models.knowledge import KnowledgePoint
+
+router = APIRouter()
+
+# Pydantic schemas
+class SearchHitResponse(BaseModel):
+    kind: str
+    ref_id: str
+    conversation_id: str
+    conversation_title: str
+    created_at: Optional[datetime] = None
+    snippet: str
+    score: float
+
+    class Config:
+        from_attributes = True
+
+class SimilarHitResponse(BaseModel):
+    kind: str
+    ref_id: str
+    conversation_id: str
+    conversation_title: str
+    preview: str
+    score: float
+
+@router.get("/", response_model=List[SearchHitResponse])
+async def search_documents(
+    q: str = Query(..., min_length=1),
+    conversation_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    kinds: Optional[List[Literal["conversation", "message", "knowledge_point"]]] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """搜索消息、对话标题和知识点
+
+    结果按 BM25 相关度排序,snippet 中命中词以 <mark> 标出。
+    """
+    return await search(
+        db, q,
+        conversation_id=conversation_id,
+        project_id=project_id,
+        since=since,
+        until=until,
+        kinds=kinds,
+        limit=limit,
+        offset=offset,
+    )
+
+@router.get("/similar", response_model=List[SimilarHitResponse])
+async def search_similar(
+    q: Optional[str] = Query(None, min_length=1),
+    message_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    kinds: Optional[List[Literal["message", "knowledge_point"]]] = Query(None),
+    k: int = Query(10, ge=1, le=100),
+    min_score: float = Query(0.0, ge=-1.0, le=1.0),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """语义相似搜索
+
+    传 `q` 按文本查询,或传 `message_id` 查找与某条消息相似的内容(结果不含该消息本身)。
+    只返回余弦相似度大于 `min_score` 的结果。
+    """
+    if not vector_indexer.running:
+        raise HTTPException(status_code=503, detail="Vector index is not running")
+
+    exclude = None
+    if message_id:
+        exclude = ("message", message_id)
+        query = vector_indexer.index.vector_of(exclude)
+        if query is None:
+            content = (await db.execute(select(Message.content).where(Message.id == message_id))).scalar()
+            if content is None:
+                raise HTTPException(status_code=404, detail="Message not found")
+            query = vector_indexer.embed_query(content)
+    elif q:
+        query = vector_indexer.embed_query(q)
+    else:
+        raise HTTPException(status_code=400, detail="Either q or message_id is required")
+
+    hits = await vector_indexer.search(query, k, kinds=kinds, conversation_id=conversation_id, exclude=exclude)
+    hits = [hit for hit in hits if hit.score > min_score]
+
+    # 命中结果只有 id,批量取回正文预览和对话标题
+    message_ids = [hit.ref_id for hit in hits if hit.kind == "message"]
+    point_ids = [hit.ref_id for hit in hits if hit.kind == "knowledge_point"]
+    texts = {}
+    if message_ids:
+        result = await db.execute(select(Message.id, Message.content).where(Message.id.in_(message_ids)))
+        texts.update({("message", row.id): row.content for row in result})
+    if point_ids:
+        result = await db.execute(
+            select(KnowledgePoint.id, KnowledgePoint.selected_text, KnowledgePoint.notes)
+            .where(KnowledgePoint.id.in_(point_ids))
+        )
+        texts.update({("knowledge_point", row.id): row.notes or row.selected_text for row in result})
+    titles = dict((await db.execute(
+        select(Conversation.id, Conversation.title)
+        .where(Conversation.id.in_({hit.conversation_id for hit in hits}))
+    )).all()) if hits else {}
+
+    return [
+        SimilarHitResponse(
+            kind=hit.kind,
+            ref_id=hit.ref_id,
+            conversation_id=hit.conversation_id,
+            conversation_title=titles.get(hit.conversation_id, ""),
+            preview=make_preview(texts[(hit.kind, hit.ref_id)]) or "",
+            score=hit.score,
+        )
+        for hit in hits
+        if (hit.kind, hit.ref_id) in texts
+    ]
@@ -10,6 +10,7 @@ from datetime import datetime
 
 from app.db.database import get_db
 from app.models.settings import ModelConfig, AppSettings, APIKeyStorage
+from app.services.settings_cache import settings_cache
 
 router = APIRouter()
 
@@ -126,48 +127,21 @@ async def create_model_config(
 @router.get("/models", response_model=List[ModelConfigResponse])
 async def list_model_configs(
     provider: Optional[str] = None,
-    is_active: Optional[bool] = None,
-    db: AsyncSession = Depends(get_db)
+    is_active: Optional[bool] = None
 ):
     """获取所有模型配置"""
-    query = select(ModelConfig)
-
-    if provider:
-        query = query.where(ModelConfig.provider == provider)
-    if is_active is not None:
-        query = query.where(ModelConfig.is_active == is_active)
-
-    query = query.order_by(ModelConfig.is_default.desc(), ModelConfig.created_at.desc())
-
-    result = await db.execute(query)
-    configs = result.scalars().all()
-
-    return [
-        ModelConfigResponse(
-            **config.__dict__,
-            has_api_key=bool(config.api_key)
-        )
-        for config in configs
-    ]
+    configs = await settings_cache.model_configs(provider=provider or None, is_active=is_active)
+    return [ModelConfigResponse.model_validate(config) for config in configs]
 
 @router.get("/models/{config_id}", response_model=ModelConfigResponse)
-async def get_model_config(
-    config_id: str,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_model_config(config_id: str):
     """获取单个模型配置"""
-    result = await db.execute(
-        select(ModelConfig).where(ModelConfig.id == config_id)
-    )
-    config = result.scalar_one_or_none()
+    config = await settings_cache.model_config(config_id)
 
     if not config:
         raise HTTPException(status_code=404, detail="Model config not found")
 
-    return ModelConfigResponse(
-        **config.__dict__,
-        has_api_key=bool(config.api_key)
-    )
+    return ModelConfigResponse.model_validate(config)
 
 @router.patch("/models/{config_id}", response_model=ModelConfigResponse)
 async def update_model_config(
@@ -251,38 +225,20 @@ async def create_app_setting(
     return AppSettingsResponse(**db_setting.__dict__)
 
 @router.get("/app", response_model=List[AppSettingsResponse])
-async def list_app_settings(
-    category: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
-):
+async def list_app_settings(category: Optional[str] = None):
     """获取所有应用设置"""
-    query = select(AppSettings)
-
-    if category:
-        query = query.where(AppSettings.category == category)
-
-    query = query.order_by(AppSettings.category, AppSettings.key)
-
-    result = await db.execute(query)
-    settings = result.scalars().all()
-
-    return [AppSettingsResponse(**s.__dict__) for s in settings]
+    settings = await settings_cache.app_settings(category=category or None)
+    return [AppSettingsResponse.model_validate(s) for s in settings]
 
 @router.get("/app/{key}", response_model=AppSettingsResponse)
-async def get_app_setting(
-    key: str,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_app_setting(key: str):
     """获取单个应用设置"""
-    result = await db.execute(
-        select(AppSettings).where(AppSettings.key == key)
-    )
-    setting = result.scalar_one_or_none()
+    setting = await settings_cache.app_setting(key)
 
     if not setting:
         raise HTTPException(status_code=404, detail="Setting not found")
 
-    return AppSettingsResponse(**setting.__dict__)
+    return AppSettingsResponse.model_validate(setting)
 
 @router.patch("/app/{key}", response_model=AppSettingsResponse)
 async def update_app_setting(
@@ -364,12 +320,9 @@ async def save_api_key(
     )
 
 @router.get("/api-keys", response_model=List[APIKeyResponse])
-async def list_api_keys(
-    db: AsyncSession = Depends(get_db)
-):
+async def list_api_keys():
     """获取所有 API Key 状态(不返回实际 key)"""
-    result = await db.execute(select(APIKeyStorage))
-    keys = result.scalars().all()
+    keys = await settings_cache.api_keys()
 
     return [
         APIKeyResponse(
@@ -382,15 +335,9 @@ async def list_api_keys(
     ]
 
 @router.get("/api-keys/{provider}", response_model=APIKeyResponse)
-async def get_api_key_status(
-    provider: str,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_api_key_status(provider: str):
     """获取特定提供商的 API Key 状态"""
-    result = await db.execute(
-        select(APIKeyStorage).where(APIKeyStorage.provider == provider)
-    )
-    key = result.scalar_one_or_none()
+    key = await settings_cache.api_key(provider)
 
     if not key:
         return APIKeyResponse(
@@ -10,7 +10,7 @@ from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import get_db
+from app.db.database import get_db, get_read_db
 from app.models.space import KnowledgeSpace
 
 
@@ -63,7 +63,7 @@ class SpaceResponse(BaseModel):
 
 
 @router.get("/", response_model=List[SpaceResponse])
-async def list_spaces(db: AsyncSession = Depends(get_db)):
+async def list_spaces(db: AsyncSession = Depends(get_read_db)):
     """获取全部知识空间"""
     result = await db.execute(select(KnowledgeSpace).order_by(KnowledgeSpace.created_at.desc()))
     spaces = result.scalars().all()
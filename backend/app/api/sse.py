@@ -0,0 +1,184 @@
+"""
+Server-sent event encoding for token streams
+
+Providers send deltas of one or two characters; writing one `data:` frame
+per delta makes JSON encoding, write syscalls and client-side parsing the
+main cost of a stream. SSEEncoder writes at most one batch of frames per
+coalescing window (sse_coalesce_ms) and merges the deltas that arrived in
+the meantime into one frame of up to sse_max_frame_chars; deltas of
+different streams (the fan-out endpoint's `index`) are never merged. A delta
+that arrives after the stream has been quiet for longer than the window is
+sent at once, so the first token and slow streams get no added latency. Idle streams get a comment line every
+sse_heartbeat_seconds so proxies keep the connection open. If the source
+raises, the deltas already collected are flushed and the stream ends with an
+`error` event instead of being cut off.
+
+Frames are built from precomputed byte templates; JSON uses orjson when it is
+installed and the standard library otherwise.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi.responses import StreamingResponse
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder produces the same JSON
+    orjson = None
+
+if orjson is not None:
+    dumps = orjson.dumps
+else:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# (event id or None, event). Events carrying a string "content" are content
+# deltas; consecutive deltas whose other keys match are merged.
+Event = tuple[Optional[int], Dict[str, Any]]
+
+_ID = b"id: %d\n"
+_CONTENT_PREFIX = b'data: {"content":'
+_CONTENT_SUFFIX = b"}\n\n"
+_DATA_PREFIX = b"data: "
+_FRAME_END = b"\n\n"
+HEARTBEAT = b": ping\n\n"
+
+_DONE = object()
+
+def encode_event(event: Dict[str, Any], event_id: Optional[int] = None) -> bytes:
+    head = _ID % event_id if event_id is not None else b""
+    return head + _DATA_PREFIX + dumps(event) + _FRAME_END
+
+def encode_content(content: str, event_id: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> bytes:
+    if meta:
+        return encode_event({**meta, "content": content}, event_id)
+    head = _ID % event_id if event_id is not None else b""
+    return head + _CONTENT_PREFIX + dumps(content) + _CONTENT_SUFFIX
+
+class SSEEncoder:
+    """Turns a stream of events into coalesced SSE frames"""
+
+    def __init__(
+        self,
+        coalesce_ms: Optional[float] = None,
+        max_frame_chars: Optional[int] = None,
+        heartbeat_seconds: Optional[float] = None,
+    ):
+        self.window = (config.sse_coalesce_ms if coalesce_ms is None else coalesce_ms) / 1000
+        self.max_frame_chars = max_frame_chars or config.sse_max_frame_chars
+        self.heartbeat = config.sse_heartbeat_seconds if heartbeat_seconds is None else heartbeat_seconds
+
+        self.frames = 0
+        self.events = 0
+
+    async def encode(self, events: AsyncIterator[Event]) -> AsyncIterator[bytes]:
+        # The source is read by its own task into a list. After each write the
+        # encoder sleeps for the coalescing window and then takes everything
+        # that arrived meanwhile, so timers are armed per frame, not per delta.
+        pending: list = []
+        ready = asyncio.Event()
+
+        async def pump() -> None:
+            try:
+                async for item in events:
+                    pending.append(item)
+                    ready.set()
+            except Exception as e:
+                pending.append(e)
+            else:
+                pending.append(_DONE)
+            ready.set()
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.create_task(pump())
+        try:
+            while True:
+                if not pending:
+                    # A plain timer wakes us for the heartbeat (wait_for would
+                    # wrap every wait in a task)
+                    timer = loop.call_later(self.heartbeat, ready.set) if self.heartbeat > 0 else None
+                    await ready.wait()
+                    if timer is not None:
+                        timer.cancel()
+                    if not pending:
+                        ready.clear()
+                        self.frames += 1
+                        yield HEARTBEAT
+                        continue
+                ready.clear()
+                items, pending[:] = pending[:], []
+                done = False
+                for frame in self._frames(items):
+                    if frame is _DONE:
+                        done = True
+                        break
+                    yield frame
+                if done:
+                    break
+                if self.window > 0:
+                    await asyncio.sleep(self.window)
+        finally:
+            # Also runs on client disconnect: close the source with us
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+
+    def _frames(self, items: list):
+        """Frames for a batch of events, merging runs of deltas with the same other keys"""
+        parts: list[str] = []
+        meta: Optional[Dict[str, Any]] = None
+        size = 0
+        last_id: Optional[int] = None
+        for item in items:
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                if parts:
+                    yield self._content_frame(parts, last_id, meta)
+                logger.error("Event stream failed: %s", item, exc_info=item)
+                self.frames += 1
+                yield encode_event({"type": "error", "error": str(item)})
+                yield _DONE
+                return
+            event_id, event = item
+            self.events += 1
+            content = event.get("content")
+            if isinstance(content, str) and event.get("type", "content") == "content":
+                event_meta = {k: v for k, v in event.items() if k != "content"} if len(event) > 1 else None
+                if parts and (event_meta != meta or size >= self.max_frame_chars):
+                    yield self._content_frame(parts, last_id, meta)
+                    parts, size = [], 0
+                meta = event_meta
+                parts.append(content)
+                size += len(content)
+                last_id = event_id
+                continue
+            if parts:
+                yield self._content_frame(parts, last_id, meta)
+                parts, size = [], 0
+            self.frames += 1
+            yield encode_event(event, event_id)
+        if parts:
+            yield self._content_frame(parts, last_id, meta)
+        if items and items[-1] is _DONE:
+            yield _DONE
+
+    def _content_frame(self, parts: list[str], event_id: Optional[int], meta: Optional[Dict[str, Any]]) -> bytes:
+        self.frames += 1
+        return encode_content(parts[0] if len(parts) == 1 else "".join(parts), event_id, meta)
+
+def sse_response(events: AsyncIterator[Event]) -> StreamingResponse:
+    return StreamingResponse(
+        SSEEncoder().encode(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,139 @@
+"""
+Application configuration
+
+所有可调参数都可以通过 `KS_` 前缀的环境变量或 backend/.env 覆盖,
+例如 `KS_DB_ECHO=true`。
+"""
+from pathlib import Path
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class AppConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="KS_", env_file=".env", extra="ignore")
+
+    # Data directory (in user's home directory for desktop app)
+    data_dir: Path = Path.home() / ".knowledge-studio"
+
+    # ============= SQLite engine profile =============
+    db_echo: bool = False
+    db_journal_mode: str = "wal"
+    db_synchronous: str = "normal"
+    db_mmap_size: int = 256 * 1024 * 1024  # bytes
+    db_cache_size_kib: int = 64 * 1024  # 传给 PRAGMA cache_size 时取负值,单位 KiB
+    db_busy_timeout_ms: int = 5000
+    db_read_pool_size: int = 4
+    db_read_pool_overflow: int = 4
+    db_write_pool_timeout: float = 30.0  # 等待唯一写连接的最长时间(秒)
+    db_auto_migrate: bool = False  # 启动时自动把已有数据库迁移到最新版本
+
+    # ============= Primary keys =============
+    id_version: int = 7  # 7: 按时间有序的 UUIDv7;4: 随机 UUIDv4。两者都以 16 字节 BLOB 存储
+
+    # ============= Group-commit write queue =============
+    write_queue_max_batch_size: int = 64  # 单个事务最多合并的行数
+    write_queue_max_latency_ms: float = 5.0  # 一次写入在队列里最多等待多久就提交
+
+    # ============= Compressed message storage =============
+    compression_algorithm: str = "auto"  # auto(有 zstandard 用 zstd,否则 zlib), zstd, zlib, none
+    compression_threshold_bytes: int = 1024  # 小于该长度的正文保持明文
+    compression_level_zlib: int = 6
+    compression_level_zstd: int = 3
+    compression_backfill_on_startup: bool = False  # 启动时在后台压缩历史数据
+    compression_backfill_batch_size: int = 500
+
+    # ============= Full-text search =============
+    # FTS5 分词器:trigram 按三字组切分,适合中文等没有空格分词的文本;unicode61 适合纯英文内容。
+    # 修改后需要执行 `python -m app.db.maintenance rebuild-search`
+    search_tokenizer: str = "trigram"
+
+    # ============= Semantic search =============
+    embedding_model: str = "hashing"  # hashing(本地特征哈希)或 "module:factory" 指向自定义向量化实现
+    embedding_dim: int = 256  # 仅对 hashing 生效
+    embedding_batch_size: int = 64  # 后台增量索引每批向量化的文本数
+    vector_ivf_threshold: int = 50_000  # 向量数超过该值后建立 IVF 粗量化索引
+    vector_ivf_lists: int = 0  # 聚类中心数,0 表示取 sqrt(向量数)
+    vector_ivf_probes: int = 8  # 每次查询扫描的最近聚类数
+
+    # ============= Chat =============
+    history_cache_max_bytes: int = 64 * 1024 * 1024  # 对话历史缓存的内存上限(估算值)
+    context_strategy: str = "sliding_window"  # sliding_window(按 token 预算截取)或 full(发送全部历史)
+    context_pin_system: bool = True  # 截取时始终保留 system 消息
+    context_keep_referenced: bool = True  # 截取时优先保留被知识点引用的消息
+    context_reserve_tokens: int = 1024  # 请求未指定 max_tokens 时为回复预留的 token 数
+    context_safety_ratio: float = 0.9  # token 数按 cl100k_base 计算,对其他模型只用窗口的这一比例
+    prompt_cache_enabled: bool = True  # 为支持的模型在稳定的历史前缀上加缓存断点(见 app/services/prompt_cache.py)
+    response_cache_enabled: bool = True  # 缓存 temperature=0 或显式要求缓存的回复(见 app/services/response_cache.py)
+    response_cache_ttl_seconds: int = 7 * 24 * 3600
+    response_cache_max_bytes: int = 256 * 1024 * 1024  # 超出后按最近使用时间淘汰
+    response_cache_replay_chunk_chars: int = 16  # 流式请求命中缓存时每个 SSE 分片的字符数
+
+    # ============= LLM provider connections =============
+    llm_pool_max_connections: int = 20  # 每个 (provider, base_url, Key) 客户端的最大连接数
+    llm_pool_max_keepalive: int = 10
+    llm_pool_keepalive_expiry: float = 120.0  # 空闲连接保留时间(秒)
+    llm_connect_timeout: float = 10.0
+    llm_read_timeout: float = 600.0  # 长回复的流式响应可能持续数分钟
+    llm_pool_timeout: float = 30.0  # 等待连接池空闲连接的最长时间
+    llm_max_retries: int = 2  # OpenAI SDK 的自动重试次数
+    llm_warmup_on_startup: bool = True  # 启动时在后台为已配置 Key 的 provider 建立连接
+
+    # ============= LLM rate limiting =============
+    # 每个模型的 rpm / tpm 在模型配置的 extra_params 中设置,见 app/services/llm_scheduler.py
+    llm_queue_max_depth: int = 100  # 单个模型排队的请求超过该值后直接返回 429
+    llm_rate_limit_retries: int = 3  # 服务端返回 429 后的最大重试次数
+    llm_backoff_base_seconds: float = 1.0  # 没有 Retry-After 时的首次退避时间,之后每次翻倍
+    llm_backoff_max_seconds: float = 60.0
+    llm_backoff_jitter: float = 0.25  # 退避时间随机增加的最大比例
+
+    # ============= LLM fallback and hedging =============
+    # 回退链在模型配置的 extra_params 中用 "fallbacks" 设置,见 app/services/model_router.py
+    llm_hedge_enabled: bool = True  # 主模型首 token 超时后同时请求回退链上的下一个模型
+    llm_hedge_quantile: float = 0.95  # 对冲截止时间取最近首 token 延迟的该分位数
+    llm_hedge_default_delay: float = 8.0  # 样本不足时的对冲截止时间(秒)
+    llm_hedge_min_delay: float = 1.0
+    llm_hedge_max_delay: float = 30.0
+    # 非流式请求只能按完整回复的延迟对冲,长回复本来就慢,默认不对冲
+    llm_hedge_completions: bool = False
+    llm_hedge_completion_default_delay: float = 60.0
+    llm_hedge_completion_max_delay: float = 180.0
+    llm_latency_window_seconds: float = 600.0  # 延迟和错误统计的时间窗口
+    llm_latency_min_samples: int = 20  # 计算分位数所需的最少样本数
+    llm_unhealthy_error_rate: float = 0.5  # 错误率达到该值的模型排到回退链末尾
+
+    # ============= Streaming =============
+    stream_checkpoint_interval_seconds: float = 1.0  # 流式回复写回数据库的间隔
+    stream_checkpoint_chars: int = 2000  # 距上次检查点累计这么多字符时也立即写回
+    stream_disconnect_grace_seconds: float = 10.0  # 客户端全部断开后等待重连的时间,超时取消生成(0 立即取消)
+    sse_coalesce_ms: float = 20.0  # 合并 token delta 的最长等待时间
+    sse_max_frame_chars: int = 1024  # 单个 SSE 帧合并的最多字符数
+    sse_heartbeat_seconds: float = 15.0  # 空闲流发送心跳注释的间隔(0 关闭)
+    ws_send_queue_size: int = 64  # 每个 WebSocket 连接待发送帧的上限,满时暂停转发
+
+    # ============= Multi-model chat =============
+    fanout_max_models: int = 4  # 一次对比请求最多同时调用的模型数
+
+    # ============= Batch chat =============
+    batch_max_items: int = 200  # 一个批量任务最多的条目数
+    batch_max_concurrency: int = 4  # 所有批量任务同时调用模型的条目数上限(也是单个任务的默认并发)
+    batch_item_retries: int = 3  # 条目被限流后的最大重试次数
+
+    # ============= Background jobs =============
+    job_queue_workers: int = 2  # 执行后台任务的 worker 数
+    job_queue_poll_seconds: float = 5.0  # 没有新任务通知时检查延迟任务和过期租约的间隔
+    job_queue_visibility_timeout_seconds: float = 300.0  # 任务默认的最长执行时间,超过后取消并重试
+    job_queue_max_attempts: int = 5
+    job_queue_backoff_base_seconds: float = 5.0  # 失败后首次重试的等待时间,之后每次翻倍
+    job_queue_backoff_max_seconds: float = 600.0
+    job_queue_retention_seconds: int = 7 * 24 * 3600  # 已结束的任务保留多久
+    job_queue_prune_interval_seconds: float = 3600.0
+
+    # ============= API =============
+    message_stream_partition_size: int = 200  # NDJSON 流式接口每次从游标读取的行数
+
+    @property
+    def database_path(self) -> Path:
+        return self.data_dir / "knowledge_studio.db"
+
+
+config = AppConfig()
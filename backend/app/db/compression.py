@@ -0,0 +1,75 @@
+"""
+Background recompression of existing rows
+
+Rows written before CompressedText existed are plain TEXT. This rewrites the
+ones above the size threshold in small batches, each in its own short write
+transaction, so it can run next to live traffic.
+"""
+import asyncio
+import logging
+
+from sqlalchemy import bindparam, cast, func, literal_column, select, update, LargeBinary
+
+from app.config import config
+from app.db.database import async_session_maker, read_session_maker
+from app.db.types import CompressedText
+from app.models.conversation import Message
+from app.models.knowledge import KnowledgePoint
+from app.services.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED_COLUMNS = (Message.content, KnowledgePoint.notes)
+
+async def _recompress_column(column, batch_size: int) -> int:
+    table = column.class_.__table__
+    raw = table.c[column.key]
+    rowid = literal_column("rowid")
+
+    candidates = (
+        select(rowid, table.c.id, raw)
+        .where(
+            func.typeof(raw) == "text",
+            func.length(cast(raw, LargeBinary)) >= config.compression_threshold_bytes
+        )
+        .order_by(rowid)
+        .limit(batch_size)
+    )
+    values = {column.key: bindparam("_body", type_=CompressedText())}
+    if "updated_at" in table.c:
+        # 只是换了存储格式,不算一次修改
+        values["updated_at"] = table.c.updated_at
+    rewrite = update(table).where(table.c.id == bindparam("_id")).values(**values)
+
+    rewritten = 0
+    last_rowid = 0
+    while True:
+        async with read_session_maker() as session:
+            rows = (await session.execute(candidates.where(rowid > last_rowid))).all()
+        if not rows:
+            return rewritten
+
+        async with async_session_maker() as session:
+            await session.execute(rewrite, [{"_id": row.id, "_body": row[2]} for row in rows])
+            await session.commit()
+
+        rewritten += len(rows)
+        last_rowid = rows[-1][0]
+        # 让出事件循环,避免长时间占用写连接
+        await asyncio.sleep(0)
+
+async def recompress_existing(batch_size: int = config.compression_backfill_batch_size) -> int:
+    """Compress every stored body above the threshold that is still plain text"""
+    total = 0
+    for column in COMPRESSED_COLUMNS:
+        count = await _recompress_column(column, batch_size)
+        logger.info("Recompressed %d rows of %s.%s", count, column.class_.__tablename__, column.key)
+        total += count
+    return total
+
+async def _backfill_job(payload: dict) -> None:
+    await recompress_existing()
+
+# Enqueued at startup when compression_backfill_on_startup is set; rows are
+# rewritten in short transactions, so a retry only redoes what is left
+job_queue.register("compression.backfill", _backfill_job, timeout=6 * 3600)
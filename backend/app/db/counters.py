@@ -0,0 +1,149 @@
+"""
+Denormalized conversation counters
+
+Keeps Conversation.message_count / knowledge_point_count / last_message_at /
+last_message_preview in step with the messages and knowledge_points tables.
+The listeners run inside the flush that writes the row, so the counters are
+committed in the same transaction (including group commits from the write
+queue). Any write that bypasses the ORM can be repaired with
+rebuild_conversation_counters().
+"""
+from sqlalchemy import case, event, func, select, update
+from sqlalchemy.orm import object_session
+
+from app.models.conversation import Conversation, Message, PREVIEW_LENGTH
+from app.models.knowledge import KnowledgePoint
+
+conversations = Conversation.__table__
+
+def make_preview(content: str | None) -> str | None:
+    if content is None:
+        return None
+    preview = " ".join(content.split())
+    if len(preview) > PREVIEW_LENGTH:
+        preview = preview[:PREVIEW_LENGTH - 1] + "…"
+    return preview
+
+def _conversation_deleted(target, conversation_id) -> bool:
+    """True when the parent conversation is being deleted in the same flush"""
+    session = object_session(target)
+    if session is None:
+        return False
+    conversation = session.identity_map.get(session.identity_key(Conversation, conversation_id))
+    return conversation is not None and conversation in session.deleted
+
+@event.listens_for(Message, "after_insert")
+def _message_inserted(mapper, connection, target):
+    newer = (conversations.c.last_message_at.is_(None)) | (conversations.c.last_message_at <= target.created_at)
+    connection.execute(
+        update(conversations)
+        .where(conversations.c.id == target.conversation_id)
+        .values(
+            message_count=conversations.c.message_count + 1,
+            last_message_at=case((newer, target.created_at), else_=conversations.c.last_message_at),
+            last_message_preview=case(
+                (newer, make_preview(target.content)),
+                else_=conversations.c.last_message_preview
+            ),
+        )
+    )
+
+@event.listens_for(Message, "after_update")
+def _message_updated(mapper, connection, target):
+    # 只有最新一条消息被编辑时才需要刷新预览
+    connection.execute(
+        update(conversations)
+        .where(
+            conversations.c.id == target.conversation_id,
+            conversations.c.last_message_at == target.created_at
+        )
+        .values(last_message_preview=make_preview(target.content))
+    )
+
+@event.listens_for(Message, "after_delete")
+def _message_deleted(mapper, connection, target):
+    if _conversation_deleted(target, target.conversation_id):
+        return
+
+    latest = connection.execute(
+        select(Message.created_at, Message.content)
+        .where(Message.conversation_id == target.conversation_id)
+        .order_by(Message.created_at.desc())
+        .limit(1)
+    ).first()
+    connection.execute(
+        update(conversations)
+        .where(conversations.c.id == target.conversation_id)
+        .values(
+            message_count=func.max(conversations.c.message_count - 1, 0),
+            last_message_at=latest.created_at if latest else None,
+            last_message_preview=make_preview(latest.content) if latest else None,
+        )
+    )
+
+@event.listens_for(KnowledgePoint, "after_insert")
+def _knowledge_point_inserted(mapper, connection, target):
+    connection.execute(
+        update(conversations)
+        .where(conversations.c.id == target.conversation_id)
+        .values(knowledge_point_count=conversations.c.knowledge_point_count + 1)
+    )
+
+@event.listens_for(KnowledgePoint, "after_delete")
+def _knowledge_point_deleted(mapper, connection, target):
+    if _conversation_deleted(target, target.conversation_id):
+        return
+
+    connection.execute(
+        update(conversations)
+        .where(conversations.c.id == target.conversation_id)
+        .values(knowledge_point_count=func.max(conversations.c.knowledge_point_count - 1, 0))
+    )
+
+def rebuild_conversation_counters(connection) -> int:
+    """Recompute every conversation's counters from scratch (sync connection)"""
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.conversation_id == conversations.c.id)
+        .scalar_subquery()
+    )
+    knowledge_point_count = (
+        select(func.count(KnowledgePoint.id))
+        .where(KnowledgePoint.conversation_id == conversations.c.id)
+        .scalar_subquery()
+    )
+    last_message_at = (
+        select(func.max(Message.created_at))
+        .where(Message.conversation_id == conversations.c.id)
+        .scalar_subquery()
+    )
+    connection.execute(
+        update(conversations).values(
+            message_count=message_count,
+            knowledge_point_count=knowledge_point_count,
+            last_message_at=last_message_at,
+            updated_at=func.max(
+                conversations.c.updated_at,
+                func.coalesce(last_message_at, conversations.c.updated_at)
+            ),
+        )
+    )
+
+    # 预览需要经过 Message.content 的列类型解码,逐个对话在 Python 侧生成
+    rows = connection.execute(
+        select(conversations.c.id, conversations.c.last_message_at)
+    ).all()
+    for conversation_id, last_at in rows:
+        content = None
+        if last_at is not None:
+            content = connection.execute(
+                select(Message.content)
+                .where(Message.conversation_id == conversation_id, Message.created_at == last_at)
+                .limit(1)
+            ).scalar()
+        connection.execute(
+            update(conversations)
+            .where(conversations.c.id == conversation_id)
+            .values(last_message_preview=make_preview(content), updated_at=conversations.c.updated_at)
+        )
+    return len(rows)
@@ -1,42 +1,131 @@
 """
 Database configuration and session management
+
+SQLite 只允许一个写者,因此这里维护两个 engine:
+- write_engine: 唯一的一条写连接,所有写操作在它上面串行执行
+- read_engine: 只读连接池,WAL 模式下读不会被写阻塞
 """
+from pathlib import Path
+
+from sqlalchemy import event, inspect
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from pathlib import Path
-import os
+
+from app.config import config
 
 # Database file path (in user's home directory for desktop app)
-DB_DIR = Path.home() / ".knowledge-studio"
-DB_DIR.mkdir(exist_ok=True)
-DATABASE_URL = f"sqlite+aiosqlite:///{DB_DIR}/knowledge_studio.db"
+DB_DIR = config.data_dir
+DB_DIR.mkdir(parents=True, exist_ok=True)
+DATABASE_URL = f"sqlite+aiosqlite:///{config.database_path}"
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
 
-# Create async engine
-engine = create_async_engine(
+def _configure_connection(dbapi_connection, read_only: bool):
+    """Apply the engine profile pragmas to a freshly opened connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={int(config.db_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA cache_size={-int(config.db_cache_size_kib)}")
+    cursor.execute(f"PRAGMA mmap_size={int(config.db_mmap_size)}")
+    cursor.execute(f"PRAGMA synchronous={config.db_synchronous}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    else:
+        # journal_mode 是持久化在数据库文件上的,只需要写连接设置
+        cursor.execute(f"PRAGMA journal_mode={config.db_journal_mode}")
+    cursor.close()
+
+# Dedicated writer: exactly one connection, callers queue on the pool
+write_engine = create_async_engine(
     DATABASE_URL,
-    echo=True,  # Set to False in production
-    future=True
+    echo=config.db_echo,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=config.db_write_pool_timeout,
 )
 
-# Create async session maker
+# Read-only pool for list/detail endpoints
+read_engine = create_async_engine(
+    DATABASE_URL,
+    echo=config.db_echo,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=config.db_read_pool_size,
+    max_overflow=config.db_read_pool_overflow,
+)
+
+@event.listens_for(write_engine.sync_engine, "connect")
+def _on_write_connect(dbapi_connection, connection_record):
+    _configure_connection(dbapi_connection, read_only=False)
+
+@event.listens_for(read_engine.sync_engine, "connect")
+def _on_read_connect(dbapi_connection, connection_record):
+    _configure_connection(dbapi_connection, read_only=True)
+
+# Create async session makers
 async_session_maker = async_sessionmaker(
-    engine,
+    write_engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
 
+read_session_maker = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False
+)
+
 # Base class for models
 Base = declarative_base()
 
+class SchemaVersionError(RuntimeError):
+    """The database schema is not at the Alembic head revision"""
+
+def alembic_config():
+    from alembic.config import Config
+
+    return Config(str(ALEMBIC_INI))
+
+def _check_schema_version(connection):
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    cfg = alembic_config()
+    head = ScriptDirectory.from_config(cfg).get_current_head()
+    current = MigrationContext.configure(connection).get_current_revision()
+    if current == head:
+        return
+
+    # 全新的空数据库直接建到最新版本;已有数据的库只在显式允许时自动迁移
+    if not inspect(connection).get_table_names() or config.db_auto_migrate:
+        cfg.attributes["connection"] = connection
+        command.upgrade(cfg, "head")
+        return
+
+    raise SchemaVersionError(
+        f"Database schema is at revision {current or '<unversioned>'}, expected {head}. "
+        "Run `alembic upgrade head` in backend/ (or set KS_DB_AUTO_MIGRATE=true) before starting."
+    )
+
 async def init_db():
-    """Initialize database (create tables)"""
-    from app.models import conversation, knowledge, settings, space  # noqa: F401
+    """Initialize database: verify the schema is migrated to the Alembic head"""
+    from app.models import conversation, knowledge, settings, space, search, cache, batch, job  # noqa: F401
+    from app.db import counters, search_index, vector_index  # noqa: F401  (register the write-path listeners)
+    from app.services import tokens  # noqa: F401
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    async with write_engine.begin() as conn:
+        await conn.run_sync(_check_schema_version)
+
+async def close_db():
+    """Dispose both connection pools"""
+    await read_engine.dispose()
+    await write_engine.dispose()
 
 async def get_db():
-    """Dependency for getting database session"""
+    """Dependency for getting a read-write database session (uses the single writer)"""
     async with async_session_maker() as session:
         try:
             yield session
@@ -46,3 +135,12 @@ async def get_db():
             raise
         finally:
             await session.close()
+
+async def get_read_db():
+    """Dependency for read-only routes, served from the read pool"""
+    async with read_session_maker() as session:
+        try:
+            yield session
+        finally:
+            await session.rollback()
+            await session.close()
@@ -0,0 +1,47 @@
+"""
+Primary key generation
+
+新记录默认使用 UUIDv7:前 48 位是毫秒时间戳,同一毫秒内用 12 位计数器保证单调递增,
+插入总是追加在 B-tree 末尾。`KS_ID_VERSION=4` 可以退回随机的 UUIDv4。
+"""
+import secrets
+import threading
+import time
+import uuid
+
+from app.config import config
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID (RFC 9562), monotonic within this process"""
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # 计数器从随机值开始,但留出一半空间给同一毫秒内的后续 id
+            _counter = secrets.randbits(11)
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # 计数器溢出时借用下一毫秒
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+    value = (
+        (timestamp & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | secrets.randbits(62)
+    )
+    return uuid.UUID(int=value)
+
+def new_id() -> str:
+    """Default for primary key columns"""
+    if config.id_version == 4:
+        return str(uuid.uuid4())
+    return str(uuid7())
@@ -0,0 +1,88 @@
+"""
+Database maintenance commands
+
+Usage (run in backend/):
+
+    python -m app.db.maintenance rebuild-counters
+    python -m app.db.maintenance recompress
+    python -m app.db.maintenance rebuild-search
+    python -m app.db.maintenance rebuild-vectors
+    python -m app.db.maintenance count-tokens
+"""
+import argparse
+import asyncio
+import sys
+
+from app.db.database import write_engine, close_db
+
+async def rebuild_counters() -> None:
+    from app.db.counters import rebuild_conversation_counters
+
+    async with write_engine.begin() as conn:
+        count = await conn.run_sync(rebuild_conversation_counters)
+    print(f"Rebuilt counters for {count} conversations")
+
+async def recompress() -> None:
+    from app.db.compression import recompress_existing
+
+    count = await recompress_existing()
+    print(f"Rewrote {count} rows with compressed storage")
+
+async def rebuild_search() -> None:
+    from app.db.search_index import rebuild_search_index
+
+    async with write_engine.begin() as conn:
+        count = await conn.run_sync(rebuild_search_index)
+    print(f"Indexed {count} documents")
+
+async def rebuild_vectors() -> None:
+    from sqlalchemy import delete
+    from app.db.vector_index import embeddings, vector_indexer
+
+    async with write_engine.begin() as conn:
+        await conn.execute(delete(embeddings))
+    count = await vector_indexer.backfill()
+    print(f"Embedded {count} rows")
+
+async def count_tokens(batch_size: int = 500) -> None:
+    from sqlalchemy import bindparam, literal_column, select, update
+    from app.models.conversation import Message
+    from app.services.tokens import count_tokens as count
+
+    table = Message.__table__
+    rowid = literal_column("rowid")
+    pending = select(rowid, table.c.id, table.c.content).where(table.c.token_count.is_(None)).order_by(rowid).limit(batch_size)
+    fill = update(table).where(table.c.id == bindparam("_id")).values(token_count=bindparam("_tokens"))
+
+    total = 0
+    last_rowid = 0
+    while True:
+        async with write_engine.begin() as conn:
+            rows = (await conn.execute(pending.where(rowid > last_rowid))).all()
+            if not rows:
+                break
+            await conn.execute(fill, [{"_id": row.id, "_tokens": count(row.content)} for row in rows])
+        total += len(rows)
+        last_rowid = rows[-1][0]
+    print(f"Counted tokens for {total} messages")
+
+COMMANDS = {
+    "rebuild-counters": rebuild_counters,
+    "recompress": recompress,
+    "rebuild-search": rebuild_search,
+    "rebuild-vectors": rebuild_vectors,
+    "count-tokens": count_tokens,
+}
+
+async def _main(command: str) -> None:
+    try:
+        await COMMANDS[command]()
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Knowledge Studio database maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    asyncio.run(_main(args.command))
+    sys.exit(0)
@@ -0,0 +1,136 @@
+"""
+Query plan checks for hot-path queries
+
+Every query that runs per chat turn or per list request is registered in
+HOT_QUERIES. `check_query_plans` runs EXPLAIN QUERY PLAN for each of them and
+reports any query that scans a table without an index or sorts through a
+temporary B-tree.
+
+Run against a scratch database migrated to head (exit code 1 on failure):
+
+    python -m app.db.query_plans
+"""
+import asyncio
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.sql import Executable
+
+from app.models.conversation import Conversation, Message
+from app.models.knowledge import KnowledgePoint, ExplorationLink
+
+_ID = "00000000-0000-0000-0000-000000000000"
+_NOW = datetime(2024, 1, 1)
+
+HOT_QUERIES: dict[str, Callable[[], Executable]] = {
+    "chat.history": lambda: (
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == _ID, Message.status == "complete")
+        .order_by(Message.created_at.asc())
+    ),
+    "chat.unfinished_streams": lambda: (
+        select(Message.id).where(Message.status == "streaming")
+    ),
+    "conversations.list": lambda: (
+        select(Conversation)
+        .order_by(Conversation.updated_at.desc())
+        .limit(50)
+    ),
+    "conversations.messages": lambda: (
+        select(Message)
+        .where(Message.conversation_id == _ID)
+        .order_by(Message.created_at.asc())
+    ),
+    "conversations.list_keyset": lambda: (
+        select(Conversation)
+        .where(tuple_(Conversation.updated_at, Conversation.id) < (_NOW, _ID))
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+        .limit(51)
+    ),
+    "conversations.messages_keyset": lambda: (
+        select(Message)
+        .where(Message.conversation_id == _ID)
+        .where(tuple_(Message.created_at, Message.id) < (_NOW, _ID))
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(51)
+    ),
+    "conversations.messages_in": lambda: (
+        select(Message).where(Message.conversation_id.in_([_ID, _ID]))
+    ),
+    "knowledge.by_conversation": lambda: (
+        select(KnowledgePoint).where(KnowledgePoint.conversation_id == _ID)
+    ),
+    "knowledge.by_message": lambda: (
+        select(KnowledgePoint).where(KnowledgePoint.message_id == _ID)
+    ),
+    "knowledge.by_topic": lambda: (
+        select(KnowledgePoint).where(KnowledgePoint.topic_id == _ID)
+    ),
+    "exploration.children": lambda: (
+        select(ExplorationLink).where(ExplorationLink.parent_conversation_id == _ID)
+    ),
+}
+
+def _plan_problems(plan_details: list[str]) -> list[str]:
+    problems = []
+    for detail in plan_details:
+        if detail.startswith("SCAN") and "USING" not in detail:
+            problems.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+def explain(connection, statement: Executable) -> list[str]:
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement (sync connection)"""
+    # 通过 before_cursor_execute 给最终 SQL 加前缀,参数仍由 SQLAlchemy 正常处理
+    def prefix(conn, cursor, sql, parameters, context, executemany):
+        return f"EXPLAIN QUERY PLAN {sql}", parameters
+
+    event.listen(connection, "before_cursor_execute", prefix, retval=True)
+    try:
+        rows = connection.execute(statement).all()
+    finally:
+        event.remove(connection, "before_cursor_execute", prefix)
+    return [row[-1] for row in rows]
+
+def check_query_plans(connection) -> dict[str, list[str]]:
+    """Map each hot query that does not use an index to its offending plan lines"""
+    failures = {}
+    for name, build in HOT_QUERIES.items():
+        problems = _plan_problems(explain(connection, build()))
+        if problems:
+            failures[name] = problems
+    return failures
+
+async def _main() -> int:
+    from alembic import command
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.db.database import alembic_config
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'plans.db'}")
+
+        def upgrade_and_check(connection):
+            cfg = alembic_config()
+            cfg.attributes["connection"] = connection
+            command.upgrade(cfg, "head")
+            return check_query_plans(connection)
+
+        async with engine.begin() as conn:
+            failures = await conn.run_sync(upgrade_and_check)
+        await engine.dispose()
+
+    for name in HOT_QUERIES:
+        status = "FAIL" if name in failures else "ok"
+        print(f"{status:4}  {name}")
+        for detail in failures.get(name, []):
+            print(f"      {detail}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
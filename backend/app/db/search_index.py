@@ -0,0 +1,277 @@
+"""
+Full-text search index (SQLite FTS5)
+
+`search_documents` maps each FTS rowid to the row it indexes; `search_fts`
+holds the text (title, body) and is created by migration 0005 with the
+tokenizer from KS_SEARCH_TOKENIZER. The index is maintained on the write
+path by mapper listeners (not SQL triggers): message bodies may be stored
+compressed, so only the ORM sees their text.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Sequence
+
+from sqlalchemy import and_, column, delete, event, func, insert, inspect, literal_column, or_, select, table, text
+from sqlalchemy.orm import object_session
+
+from app.config import config
+from app.models.conversation import Conversation, Message
+from app.models.knowledge import KnowledgePoint
+from app.models.search import SearchDocument
+
+documents = SearchDocument.__table__
+search_fts = table("search_fts", column("rowid"), column("title"), column("body"))
+
+# 标题命中权重高于正文
+BM25_WEIGHTS = (2.0, 1.0)
+SNIPPET_TOKENS = 24
+MARK_OPEN, MARK_CLOSE = "<mark>", "</mark>"
+
+def create_fts_sql(tokenizer: str) -> str:
+    return f"CREATE VIRTUAL TABLE search_fts USING fts5(title, body, tokenize='{tokenizer}')"
+
+def _knowledge_point_body(target: KnowledgePoint) -> str:
+    return "\n".join(part for part in (target.selected_text, target.notes) if part)
+
+# ============= Write path =============
+
+def _add_document(connection, kind: str, ref_id: str, conversation_id: str,
+                  created_at: Optional[datetime], title: str, body: str):
+    result = connection.execute(
+        insert(documents).values(kind=kind, ref_id=ref_id, conversation_id=conversation_id, created_at=created_at)
+    )
+    connection.execute(
+        insert(search_fts).values(rowid=result.inserted_primary_key[0], title=title, body=body)
+    )
+
+def _document_rowid(kind: str, ref_id: str):
+    return (
+        select(documents.c.id)
+        .where(documents.c.kind == kind, documents.c.ref_id == ref_id)
+        .scalar_subquery()
+    )
+
+def _update_document(connection, kind: str, ref_id: str, **values):
+    connection.execute(
+        search_fts.update().where(search_fts.c.rowid == _document_rowid(kind, ref_id)).values(**values)
+    )
+
+def _remove_documents(connection, *criteria):
+    rowids = select(documents.c.id).where(*criteria)
+    connection.execute(delete(search_fts).where(search_fts.c.rowid.in_(rowids)))
+    connection.execute(delete(documents).where(*criteria))
+
+def _changed(target, attribute: str) -> bool:
+    return inspect(target).attrs[attribute].history.has_changes()
+
+def _conversation_deleted(target, conversation_id) -> bool:
+    session = object_session(target)
+    if session is None:
+        return False
+    conversation = session.identity_map.get(session.identity_key(Conversation, conversation_id))
+    return conversation is not None and conversation in session.deleted
+
+@event.listens_for(Message, "after_insert")
+def _message_inserted(mapper, connection, target):
+    _add_document(connection, "message", target.id, target.conversation_id, target.created_at, "", target.content)
+
+@event.listens_for(Message, "after_update")
+def _message_updated(mapper, connection, target):
+    if _changed(target, "content"):
+        _update_document(connection, "message", target.id, body=target.content)
+
+@event.listens_for(Message, "after_delete")
+def _message_deleted(mapper, connection, target):
+    if not _conversation_deleted(target, target.conversation_id):
+        _remove_documents(connection, documents.c.kind == "message", documents.c.ref_id == target.id)
+
+@event.listens_for(Conversation, "after_insert")
+def _conversation_inserted(mapper, connection, target):
+    _add_document(connection, "conversation", target.id, target.id, target.created_at, target.title, "")
+
+@event.listens_for(Conversation, "after_update")
+def _conversation_updated(mapper, connection, target):
+    if _changed(target, "title"):
+        _update_document(connection, "conversation", target.id, title=target.title)
+
+@event.listens_for(Conversation, "after_delete")
+def _conversation_deleted_listener(mapper, connection, target):
+    _remove_documents(connection, documents.c.conversation_id == target.id)
+
+@event.listens_for(KnowledgePoint, "after_insert")
+def _knowledge_point_inserted(mapper, connection, target):
+    _add_document(
+        connection, "knowledge_point", target.id, target.conversation_id, target.created_at,
+        "", _knowledge_point_body(target)
+    )
+
+@event.listens_for(KnowledgePoint, "after_update")
+def _knowledge_point_updated(mapper, connection, target):
+    if _changed(target, "selected_text") or _changed(target, "notes"):
+        _update_document(connection, "knowledge_point", target.id, body=_knowledge_point_body(target))
+
+@event.listens_for(KnowledgePoint, "after_delete")
+def _knowledge_point_deleted(mapper, connection, target):
+    if not _conversation_deleted(target, target.conversation_id):
+        _remove_documents(connection, documents.c.kind == "knowledge_point", documents.c.ref_id == target.id)
+
+def rebuild_search_index(connection, batch_size: int = 1000) -> int:
+    """Drop and repopulate the whole index with the configured tokenizer (sync connection)"""
+    connection.exec_driver_sql("DROP TABLE IF EXISTS search_fts")
+    connection.exec_driver_sql(create_fts_sql(config.search_tokenizer))
+    connection.execute(delete(documents))
+
+    total = 0
+    sources = (
+        ("conversation", select(Conversation.id, Conversation.id.label("conversation_id"), Conversation.created_at, Conversation.title)),
+        ("message", select(Message.id, Message.conversation_id, Message.created_at, Message.content)),
+        ("knowledge_point", select(
+            KnowledgePoint.id, KnowledgePoint.conversation_id, KnowledgePoint.created_at,
+            KnowledgePoint.selected_text, KnowledgePoint.notes
+        )),
+    )
+    for kind, stmt in sources:
+        table_name = stmt.get_final_froms()[0].name
+        rowid = literal_column(f"{table_name}.rowid")
+        last_rowid = 0
+        while True:
+            rows = connection.execute(
+                stmt.add_columns(rowid).where(rowid > last_rowid).order_by(rowid).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                ref_id, conversation_id, created_at = row[0], row[1], row[2]
+                if kind == "conversation":
+                    title, body = row[3], ""
+                elif kind == "message":
+                    title, body = "", row[3]
+                else:
+                    title, body = "", "\n".join(part for part in (row[3], row[4]) if part)
+                _add_document(connection, kind, ref_id, conversation_id, created_at, title, body)
+            total += len(rows)
+            last_rowid = rows[-1][-1]
+    return total
+
+# ============= Query =============
+
+@dataclass
+class SearchHit:
+    kind: str
+    ref_id: str
+    conversation_id: str
+    conversation_title: str
+    created_at: Optional[datetime]
+    snippet: str
+    score: float
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def split_query(q: str) -> tuple[list[str], list[str]]:
+    """
+    Split a user query into FTS5 phrase terms and substring (LIKE) terms.
+
+    The trigram tokenizer cannot match terms shorter than three characters
+    (common for Chinese words like "索引"), so those fall back to LIKE.
+    """
+    terms = [term for term in q.split() if term]
+    if config.search_tokenizer.startswith("trigram"):
+        return [t for t in terms if len(t) >= 3], [t for t in terms if len(t) < 3]
+    return terms, []
+
+def _python_snippet(text_value: str, terms: Sequence[str], width: int = 40) -> str:
+    lowered = text_value.lower()
+    for term in terms:
+        index = lowered.find(term.lower())
+        if index >= 0:
+            start, end = max(0, index - width), min(len(text_value), index + len(term) + width)
+            return (
+                ("…" if start else "")
+                + text_value[start:index] + MARK_OPEN + text_value[index:index + len(term)] + MARK_CLOSE
+                + text_value[index + len(term):end]
+                + ("…" if end < len(text_value) else "")
+            )
+    return text_value[:width * 2]
+
+def build_search_query(
+    q: str,
+    *,
+    conversation_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    kinds: Optional[Sequence[str]] = None,
+    limit: int = 20,
+    offset: int = 0,
+):
+    match_terms, like_terms = split_query(q)
+    if not match_terms and not like_terms:
+        return None, like_terms
+
+    criteria = []
+    if conversation_id:
+        criteria.append(documents.c.conversation_id == conversation_id)
+    if project_id:
+        criteria.append(Conversation.project_id == project_id)
+    if since:
+        criteria.append(documents.c.created_at >= since)
+    if until:
+        criteria.append(documents.c.created_at < until)
+    if kinds:
+        criteria.append(documents.c.kind.in_(kinds))
+    for term in like_terms:
+        pattern = f"%{term}%"
+        criteria.append(or_(search_fts.c.title.like(pattern), search_fts.c.body.like(pattern)))
+
+    if match_terms:
+        criteria.append(text("search_fts MATCH :match").bindparams(match=" ".join(_quote(t) for t in match_terms)))
+        score = func.bm25(literal_column("search_fts"), *BM25_WEIGHTS)
+        snippet = func.snippet(literal_column("search_fts"), -1, MARK_OPEN, MARK_CLOSE, "…", SNIPPET_TOKENS)
+        order_by = (score,)
+    else:
+        score = literal_column("0.0")
+        snippet = func.coalesce(func.nullif(search_fts.c.body, ""), search_fts.c.title)
+        order_by = (documents.c.created_at.desc(),)
+
+    stmt = (
+        select(
+            documents.c.kind,
+            documents.c.ref_id,
+            documents.c.conversation_id,
+            Conversation.title,
+            documents.c.created_at,
+            snippet.label("snippet"),
+            score.label("score"),
+        )
+        .select_from(search_fts)
+        .join(documents, documents.c.id == search_fts.c.rowid)
+        .join(Conversation, Conversation.id == documents.c.conversation_id)
+        .where(and_(*criteria))
+        .order_by(*order_by)
+        .limit(limit)
+        .offset(offset)
+    )
+    return stmt, like_terms
+
+async def search(db, q: str, **filters) -> list[SearchHit]:
+    """BM25-ranked search with highlighted snippets"""
+    stmt, like_terms = build_search_query(q, **filters)
+    if stmt is None:
+        return []
+    rows = (await db.execute(stmt)).all()
+    hits = []
+    for row in rows:
+        snippet = row.snippet or ""
+        if like_terms and MARK_OPEN not in snippet:
+            snippet = _python_snippet(snippet, like_terms)
+        hits.append(SearchHit(
+            kind=row.kind,
+            ref_id=row.ref_id,
+            conversation_id=row.conversation_id,
+            conversation_title=row.title,
+            created_at=row.created_at,
+            snippet=snippet,
+            score=float(row.score),
+        ))
+    return hits
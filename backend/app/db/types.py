@@ -0,0 +1,120 @@
+"""
+Custom column types
+"""
+import uuid
+import zlib
+
+from sqlalchemy.types import LargeBinary, Text, TypeDecorator
+
+from app.config import config
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+# Header byte of a compressed body. Values stored as TEXT (every row written
+# before compression existed, and bodies under the threshold) have no header
+# and are returned unchanged.
+HEADER_RAW = b"\x00"
+HEADER_ZLIB = b"\x01"
+HEADER_ZSTD = b"\x02"
+
+def _compressor():
+    algorithm = config.compression_algorithm
+    if algorithm == "none":
+        return None
+    if algorithm in ("zstd", "auto") and zstandard is not None:
+        return HEADER_ZSTD, zstandard.ZstdCompressor(level=config.compression_level_zstd).compress
+    if algorithm == "zstd":
+        raise RuntimeError("KS_COMPRESSION_ALGORITHM=zstd but the zstandard package is not installed")
+    return HEADER_ZLIB, lambda data: zlib.compress(data, config.compression_level_zlib)
+
+def compress_text(value: str) -> str | bytes:
+    """Encode a body for storage: a header-prefixed blob when worth it, else the text itself"""
+    raw = value.encode("utf-8")
+    if len(raw) < config.compression_threshold_bytes:
+        return value
+    compressor = _compressor()
+    if compressor is None:
+        return value
+    header, compress = compressor
+    packed = compress(raw)
+    # 压缩收益不足 10% 时保留原文,读取时少一次解压
+    if len(packed) > len(raw) * 0.9:
+        return value
+    return header + packed
+
+def decompress_text(value: str | bytes) -> str:
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    header, body = value[:1], value[1:]
+    if header == HEADER_ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if header == HEADER_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Row is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+    if header == HEADER_RAW:
+        return body.decode("utf-8")
+    raise ValueError(f"Unknown compressed text header: {header!r}")
+
+class CompressedText(TypeDecorator):
+    """
+    Text column that transparently compresses large values.
+
+    Bodies of at least `compression_threshold_bytes` are stored as a BLOB of
+    one header byte (zlib or zstd) followed by the compressed UTF-8 bytes;
+    everything else stays plain TEXT, so old rows read back unchanged.
+    SQL-side string functions (LIKE, length, substr) do not see the text of
+    compressed rows.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress_text(value)
+
+class UUIDBlob(TypeDecorator):
+    """
+    UUID stored as its 16 raw bytes, exposed to Python as the canonical string.
+
+    Accepts any string `uuid.UUID` can parse (so lookups by an upper-case or
+    unhyphenated id still match); strings that are not UUIDs are bound
+    unchanged and simply match nothing.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    @property
+    def python_type(self):
+        return str
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        try:
+            return uuid.UUID(value).bytes
+        except (ValueError, AttributeError, TypeError):
+            return value
+
+    def bind_processor(self, dialect):
+        # 跳过 LargeBinary 自带的处理器:它会把非 UUID 字符串当作 bytes 包装而报错
+        def process(value):
+            return self.process_bind_param(value, dialect)
+        return process
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes) and len(value) == 16:
+            return str(uuid.UUID(bytes=value))
+        return value
@@ -0,0 +1,619 @@
+"""
+Local vector index for semantic search
+
+Embeddings of messages and knowledge points are stored as float32 blobs in
+the `embeddings` table and mirrored in memory as one contiguous matrix, so a
+query is a single matrix-vector product (cosine similarity of normalized
+vectors) followed by a top-k partition. Past `vector_ivf_threshold` vectors
+an IVF index (spherical k-means centroids) restricts each query to the rows
+of the `vector_ivf_probes` closest clusters.
+
+Indexing is incremental: mapper listeners collect changed rows during the
+flush and, once the transaction commits, a background task embeds them in
+batches. Rows written while the indexer was not running (scripts, a previous
+embedding model) are picked up by the catch-up pass on the next start.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlalchemy import and_, delete, event, inspect, literal_column, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, object_session
+
+from app.config import config
+from app.db.database import async_session_maker, read_session_maker
+from app.models.conversation import Conversation, Message
+from app.models.knowledge import KnowledgePoint
+from app.models.search import Embedding
+from app.services.embedding_service import get_embedder
+
+logger = logging.getLogger(__name__)
+
+embeddings = Embedding.__table__
+
+KINDS = ("message", "knowledge_point")
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+_GROWTH = 1.5
+_COMPACT_RATIO = 0.25  # 删除标记超过该比例时压缩矩阵
+
+Key = tuple[str, str]  # (kind, ref_id)
+
+@dataclass
+class VectorHit:
+    kind: str
+    ref_id: str
+    conversation_id: str
+    score: float
+
+def _knowledge_point_text(selected_text: Optional[str], notes: Optional[str]) -> str:
+    return "\n".join(part for part in (selected_text, notes) if part)
+
+# ============= IVF =============
+
+def train_centroids(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of (normalized) vectors"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), max(n_lists * 64, 10_000))
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+        empty = counts == 0
+        # 空聚类重新随机取一个样本点作为中心
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65_536) -> np.ndarray:
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        lists[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return lists
+
+class _IVF:
+    """Centroids plus the rows of each list, sorted by list for slicing"""
+
+    def __init__(self, centroids: np.ndarray, lists: np.ndarray):
+        self.centroids = centroids
+        self.built_size = len(lists)
+        self.order = np.argsort(lists, kind="stable").astype(np.int64)
+        self.offsets = np.searchsorted(lists[self.order], np.arange(len(centroids) + 1))
+
+    def candidates(self, query: np.ndarray, probes: int, lists: np.ndarray, size: int) -> np.ndarray:
+        probes = min(probes, len(self.centroids))
+        nearest = np.argpartition(self.centroids @ query, -probes)[-probes:]
+        parts = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in nearest]
+        if size > self.built_size:
+            # 建索引之后新增的行还没有排进 order,单独按所属聚类过滤
+            tail = np.arange(self.built_size, size)
+            parts.append(tail[np.isin(lists[self.built_size:size], nearest)])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+# ============= In-memory index =============
+
+class VectorIndex:
+    """
+    Append-only float32 matrix with tombstones.
+
+    Updates append a new row and tombstone the old one; the matrix is
+    compacted once tombstones pass `_COMPACT_RATIO`. Searches capture the
+    array references and the current size up front and can run in a worker
+    thread while the event loop keeps writing: appends only touch rows past
+    that size (or a reallocated array), removals only clear `_alive` and
+    `_keys` entries, which a search skips, and compaction swaps in new
+    arrays. Compaction moves rows, so it bumps `_generation`; an IVF trained
+    on an older generation is discarded.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._size = 0
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._kinds = np.zeros(0, dtype=np.int8)
+        self._conversations = np.zeros(0, dtype=np.int32)
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._keys: list[Optional[Key]] = []
+        self._positions: dict[Key, int] = {}
+        self._conversation_codes: dict[str, int] = {}
+        self._conversation_ids: list[str] = []
+        self._ivf: Optional[_IVF] = None
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @property
+    def ivf_lists(self) -> int:
+        return len(self._ivf.centroids) if self._ivf else 0
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        capacity = max(needed, int(capacity * _GROWTH) + 1024)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self._vectors = grow(self._vectors)
+        self._kinds = grow(self._kinds)
+        self._conversations = grow(self._conversations)
+        self._lists = grow(self._lists)
+        self._alive = grow(self._alive)
+
+    def _conversation_code(self, conversation_id: str) -> int:
+        code = self._conversation_codes.get(conversation_id)
+        if code is None:
+            code = self._conversation_codes[conversation_id] = len(self._conversation_ids)
+            self._conversation_ids.append(conversation_id)
+        return code
+
+    def add(self, items: Sequence[tuple[str, str, str]], vectors: np.ndarray):
+        """Insert or replace (kind, ref_id, conversation_id) rows"""
+        if not items:
+            return
+        self.remove([(kind, ref_id) for kind, ref_id, _ in items])
+        self._reserve(len(items))
+        start, end = self._size, self._size + len(items)
+        self._vectors[start:end] = vectors
+        self._kinds[start:end] = [_KIND_CODES[kind] for kind, _, _ in items]
+        self._conversations[start:end] = [self._conversation_code(cid) for _, _, cid in items]
+        self._lists[start:end] = assign_lists(vectors, self._ivf.centroids) if self._ivf else -1
+        self._alive[start:end] = True
+        for offset, (kind, ref_id, _) in enumerate(items):
+            self._keys.append((kind, ref_id))
+            self._positions[(kind, ref_id)] = start + offset
+        self._size = end
+
+    def remove(self, keys: Sequence[Key]):
+        for key in keys:
+            position = self._positions.pop(key, None)
+            if position is not None:
+                self._alive[position] = False
+                self._keys[position] = None
+        self._maybe_compact()
+
+    def remove_conversation(self, conversation_id: str):
+        code = self._conversation_codes.get(conversation_id)
+        if code is None:
+            return
+        rows = np.flatnonzero(self._alive[:self._size] & (self._conversations[:self._size] == code))
+        self.remove([self._keys[row] for row in rows])
+
+    def vector_of(self, key: Key) -> Optional[np.ndarray]:
+        position = self._positions.get(key)
+        return None if position is None else self._vectors[position].copy()
+
+    def _maybe_compact(self):
+        dead = self._size - len(self._positions)
+        if self._size < 1024 or dead < self._size * _COMPACT_RATIO:
+            return
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._vectors = self._vectors[keep]
+        self._kinds = self._kinds[keep]
+        self._conversations = self._conversations[keep]
+        self._lists = self._lists[keep]
+        self._alive = self._alive[keep]
+        self._keys = [self._keys[row] for row in keep]
+        self._positions = {key: row for row, key in enumerate(self._keys)}
+        self._size = len(keep)
+        self._generation += 1
+        if self._ivf is not None:
+            self._ivf = _IVF(self._ivf.centroids, self._lists[:self._size])
+
+    def needs_training(self) -> bool:
+        live = len(self._positions)
+        if live < config.vector_ivf_threshold:
+            return False
+        return self._ivf is None or live >= 2 * self._ivf.built_size
+
+    def train(self):
+        """(Re)build the IVF lists from the live vectors; call from a worker thread"""
+        generation, size = self._generation, self._size
+        vectors = self._vectors[:size]
+        live = vectors[self._alive[:size]]
+        n_lists = config.vector_ivf_lists or max(1, int(np.sqrt(len(live))))
+        centroids = train_centroids(live, n_lists)
+        return centroids, size, assign_lists(vectors, centroids), generation
+
+    def install_ivf(self, centroids: np.ndarray, trained_size: int, lists: np.ndarray, generation: int) -> bool:
+        """
+        Swap in a trained IVF (event loop); rows added during training are
+        assigned here. Returns False, leaving the index unchanged, when the
+        matrix was compacted during training and the lists no longer line up.
+        """
+        if generation != self._generation:
+            return False
+        self._lists[:trained_size] = lists
+        if self._size > trained_size:
+            self._lists[trained_size:self._size] = assign_lists(self._vectors[trained_size:self._size], centroids)
+        self._ivf = _IVF(centroids, self._lists[:self._size])
+        return True
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        kinds: Optional[Sequence[str]] = None,
+        conversation_id: Optional[str] = None,
+        exclude: Optional[Key] = None,
+    ) -> list[VectorHit]:
+        size, vectors, alive = self._size, self._vectors, self._alive
+        kind_codes, conversations, lists, ivf = self._kinds, self._conversations, self._lists, self._ivf
+        keys, conversation_ids = self._keys, self._conversation_ids
+
+        if conversation_id is not None:
+            code = self._conversation_codes.get(conversation_id)
+            if code is None:
+                return []
+            rows = np.flatnonzero(alive[:size] & (conversations[:size] == code))
+        elif ivf is not None:
+            rows = ivf.candidates(query, config.vector_ivf_probes, lists, size)
+            rows = rows[alive[rows]]
+        else:
+            rows = None
+
+        if rows is None:
+            scores = vectors[:size] @ query
+            mask = ~alive[:size]
+            if kinds:
+                mask |= ~np.isin(kind_codes[:size], [_KIND_CODES[kind] for kind in kinds])
+            scores[mask] = -np.inf
+            rows = np.arange(size)
+        else:
+            if kinds:
+                rows = rows[np.isin(kind_codes[rows], [_KIND_CODES[kind] for kind in kinds])]
+            scores = vectors[rows] @ query
+
+        k = min(k + (1 if exclude else 0), len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+
+        hits = []
+        for index in top:
+            score = float(scores[index])
+            row = rows[index]
+            key = keys[row] if row < len(keys) else None
+            if score == -np.inf or key is None or key == exclude:
+                continue
+            hits.append(VectorHit(
+                kind=key[0], ref_id=key[1],
+                conversation_id=conversation_ids[conversations[row]],
+                score=score,
+            ))
+        return hits[:k - (1 if exclude else 0)]
+
+# ============= Write path =============
+
+def _pending(target) -> Optional[dict]:
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault("vector_pending", {"upserts": {}, "removals": [], "conversations": []})
+
+def _changed(target, *attributes: str) -> bool:
+    state = inspect(target)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+def _queue_upsert(target, kind: str, text: str):
+    pending = _pending(target)
+    if pending is not None:
+        pending["upserts"][(kind, target.id)] = (target.conversation_id, text)
+
+def _queue_removal(connection, target, kind: str):
+    connection.execute(delete(embeddings).where(embeddings.c.kind == kind, embeddings.c.ref_id == target.id))
+    pending = _pending(target)
+    if pending is not None:
+        pending["upserts"].pop((kind, target.id), None)
+        pending["removals"].append((kind, target.id))
+
+@event.listens_for(Message, "after_insert")
+def _message_inserted(mapper, connection, target):
+    _queue_upsert(target, "message", target.content)
+
+@event.listens_for(Message, "after_update")
+def _message_updated(mapper, connection, target):
+    if _changed(target, "content"):
+        _queue_upsert(target, "message", target.content)
+
+@event.listens_for(Message, "after_delete")
+def _message_deleted(mapper, connection, target):
+    _queue_removal(connection, target, "message")
+
+@event.listens_for(KnowledgePoint, "after_insert")
+def _knowledge_point_inserted(mapper, connection, target):
+    _queue_upsert(target, "knowledge_point", _knowledge_point_text(target.selected_text, target.notes))
+
+@event.listens_for(KnowledgePoint, "after_update")
+def _knowledge_point_updated(mapper, connection, target):
+    if _changed(target, "selected_text", "notes"):
+        _queue_upsert(target, "knowledge_point", _knowledge_point_text(target.selected_text, target.notes))
+
+@event.listens_for(KnowledgePoint, "after_delete")
+def _knowledge_point_deleted(mapper, connection, target):
+    _queue_removal(connection, target, "knowledge_point")
+
+@event.listens_for(Conversation, "after_delete")
+def _conversation_deleted(mapper, connection, target):
+    connection.execute(delete(embeddings).where(embeddings.c.conversation_id == target.id))
+    pending = _pending(target)
+    if pending is not None:
+        pending["conversations"].append(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    pending = session.info.pop("vector_pending", None)
+    if pending:
+        vector_indexer.notify(pending)
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session):
+    session.info.pop("vector_pending", None)
+
+# ============= Background indexer =============
+
+_STOP = object()
+
+class VectorIndexer:
+    """Owns the in-memory index and keeps it (and the embeddings table) up to date"""
+
+    def __init__(self, session_maker=async_session_maker, reader_session_maker=read_session_maker):
+        self._session_maker = session_maker
+        self._reader_session_maker = reader_session_maker
+        self.index: Optional[VectorIndex] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._catch_up_task: Optional[asyncio.Task] = None
+        self._training = False
+        self._lock = asyncio.Lock()
+
+        # Counters
+        self._embedded = 0
+        self._batches = 0
+        self._searches = 0
+        self._last_search_ms = 0.0
+        self._max_search_ms = 0.0
+        self._catch_up_rows = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        embedder = get_embedder()
+        self.index = VectorIndex(embedder.dim)
+        await self._load(embedder.name)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="vector-indexer")
+        self._catch_up_task = asyncio.create_task(self._catch_up(), name="vector-catch-up")
+
+    async def stop(self):
+        if not self.running:
+            return
+        if self._catch_up_task is not None:
+            self._catch_up_task.cancel()
+            try:
+                await self._catch_up_task
+            except asyncio.CancelledError:
+                pass
+            self._catch_up_task = None
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def notify(self, pending: dict):
+        """Called after a commit with the rows it changed"""
+        if self.running:
+            self._queue.put_nowait(pending)
+
+    async def _load(self, model: str, batch_size: int = 10_000):
+        last_id = 0
+        async with self._reader_session_maker() as session:
+            while True:
+                rows = (await session.execute(
+                    select(embeddings.c.id, embeddings.c.kind, embeddings.c.ref_id,
+                           embeddings.c.conversation_id, embeddings.c.vector)
+                    .where(embeddings.c.model == model, embeddings.c.id > last_id)
+                    .order_by(embeddings.c.id)
+                    .limit(batch_size)
+                )).all()
+                if not rows:
+                    break
+                vectors = np.frombuffer(b"".join(row.vector for row in rows), dtype=np.float32)
+                self.index.add(
+                    [(row.kind, row.ref_id, row.conversation_id) for row in rows],
+                    vectors.reshape(len(rows), self.index.dim)
+                )
+                last_id = rows[-1].id
+        if self.index.needs_training():
+            self.index.install_ivf(*await asyncio.to_thread(self.index.train))  # nothing else writes yet
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            items = [item]
+            while not self._queue.empty() and len(items) < config.embedding_batch_size:
+                items.append(self._queue.get_nowait())
+
+            upserts: dict = {}
+            for pending in items:
+                if pending is _STOP:
+                    break
+                # 删除之前先把已经收集到的写入落盘,保证先插后删的顺序
+                if pending["removals"] or pending["conversations"]:
+                    await self._safely(self._upsert, upserts)
+                    upserts = {}
+                    await self._safely(self._remove, pending["removals"], pending["conversations"])
+                upserts.update(pending["upserts"])
+            await self._safely(self._upsert, upserts)
+            if _STOP in items:
+                return
+
+    async def _safely(self, fn, *args):
+        try:
+            await fn(*args)
+        except Exception:
+            logger.exception("Vector indexing failed; rows will be retried by the next catch-up pass")
+
+    async def _upsert(self, upserts: dict):
+        """Embed and store {(kind, ref_id): (conversation_id, text)}"""
+        if not upserts:
+            return
+        embedder = get_embedder()
+        keys = list(upserts)
+        for start in range(0, len(keys), config.embedding_batch_size):
+            chunk = keys[start:start + config.embedding_batch_size]
+            texts = [upserts[key][1] or "" for key in chunk]
+            vectors = await asyncio.to_thread(embedder.embed, texts)
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            rows = [
+                {"kind": kind, "ref_id": ref_id, "conversation_id": upserts[(kind, ref_id)][0],
+                 "model": embedder.name, "vector": vectors[i].tobytes()}
+                for i, (kind, ref_id) in enumerate(chunk)
+            ]
+            stmt = sqlite_insert(embeddings).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[embeddings.c.kind, embeddings.c.ref_id],
+                set_={
+                    "conversation_id": stmt.excluded.conversation_id,
+                    "model": stmt.excluded.model,
+                    "vector": stmt.excluded.vector,
+                },
+            )
+            async with self._lock:
+                async with self._session_maker() as session:
+                    await session.execute(stmt)
+                    await session.commit()
+                if self.index is not None:
+                    self.index.add([(kind, ref_id, upserts[(kind, ref_id)][0]) for kind, ref_id in chunk], vectors)
+            self._embedded += len(chunk)
+            self._batches += 1
+        self._maybe_train()
+
+    async def _remove(self, keys: list, conversation_ids: list):
+        async with self._lock:
+            # 删除事务提交前可能已经有向量被写入,这里再删一次
+            async with self._session_maker() as session:
+                for kind, ref_id in keys:
+                    await session.execute(
+                        delete(embeddings).where(embeddings.c.kind == kind, embeddings.c.ref_id == ref_id)
+                    )
+                for conversation_id in conversation_ids:
+                    await session.execute(delete(embeddings).where(embeddings.c.conversation_id == conversation_id))
+                await session.commit()
+            if self.index is not None:
+                self.index.remove(keys)
+                for conversation_id in conversation_ids:
+                    self.index.remove_conversation(conversation_id)
+
+    def _maybe_train(self):
+        if self.index is None or self._training or not self.index.needs_training():
+            return
+        self._training = True
+
+        async def train():
+            try:
+                # 训练期间矩阵被压缩时行号已经变了,丢弃结果重新训练
+                while self.index.needs_training():
+                    if self.index.install_ivf(*await asyncio.to_thread(self.index.train)):
+                        break
+            except Exception:
+                logger.exception("Vector IVF training failed")
+            finally:
+                self._training = False
+
+        asyncio.create_task(train(), name="vector-ivf-train")
+
+    async def _catch_up(self):
+        try:
+            await self.backfill()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Vector index catch-up failed")
+
+    async def backfill(self, batch_size: int = 500) -> int:
+        """Embed every message / knowledge point without a vector from the current model"""
+        model = get_embedder().name
+        sources = (
+            ("message", select(Message.id, Message.conversation_id, Message.content)),
+            ("knowledge_point", select(
+                KnowledgePoint.id, KnowledgePoint.conversation_id,
+                KnowledgePoint.selected_text, KnowledgePoint.notes
+            )),
+        )
+        total = 0
+        for kind, stmt in sources:
+            table_name = stmt.get_final_froms()[0].name
+            rowid = literal_column(f"{table_name}.rowid")
+            source_id = stmt.selected_columns[0]
+            stmt = stmt.add_columns(rowid).outerjoin(
+                embeddings,
+                and_(embeddings.c.kind == kind, embeddings.c.ref_id == source_id, embeddings.c.model == model)
+            ).where(embeddings.c.id.is_(None))
+            last_rowid = 0
+            while True:
+                async with self._reader_session_maker() as session:
+                    rows = (await session.execute(
+                        stmt.where(rowid > last_rowid).order_by(rowid).limit(batch_size)
+                    )).all()
+                if not rows:
+                    break
+                upserts = {}
+                for row in rows:
+                    text = row[2] if kind == "message" else _knowledge_point_text(row[2], row[3])
+                    upserts[(kind, row[0])] = (row[1], text)
+                await self._upsert(upserts)
+                total += len(rows)
+                self._catch_up_rows += len(rows)
+                last_rowid = rows[-1][-1]
+        return total
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return np.ascontiguousarray(get_embedder().embed([text])[0], dtype=np.float32)
+
+    async def search(self, query: np.ndarray, k: int, **filters) -> list[VectorHit]:
+        if self.index is None:
+            return []
+        started = time.perf_counter()
+        hits = await asyncio.to_thread(self.index.search, query, k, **filters)
+        elapsed = (time.perf_counter() - started) * 1000
+        self._searches += 1
+        self._last_search_ms = elapsed
+        self._max_search_ms = max(self._max_search_ms, elapsed)
+        return hits
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "vectors": len(self.index) if self.index is not None else 0,
+            "ivf_lists": self.index.ivf_lists if self.index is not None else 0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "embedded": self._embedded,
+            "batches": self._batches,
+            "catch_up_rows": self._catch_up_rows,
+            "searches": self._searches,
+            "last_search_ms": round(self._last_search_ms, 3),
+            "max_search_ms": round(self._max_search_ms, 3),
+        }
+
+vector_indexer = VectorIndexer()
@@ -0,0 +1,171 @@
+"""
+Group-commit write queue
+
+请求处理函数不再各自 commit,而是把待插入的 ORM 对象(Message、KnowledgePoint 等)
+交给 WriteQueue。后台任务在一个很短的时间/数量窗口内把多个请求的写入合并到同一个
+事务里提交,SQLite 每批只 fsync 一次;每个调用方的 future 在其数据落盘后完成。
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from app.config import config
+from app.db.database import async_session_maker
+
+@dataclass
+class _PendingWrite:
+    objects: tuple
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+_STOP = object()
+
+class WriteQueue:
+    """Async write-behind queue that batches inserts into shared transactions"""
+
+    def __init__(
+        self,
+        session_maker=async_session_maker,
+        max_batch_size: int = config.write_queue_max_batch_size,
+        max_latency_ms: float = config.write_queue_max_latency_ms,
+    ):
+        self._session_maker = session_maker
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters
+        self._batches = 0
+        self._rows = 0
+        self._requests = 0
+        self._failed_requests = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+        self._max_queue_depth = 0
+        self._max_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="write-queue")
+
+    async def stop(self):
+        """Flush everything still queued, then stop the worker"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, *objects: Any) -> tuple:
+        """
+        Queue ORM objects for insertion and wait until they are committed.
+
+        The objects are returned once durable; primary keys and column defaults
+        are populated. If the queue is not running (scripts, tools), the write
+        happens immediately in its own transaction.
+        """
+        if not self.running:
+            await self._write_one(objects)
+            return objects
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingWrite(objects=objects, future=future))
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        await future
+        return objects
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            rows = len(item.objects)
+            deadline = loop.time() + self.max_latency
+            while rows < self.max_batch_size:
+                remaining = deadline - loop.time()
+                try:
+                    if remaining > 0:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item.objects)
+
+            await self._commit_batch(batch, rows)
+
+    async def _commit_batch(self, batch: list[_PendingWrite], rows: int):
+        now = time.monotonic()
+        self._max_wait = max(self._max_wait, max(now - p.enqueued_at for p in batch))
+
+        try:
+            async with self._session_maker() as session:
+                for pending in batch:
+                    session.add_all(pending.objects)
+                await session.commit()
+        except Exception:
+            # 整批失败时逐个重试,避免一条坏数据拖垮同批的其他请求
+            for pending in batch:
+                try:
+                    await self._write_one(pending.objects)
+                except Exception as e:
+                    self._failed_requests += 1
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                    continue
+                self._record(1, len(pending.objects))
+                if not pending.future.done():
+                    pending.future.set_result(None)
+            return
+
+        self._record(len(batch), rows)
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_result(None)
+
+    async def _write_one(self, objects: tuple):
+        async with self._session_maker() as session:
+            session.add_all(objects)
+            await session.commit()
+
+    def _record(self, requests: int, rows: int):
+        self._batches += 1
+        self._requests += requests
+        self._rows += rows
+        self._last_batch_size = rows
+        self._max_batch_size_seen = max(self._max_batch_size_seen, rows)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self._max_queue_depth,
+            "batches": self._batches,
+            "requests": self._requests,
+            "rows": self._rows,
+            "failed_requests": self._failed_requests,
+            "last_batch_size": self._last_batch_size,
+            "max_batch_size": self._max_batch_size_seen,
+            "avg_batch_size": round(self._rows / self._batches, 2) if self._batches else 0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+# Process-wide queue, started in the app lifespan
+write_queue = WriteQueue()
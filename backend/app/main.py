@@ -7,8 +7,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
 
-from app.api import conversations, knowledge, models as models_api, chat, settings, spaces
-from app.db.database import init_db
+from app.api import conversations, knowledge, models as models_api, chat, chat_ws, settings, spaces, metrics, search, jobs
+from app.config import config
+from app.db import compression  # noqa: F401  (registers the compression.backfill job)
+from app.db.database import init_db, close_db
+from app.db.write_queue import write_queue
+from app.db.vector_index import vector_indexer
+from app.services.batch_runner import batch_runner
+from app.services.durable_stream import durable_streams
+from app.services.job_queue import LOW, job_queue
+from app.services.provider_clients import provider_clients
+from app.services.settings_cache import settings_cache
+from app.api.pagination import NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -17,9 +27,30 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting Knowledge Studio Backend...")
     await init_db()
     print("✅ Database initialized")
+    recovered = await durable_streams.recover()
+    if recovered:
+        print(f"⚠️  Marked {recovered} unfinished streamed replies as interrupted")
+    await write_queue.start()
+    await vector_indexer.start()
+    resumed = await batch_runner.recover()
+    if resumed:
+        print(f"🔁 Resumed {resumed} unfinished batch jobs")
+    await job_queue.start()
+    if config.compression_backfill_on_startup:
+        await job_queue.enqueue("compression.backfill", priority=LOW, dedup_key="compression.backfill")
+    if config.llm_warmup_on_startup:
+        provider_clients.start_warmup(await provider_clients.configured_targets())
     yield
     # Shutdown
     print("👋 Shutting down...")
+    await job_queue.stop()
+    await durable_streams.stop()
+    await batch_runner.stop()
+    await vector_indexer.stop()
+    await write_queue.stop()
+    await provider_clients.close()
+    settings_cache.close()
+    await close_db()
 
 app = FastAPI(
     title="Knowledge Studio API",
@@ -37,6 +68,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER],
 )
 
 # Include routers
@@ -44,8 +76,12 @@ app.include_router(conversations.router, prefix="/api/conversations", tags=["Con
 app.include_router(knowledge.router, prefix="/api/knowledge", tags=["Knowledge"])
 app.include_router(models_api.router, prefix="/api/models", tags=["Models"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
+app.include_router(chat_ws.router, prefix="/api/chat", tags=["Chat"])
 app.include_router(settings.router, prefix="/api/settings", tags=["Settings"])
 app.include_router(spaces.router, prefix="/api/spaces", tags=["Spaces"])
+app.include_router(search.router, prefix="/api/search", tags=["Search"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
 
 @app.get("/")
 async def root():
@@ -0,0 +1,60 @@
+"""
+Batch chat job models
+"""
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Float, Boolean, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.db.database import Base
+from app.db.ids import new_id
+from app.db.types import CompressedText, UUIDBlob
+
+class BatchJob(Base):
+    """
+    A set of prompts sent to one model by app.services.batch_runner. Jobs that
+    are queued or running when the process exits are resumed on startup.
+    """
+    __tablename__ = "batch_jobs"
+
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, complete, cancelled, failed
+    model_provider = Column(String(50), nullable=False)
+    model_name = Column(String(100), nullable=False)
+    temperature = Column(Float, nullable=False, default=0.7)
+    max_tokens = Column(Integer, nullable=True)
+    cache = Column(Boolean, nullable=True)
+    concurrency = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    items = relationship("BatchItem", back_populates="job", cascade="all, delete-orphan", order_by="BatchItem.position")
+
+    __table_args__ = (
+        Index("ix_batch_jobs_status", "status"),
+    )
+
+class BatchItem(Base):
+    __tablename__ = "batch_items"
+
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
+    job_id = Column(UUIDBlob, ForeignKey("batch_jobs.id"), nullable=False)
+    position = Column(Integer, nullable=False)
+    # Items with a conversation are answered with its history and saved to it, in order
+    conversation_id = Column(UUIDBlob, ForeignKey("conversations.id"), nullable=True)
+    content = Column(CompressedText, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, complete, failed, cancelled
+    result = Column(CompressedText, nullable=True)
+    error = Column(Text, nullable=True)
+    message_id = Column(UUIDBlob, nullable=True)  # saved assistant message, for items with a conversation
+    model_provider = Column(String(50), nullable=True)  # model that answered
+    model_name = Column(String(100), nullable=True)
+
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    job = relationship("BatchJob", back_populates="items")
+
+    __table_args__ = (
+        Index("ix_batch_items_job_id_position", "job_id", "position"),
+    )
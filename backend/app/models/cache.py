@@ -0,0 +1,31 @@
+"""
+Response cache model
+"""
+from sqlalchemy import Column, String, DateTime, Integer, Index, JSON
+
+from app.db.database import Base
+from app.db.types import CompressedText
+
+class ResponseCacheEntry(Base):
+    """
+    A completed LLM response keyed by the SHA-256 of the canonical request
+    (provider, model, messages, sampling parameters). Evicted by `expires_at`
+    and, past the size budget, least recently used first.
+    """
+    __tablename__ = "response_cache"
+
+    key = Column(String(64), primary_key=True)
+    provider = Column(String(50), nullable=False)
+    model_name = Column(String(100), nullable=False)
+    content = Column(CompressedText, nullable=False)
+    usage = Column(JSON, nullable=True)  # prompt_tokens / completion_tokens of the original call
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False)
+    last_used_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_response_cache_last_used_at_size_bytes", "last_used_at", "size_bytes"),
+        Index("ix_response_cache_expires_at", "expires_at"),
+    )
@@ -1,13 +1,17 @@
 """
 Conversation and Message models
 """
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum, Integer
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum, Integer, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
-import uuid
 
 from app.db.database import Base
+from app.db.ids import new_id
+from app.db.types import CompressedText, UUIDBlob
+
+# Length of Conversation.last_message_preview
+PREVIEW_LENGTH = 120
 
 class ModelProvider(str, enum.Enum):
     OPENAI = "openai"
@@ -18,27 +22,46 @@ class ModelProvider(str, enum.Enum):
 class Conversation(Base):
     __tablename__ = "conversations"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
     title = Column(String(255), nullable=False)
     model_provider = Column(Enum(ModelProvider), nullable=False)
     model_name = Column(String(100), nullable=False)
-    project_id = Column(String(36), ForeignKey("projects.id"), nullable=True)
+    project_id = Column(UUIDBlob, ForeignKey("projects.id"), nullable=True)
+
+    # Denormalized counters, maintained by app.db.counters on every message /
+    # knowledge point write; rebuild with `python -m app.db.maintenance rebuild-counters`
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    knowledge_point_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_preview = Column(String(PREVIEW_LENGTH), nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # last activity
 
     # Relationships
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     knowledge_points = relationship("KnowledgePoint", back_populates="conversation")
     project = relationship("Project", back_populates="conversations")
 
+    __table_args__ = (
+        # list_conversations: ORDER BY updated_at DESC
+        Index("ix_conversations_updated_at_id", "updated_at", "id"),
+        Index("ix_conversations_project_id", "project_id"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False)
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
+    conversation_id = Column(UUIDBlob, ForeignKey("conversations.id"), nullable=False)
     role = Column(String(20), nullable=False)  # user, assistant, system
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
+    token_count = Column(Integer, nullable=True)  # 写入时计算,见 app/services/tokens.py
+    # 实际生成该回复的模型(assistant 消息;发生回退或对冲时可能与对话的模型不同)
+    model_provider = Column(String(50), nullable=True)
+    model_name = Column(String(100), nullable=True)
+    # complete, streaming, failed, interrupted, superseded(被重新生成的回复取代);流式回复生成期间为 streaming,见 app/services/durable_stream.py
+    status = Column(String(20), nullable=False, default="complete", server_default="complete")
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -46,10 +69,17 @@ class Message(Base):
     conversation = relationship("Conversation", back_populates="messages")
     knowledge_points = relationship("KnowledgePoint", back_populates="message")
 
+    __table_args__ = (
+        # 每轮对话都会按 conversation_id 读取并按 created_at 排序;id 用于 keyset 分页
+        Index("ix_messages_conversation_id_created_at_id", "conversation_id", "created_at", "id"),
+        # 启动时查找上次未完成的流式回复;部分索引只包含这些行
+        Index("ix_messages_streaming", "status", sqlite_where=text("status = 'streaming'")),
+    )
+
 class Project(Base):
     __tablename__ = "projects"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     color = Column(String(7), default="#6366f1")  # Hex color
@@ -0,0 +1,41 @@
+"""
+Background job model
+"""
+from sqlalchemy import Column, String, Text, DateTime, Integer, Index, JSON, text
+from datetime import datetime
+
+from app.db.database import Base
+from app.db.ids import new_id
+from app.db.types import UUIDBlob
+
+class BackgroundJob(Base):
+    """
+    Deferred work run by app.services.job_queue. A job is claimed by setting
+    it running with `locked_until` (its visibility timeout); jobs whose lease
+    expired, e.g. after a crash, go back to the queue.
+    """
+    __tablename__ = "background_jobs"
+
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
+    kind = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=True)
+    priority = Column(Integer, nullable=False, default=5)  # lower runs first
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done, failed, superseded
+    # At most one queued job per key; a new one can be queued while it runs
+    dedup_key = Column(String(255), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_at = Column(DateTime, nullable=False)  # not before (retry backoff, delayed jobs)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_background_jobs_ready", "priority", "run_at", sqlite_where=text("status = 'queued'")),
+        Index("ix_background_jobs_leased", "locked_until", sqlite_where=text("status = 'running'")),
+        Index("ix_background_jobs_dedup_key", "dedup_key", unique=True, sqlite_where=text("status = 'queued'")),
+        Index("ix_background_jobs_finished_at", "finished_at"),
+    )
@@ -1,13 +1,14 @@
 """
 Knowledge Point models
 """
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum, Integer, JSON
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum, Integer, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
-import uuid
 
 from app.db.database import Base
+from app.db.ids import new_id
+from app.db.types import CompressedText, UUIDBlob
 
 class UnderstandingLevel(str, enum.Enum):
     NOT_UNDERSTOOD = "not_understood"
@@ -17,9 +18,9 @@ class UnderstandingLevel(str, enum.Enum):
 class KnowledgePoint(Base):
     __tablename__ = "knowledge_points"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False)
-    message_id = Column(String(36), ForeignKey("messages.id"), nullable=False)
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
+    conversation_id = Column(UUIDBlob, ForeignKey("conversations.id"), nullable=False)
+    message_id = Column(UUIDBlob, ForeignKey("messages.id"), nullable=False)
 
     # Annotation content
     selected_text = Column(Text, nullable=False)
@@ -30,11 +31,11 @@ class KnowledgePoint(Base):
     understanding_level = Column(Enum(UnderstandingLevel), nullable=False)
 
     # User notes
-    notes = Column(Text, nullable=True)
+    notes = Column(CompressedText, nullable=True)
     questions = Column(JSON, nullable=True)  # List of questions
 
     # Topic relationship
-    topic_id = Column(String(36), ForeignKey("topics.id"), nullable=True)
+    topic_id = Column(UUIDBlob, ForeignKey("topics.id"), nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -49,13 +50,19 @@ class KnowledgePoint(Base):
         back_populates="knowledge_point"
     )
 
+    __table_args__ = (
+        Index("ix_knowledge_points_conversation_id", "conversation_id"),
+        Index("ix_knowledge_points_message_id", "message_id"),
+        Index("ix_knowledge_points_topic_id", "topic_id"),
+    )
+
 class ExplorationLink(Base):
     __tablename__ = "exploration_links"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    parent_conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False)
-    child_conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False)
-    knowledge_point_id = Column(String(36), ForeignKey("knowledge_points.id"), nullable=False)
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
+    parent_conversation_id = Column(UUIDBlob, ForeignKey("conversations.id"), nullable=False)
+    child_conversation_id = Column(UUIDBlob, ForeignKey("conversations.id"), nullable=False)
+    knowledge_point_id = Column(UUIDBlob, ForeignKey("knowledge_points.id"), nullable=False)
 
     depth = Column(Integer, default=1)  # Exploration depth
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -63,10 +70,16 @@ class ExplorationLink(Base):
     # Relationships
     knowledge_point = relationship("KnowledgePoint", back_populates="parent_links")
 
+    __table_args__ = (
+        Index("ix_exploration_links_parent_conversation_id", "parent_conversation_id"),
+        Index("ix_exploration_links_child_conversation_id", "child_conversation_id"),
+        Index("ix_exploration_links_knowledge_point_id", "knowledge_point_id"),
+    )
+
 class Topic(Base):
     __tablename__ = "topics"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     color = Column(String(7), default="#6366f1")
@@ -0,0 +1,47 @@
+"""
+Search index models (full-text and semantic)
+"""
+from sqlalchemy import Column, String, DateTime, Integer, Index, LargeBinary
+
+from app.db.database import Base
+from app.db.types import UUIDBlob
+
+class SearchDocument(Base):
+    """
+    One searchable document (a message, a conversation title or a knowledge
+    point). `id` is the rowid of the matching row in the `search_fts` FTS5
+    table, which holds the text itself and is created by migration, not by
+    the ORM.
+    """
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # message, conversation, knowledge_point
+    ref_id = Column(UUIDBlob, nullable=False)
+    conversation_id = Column(UUIDBlob, nullable=False)
+    created_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ux_search_documents_kind_ref_id", "kind", "ref_id", unique=True),
+        Index("ix_search_documents_conversation_id_created_at", "conversation_id", "created_at"),
+    )
+
+class Embedding(Base):
+    """
+    Embedding vector of a message or knowledge point, stored as raw float32
+    bytes. Rows whose `model` differs from the configured embedder are
+    re-embedded in the background.
+    """
+    __tablename__ = "embeddings"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)  # message, knowledge_point
+    ref_id = Column(UUIDBlob, nullable=False)
+    conversation_id = Column(UUIDBlob, nullable=False)
+    model = Column(String(100), nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("ux_embeddings_kind_ref_id", "kind", "ref_id", unique=True),
+        Index("ix_embeddings_conversation_id", "conversation_id"),
+    )
@@ -1,17 +1,18 @@
 """
 Settings and Model Configuration models
 """
-from sqlalchemy import Column, String, Text, DateTime, Boolean, JSON
+from sqlalchemy import Column, String, Text, DateTime, Boolean, JSON, Integer
 from datetime import datetime
-import uuid
 
 from app.db.database import Base
+from app.db.ids import new_id
+from app.db.types import UUIDBlob
 
 class ModelConfig(Base):
     """用户配置的 LLM 模型"""
     __tablename__ = "model_configs"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
 
     # 模型标识
     name = Column(String(255), nullable=False)  # 用户自定义名称,如 "我的 GPT-4"
@@ -39,7 +40,7 @@ class AppSettings(Base):
     """应用全局设置"""
     __tablename__ = "app_settings"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
 
     # 设置键值
     key = Column(String(255), unique=True, nullable=False)  # 设置键,如 "theme", "language"
@@ -58,7 +59,7 @@ class APIKeyStorage(Base):
     """API Key 加密存储"""
     __tablename__ = "api_key_storage"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
 
     # 标识
     provider = Column(String(50), nullable=False, unique=True)  # openai, anthropic, google 等
@@ -73,3 +74,10 @@ class APIKeyStorage(Base):
     # 元数据
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SettingsRevision(Base):
+    """设置表的修改计数(单行),由触发器在上面三张表每次写入后递增"""
+    __tablename__ = "settings_revision"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)
@@ -2,17 +2,18 @@
 Knowledge Space model
 """
 from datetime import datetime
-import uuid
 
 from sqlalchemy import Column, String, Text, DateTime
 
 from app.db.database import Base
+from app.db.ids import new_id
+from app.db.types import UUIDBlob
 
 
 class KnowledgeSpace(Base):
     __tablename__ = "knowledge_spaces"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(UUIDBlob, primary_key=True, default=new_id)
     name = Column(String(255), nullable=False, unique=True)
     description = Column(Text, nullable=True)
     color = Column(String(7), default="#0ea5e9")
@@ -0,0 +1,354 @@
+"""
+Batch chat jobs
+
+POST /api/chat/batch 提交的一组提示词作为一个任务在后台运行,和提交请求的连接无关:
+
+- 每个任务最多 concurrency 个 worker,所有任务同时调用模型的条目总数不超过 batch_max_concurrency;
+  模型调用以 BACKGROUND 优先级经过 llm_scheduler,交互式对话始终排在前面,rpm / tpm 限额照常生效;
+- 属于同一个对话的条目按顺序执行(后一条能看到前一条的回复),其余条目并行;
+- 每个条目的状态和结果写入 batch_items,客户端可以轮询任务,也可以订阅条目完成事件;
+- 被限流(LLMRateLimited)的条目按 Retry-After 等待后重试,最多 batch_item_retries 次;
+- 进程退出时未完成的任务在下次启动时继续,执行到一半的条目重新执行:模型可能被重复调用,但条目的
+  结果和写入对话的消息在同一个事务里提交,不会重复写入对话。请求里的 api_key 不落盘,恢复的任务
+  使用设置中的密钥。
+"""
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from sqlalchemy import select, update
+
+from app.config import config
+from app.db.database import async_session_maker, read_session_maker
+from app.db.write_queue import write_queue
+from app.models.batch import BatchItem, BatchJob
+from app.models.conversation import Message
+from app.services.context_window import context_window
+from app.services.history_cache import History, history_cache
+from app.services.llm_scheduler import BACKGROUND, LLMRateLimited
+from app.services.model_router import model_router
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("complete", "failed", "cancelled")
+
+@dataclass
+class JobProgress:
+    """Finished-item events of a running job, shared by all subscribers"""
+    job_id: str
+    events: list[Dict[str, Any]] = field(default_factory=list)
+    final: Optional[Dict[str, Any]] = None
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def add(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, final: Dict[str, Any]) -> None:
+        self.final = final
+        self._notify()
+
+    def _notify(self) -> None:
+        updated, self.updated = self.updated, asyncio.Event()
+        updated.set()
+
+def _item_event(item_id: str, position: int, values: Dict[str, Any]) -> Dict[str, Any]:
+    event = {"type": "item", "item_id": item_id, "position": position}
+    event.update((k, v) for k, v in values.items() if k not in ("started_at", "finished_at"))
+    return event
+
+class BatchRunner:
+    """Runs batch chat jobs in background tasks with a bounded number of concurrent model calls"""
+
+    def __init__(self):
+        self._jobs: dict[str, JobProgress] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._cancelling: set[str] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running_items = 0
+
+        # Counters
+        self._started = 0
+        self._completed_items = 0
+        self._failed_items = 0
+        self._retries = 0
+
+    async def submit(self, job: BatchJob, api_key: Optional[str] = None) -> None:
+        """保存任务和条目(job.items)并开始在后台运行"""
+        await write_queue.submit(job)
+        self._start(job.id, api_key)
+
+    def _start(self, job_id: str, api_key: Optional[str]) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(config.batch_max_concurrency)
+        self._jobs[job_id] = JobProgress(job_id=job_id)
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, api_key))
+        self._started += 1
+
+    async def _run(self, job_id: str, api_key: Optional[str]) -> None:
+        progress = self._jobs[job_id]
+        try:
+            async with read_session_maker() as session:
+                job = await session.get(BatchJob, job_id)
+                if job is None:
+                    progress.finish({"type": "error", "job_id": job_id, "error": "Batch job not found"})
+                    return
+                items = (await session.execute(
+                    select(BatchItem).where(BatchItem.job_id == job_id).order_by(BatchItem.position)
+                )).scalars().all()
+                session.expunge_all()
+
+            # 同一个对话的条目按顺序放在一组
+            groups: dict[Any, list[BatchItem]] = {}
+            for item in items:
+                if item.status in FINISHED:
+                    progress.add(_item_event(item.id, item.position, {
+                        "status": item.status, "result": item.result, "error": item.error,
+                        "message_id": item.message_id,
+                        "model_provider": item.model_provider, "model_name": item.model_name,
+                    }))
+                else:
+                    groups.setdefault(item.conversation_id or item.id, []).append(item)
+            await self._update_job(job_id, status="running")
+
+            chain = await model_router.chain(job.model_provider, job.model_name, api_key)
+            pending = list(groups.values())
+            workers = [
+                asyncio.create_task(self._worker(job, chain, pending, progress))
+                for _ in range(min(job.concurrency, len(pending)))
+            ]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            await self._update_job(job_id, status="complete", finished_at=datetime.utcnow())
+            progress.finish({"type": "done", "job_id": job_id, "status": "complete", **self._counts(progress)})
+        except asyncio.CancelledError:
+            # 进程退出时任务保持 running,下次启动继续;用户取消时剩余条目标记为 cancelled
+            if job_id in self._cancelling:
+                await self._cancel_remaining(job_id)
+                progress.finish({"type": "done", "job_id": job_id, "status": "cancelled", **self._counts(progress)})
+            raise
+        except Exception as e:
+            logger.exception("Batch job %s failed", job_id)
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(BatchItem)
+                    .where(BatchItem.job_id == job_id, BatchItem.status.not_in(FINISHED))
+                    .values(status="failed", error=str(e), finished_at=datetime.utcnow())
+                )
+                await session.commit()
+            await self._update_job(job_id, status="failed", finished_at=datetime.utcnow())
+            progress.finish({"type": "error", "job_id": job_id, "error": str(e)})
+        finally:
+            self._cancelling.discard(job_id)
+            self._jobs.pop(job_id, None)
+            self._tasks.pop(job_id, None)
+
+    async def _worker(self, job: BatchJob, chain: list, pending: list[list[BatchItem]], progress: JobProgress) -> None:
+        while pending:
+            for item in pending.pop(0):
+                async with self._slots:
+                    self._running_items += 1
+                    try:
+                        values = await self._run_item(job, chain, item)
+                    finally:
+                        self._running_items -= 1
+                progress.add(_item_event(item.id, item.position, values))
+
+    async def _run_item(self, job: BatchJob, chain: list, item: BatchItem) -> Dict[str, Any]:
+        await self._update_item(item.id, status="running", started_at=datetime.utcnow())
+        messages_to_save: tuple = ()
+        try:
+            if item.conversation_id is not None:
+                async with read_session_maker() as session:
+                    history = await history_cache.get(session, item.conversation_id)
+            else:
+                history = History()
+            messages = await context_window.build_prompt(
+                history,
+                [{"role": "user", "content": item.content}],
+                job.model_provider,
+                job.model_name,
+                max_tokens=job.max_tokens
+            )
+
+            for attempt in range(config.batch_item_retries + 1):
+                try:
+                    response, target = await model_router.completion(
+                        chain,
+                        messages,
+                        temperature=job.temperature,
+                        max_tokens=job.max_tokens,
+                        cache=job.cache,
+                        priority=BACKGROUND
+                    )
+                    break
+                except LLMRateLimited as e:
+                    if attempt == config.batch_item_retries:
+                        raise
+                    self._retries += 1
+                    await asyncio.sleep(e.retry_after)
+
+            content = response.choices[0].message.content
+            values = {
+                "status": "complete", "result": content,
+                "model_provider": target.provider, "model_name": target.model_name,
+            }
+            if item.conversation_id is not None:
+                user_message = Message(
+                    conversation_id=item.conversation_id,
+                    role="user",
+                    content=item.content,
+                    created_at=datetime.utcnow()
+                )
+                assistant_message = Message(
+                    conversation_id=item.conversation_id,
+                    role="assistant",
+                    content=content,
+                    model_provider=target.provider,
+                    model_name=target.model_name,
+                    created_at=datetime.utcnow()
+                )
+                messages_to_save = (user_message, assistant_message)
+            self._completed_items += 1
+        except Exception as e:
+            logger.warning("Batch item %s failed: %s", item.id, e)
+            values = {"status": "failed", "error": str(e)}
+            self._failed_items += 1
+        values["finished_at"] = datetime.utcnow()
+        async with async_session_maker() as session:
+            if messages_to_save:
+                session.add_all(messages_to_save)
+                await session.flush()
+                values["message_id"] = messages_to_save[-1].id
+            await session.execute(update(BatchItem).where(BatchItem.id == item.id).values(**values))
+            await session.commit()
+        return values
+
+    async def _update_item(self, item_id: str, **values) -> None:
+        async with async_session_maker() as session:
+            await session.execute(update(BatchItem).where(BatchItem.id == item_id).values(**values))
+            await session.commit()
+
+    async def _update_job(self, job_id: str, **values) -> None:
+        async with async_session_maker() as session:
+            await session.execute(update(BatchJob).where(BatchJob.id == job_id).values(**values))
+            await session.commit()
+
+    async def _cancel_remaining(self, job_id: str) -> None:
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            await session.execute(
+                update(BatchItem)
+                .where(BatchItem.job_id == job_id, BatchItem.status.not_in(FINISHED))
+                .values(status="cancelled", finished_at=now)
+            )
+            await session.execute(
+                update(BatchJob).where(BatchJob.id == job_id).values(status="cancelled", finished_at=now)
+            )
+            await session.commit()
+
+    @staticmethod
+    def _counts(progress: JobProgress) -> Dict[str, int]:
+        counts = Counter(event["status"] for event in progress.events)
+        return {"completed": counts["complete"], "failed": counts["failed"]}
+
+    def active(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务:正在执行的条目中止,未完成的条目标记为 cancelled"""
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        self._cancelling.add(job_id)
+        task.cancel()
+        return True
+
+    async def events(self, job_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        订阅任务进度:每个已完成的条目一个 item 事件(先补发订阅前完成的),最后一个事件是 done 或 error
+        """
+        progress = self._jobs.get(job_id)
+        if progress is None:
+            async for event in self._stored_events(job_id):
+                yield event
+            return
+
+        index = 0
+        while True:
+            updated = progress.updated
+            while index < len(progress.events):
+                yield progress.events[index]
+                index += 1
+            if progress.final is not None:
+                yield progress.final
+                return
+            await updated.wait()
+
+    async def _stored_events(self, job_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        async with read_session_maker() as session:
+            job = await session.get(BatchJob, job_id)
+            if job is None:
+                yield {"type": "error", "error": "Batch job not found"}
+                return
+            items = (await session.execute(
+                select(BatchItem).where(BatchItem.job_id == job_id).order_by(BatchItem.position)
+            )).scalars().all()
+        counts = Counter()
+        for item in items:
+            if item.status in FINISHED:
+                counts[item.status] += 1
+                yield _item_event(item.id, item.position, {
+                    "status": item.status, "result": item.result, "error": item.error,
+                    "message_id": item.message_id,
+                    "model_provider": item.model_provider, "model_name": item.model_name,
+                })
+        yield {
+            "type": "done", "job_id": job_id, "status": job.status,
+            "completed": counts["complete"], "failed": counts["failed"],
+        }
+
+    async def recover(self) -> int:
+        """启动时继续上次进程退出前没有完成的任务"""
+        async with async_session_maker() as session:
+            job_ids = (await session.execute(
+                select(BatchJob.id).where(BatchJob.status.in_(("queued", "running")))
+            )).scalars().all()
+            if job_ids:
+                await session.execute(
+                    update(BatchItem)
+                    .where(BatchItem.job_id.in_(job_ids), BatchItem.status == "running")
+                    .values(status="pending", started_at=None)
+                )
+                await session.commit()
+        for job_id in job_ids:
+            self._start(job_id, None)
+        return len(job_ids)
+
+    async def stop(self) -> None:
+        """停止所有任务,未完成的部分下次启动时继续"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "active_jobs": len(self._tasks),
+            "running_items": self._running_items,
+            "max_concurrency": config.batch_max_concurrency,
+            "jobs_started": self._started,
+            "items_completed": self._completed_items,
+            "items_failed": self._failed_items,
+            "rate_limit_retries": self._retries,
+        }
+
+batch_runner = BatchRunner()
@@ -0,0 +1,112 @@
+"""
+Context window manager
+
+按模型的上下文窗口把对话历史截取到 token 预算以内再发给模型。
+
+预算 = 上下文窗口 × context_safety_ratio − 为回复预留的 token(请求的 max_tokens 或
+context_reserve_tokens)− 本轮新消息。历史放得下时原样发送;放不下时按以下顺序保留:
+
+1. system 消息(context_pin_system);
+2. 被知识点引用的消息,从新到旧(context_keep_referenced);
+3. 从最新一条往前的连续窗口,直到下一条放不下为止。
+
+每条消息的 token 数在写入时算好(见 app/services/tokens.py),历史缓存里还记着 system 消息
+和被引用消息的位置,所以截取只访问保留下来的消息,与对话总长度无关。
+"""
+from typing import Optional
+
+from app.config import config
+from app.services.history_cache import History
+from app.services.llm_service import LLMService
+from app.services.settings_cache import settings_cache
+from app.services.tokens import count_tokens, message_tokens
+
+STRATEGIES = ("sliding_window", "full")
+
+class ContextWindowManager:
+    """Assembles prompts under each model's token budget"""
+
+    def __init__(self):
+        # Counters
+        self._prompts = 0
+        self._truncated = 0
+        self._dropped_messages = 0
+        self._prompt_tokens = 0
+
+    async def context_window(self, provider: str, model_name: str) -> int:
+        """模型配置的 extra_params.context_window 优先,其次是内置表和 LiteLLM"""
+        for entry in await settings_cache.model_configs(provider=provider, is_active=True):
+            if entry.model_id == model_name and entry.extra_params and entry.extra_params.get("context_window"):
+                return int(entry.extra_params["context_window"])
+        return LLMService.get_context_window(provider, model_name)
+
+    async def build_prompt(
+        self,
+        history: History,
+        new_messages: list[dict],
+        provider: str,
+        model_name: str,
+        max_tokens: Optional[int] = None,
+        strategy: Optional[str] = None,
+    ) -> list[dict]:
+        """历史中保留的消息(按原顺序)加上本轮新消息"""
+        strategy = strategy or config.context_strategy
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown context strategy: {strategy}")
+
+        window = await self.context_window(provider, model_name)
+        new_tokens = sum(message_tokens(count_tokens(m["content"])) for m in new_messages)
+        budget = int(window * config.context_safety_ratio) - (max_tokens or config.context_reserve_tokens) - new_tokens
+
+        # 以下同步执行,期间历史不会被追加
+        n = len(history)
+        history_tokens = history.total_tokens + message_tokens(0) * n
+        if strategy == "full" or history_tokens <= budget:
+            self._record(0, history_tokens + new_tokens)
+            return history.messages + new_messages
+
+        kept = self._select(history, budget)
+        self._truncated += 1
+        used = sum(message_tokens(history.tokens[i]) for i in kept)
+        self._record(n - len(kept), used + new_tokens)
+        return [history.messages[i] for i in kept] + new_messages
+
+    def _select(self, history: History, budget: int) -> list[int]:
+        kept: set[int] = set()
+        used = 0
+
+        def keep(index: int) -> bool:
+            nonlocal used
+            cost = message_tokens(history.tokens[index])
+            if used + cost > budget:
+                return False
+            kept.add(index)
+            used += cost
+            return True
+
+        if config.context_pin_system:
+            for index in history.system_indexes:
+                keep(index)
+        if config.context_keep_referenced:
+            for index in sorted(history.referenced_indexes(), reverse=True):
+                keep(index)
+        for index in range(len(history) - 1, -1, -1):
+            if index not in kept and not keep(index):
+                break
+        return sorted(kept)
+
+    def _record(self, dropped: int, tokens: int) -> None:
+        self._prompts += 1
+        self._dropped_messages += dropped
+        self._prompt_tokens += tokens
+
+    def stats(self) -> dict:
+        return {
+            "strategy": config.context_strategy,
+            "prompts": self._prompts,
+            "truncated": self._truncated,
+            "dropped_messages": self._dropped_messages,
+            "prompt_tokens": self._prompt_tokens,
+        }
+
+context_window = ContextWindowManager()
@@ -0,0 +1,285 @@
+"""
+Durable streaming replies
+
+流式回复不再只活在响应生成器里:
+
+- assistant 消息在开始生成前就写入数据库(status=streaming),模型输出在后台任务中生成,
+  和客户端连接无关;
+- 输出按片段追加到列表里(不做字符串反复拼接),每隔 stream_checkpoint_interval_seconds 秒
+  或 stream_checkpoint_chars 个字符用独立的写会话把已生成的内容写回这条消息;
+- 结束时写入完整内容和最终状态(complete / failed),这一步经过 ORM,计数、搜索和向量索引、
+  历史缓存随之更新;中间的检查点直接 UPDATE 内容列,不触发这些监听器;
+- 客户端按字符偏移量订阅输出,断线后带着 Last-Event-ID(已收到的字符数)重新订阅即可接着读。
+  生成仍在进行时从内存读取,已经结束的从数据库读取;
+- 最后一个订阅者断开后 stream_disconnect_grace_seconds 秒内没有人重新订阅(或调用方主动停止),
+  取消生成并关闭上游连接,不再消耗模型 token;已生成的部分以 interrupted 状态保存。
+  省下的 token 数按回复上限减去已生成的部分估算;
+- 进程退出时仍在生成的消息同样标记为 interrupted(未能正常收尾的在下次启动时标记)。
+"""
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm.attributes import flag_modified
+
+from app.config import config
+from app.db.database import async_session_maker, read_session_maker
+from app.models.conversation import Message
+from app.services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 生成回复的回调:返回 (chunk 流, 完成时写入消息的列,如 model_provider / model_name)
+Producer = Callable[[], Awaitable[tuple[AsyncGenerator[Dict[str, Any], None], Dict[str, Any]]]]
+
+@dataclass
+class StreamBuffer:
+    """Output of one reply being generated, shared by all subscribers"""
+    message_id: str
+    parts: list[str] = field(default_factory=list)
+    length: int = 0
+    checkpointed: int = 0  # 已写入数据库的字符数
+    status: str = "streaming"
+    final: Optional[Dict[str, Any]] = None  # 结束事件
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+    subscribers: int = 0
+    budget: Optional[int] = None  # 回复的 token 上限,用于估算中断省下的 token
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def append(self, content: str) -> None:
+        self.parts.append(content)
+        self.length += len(content)
+        self._notify()
+
+    def finish(self, status: str, final: Dict[str, Any]) -> None:
+        self.status = status
+        self.final = final
+        self._notify()
+
+    def _notify(self) -> None:
+        updated, self.updated = self.updated, asyncio.Event()
+        updated.set()
+
+class DurableStreams:
+    """Runs streamed replies in background tasks and checkpoints them to the messages table"""
+
+    def __init__(self):
+        self._live: dict[str, StreamBuffer] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+        # Counters
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._checkpoints = 0
+        self._resumes = 0
+        self._interrupted = 0
+        self._tokens_saved = 0
+
+    def start(self, message_id: str, produce: Producer, budget: Optional[int] = None) -> StreamBuffer:
+        """开始在后台生成 message_id 的内容(消息已以 streaming 状态写入)"""
+        buffer = StreamBuffer(message_id=message_id, budget=budget)
+        self._live[message_id] = buffer
+        self._tasks[message_id] = asyncio.create_task(self._run(buffer, produce))
+        self._started += 1
+        return buffer
+
+    async def _run(self, buffer: StreamBuffer, produce: Producer) -> None:
+        values: Dict[str, Any] = {}
+        try:
+            try:
+                stream, values = await produce()
+                last_checkpoint = time.monotonic()
+                try:
+                    async for chunk in stream:
+                        if chunk.get("type") != "content":
+                            continue
+                        buffer.append(chunk.get("content", ""))
+                        if (
+                            buffer.length - buffer.checkpointed >= config.stream_checkpoint_chars
+                            or time.monotonic() - last_checkpoint >= config.stream_checkpoint_interval_seconds
+                        ):
+                            await self._checkpoint(buffer)
+                            last_checkpoint = time.monotonic()
+                finally:
+                    await stream.aclose()
+            except asyncio.CancelledError:
+                self._interrupted += 1
+                generated = estimate_tokens(buffer.text())
+                self._tokens_saved += max(0, (buffer.budget or config.context_reserve_tokens) - generated)
+                await self._finish(buffer, "interrupted", values, {"type": "interrupted", "message_id": buffer.message_id})
+                raise
+            except Exception as e:
+                logger.warning("Stream of message %s failed: %s", buffer.message_id, e)
+                final = {"type": "error", "error": str(e)}
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is not None:
+                    final["retry_after"] = math.ceil(retry_after)
+                await self._finish(buffer, "failed", values, final)
+            else:
+                await self._finish(buffer, "complete", values, {"type": "done", "message_id": buffer.message_id, **values})
+        finally:
+            self._live.pop(buffer.message_id, None)
+            self._tasks.pop(buffer.message_id, None)
+
+    async def _checkpoint(self, buffer: StreamBuffer) -> None:
+        content = buffer.text()
+        try:
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(Message.__table__)
+                    .where(Message.__table__.c.id == buffer.message_id)
+                    .values(content=content)
+                )
+                await session.commit()
+        except Exception:
+            # 检查点失败只影响断线后能恢复的内容,不中断生成
+            logger.exception("Failed to checkpoint message %s", buffer.message_id)
+            return
+        buffer.checkpointed = len(content)
+        self._checkpoints += 1
+
+    async def _finish(self, buffer: StreamBuffer, status: str, values: Dict[str, Any], final: Dict[str, Any]) -> None:
+        try:
+            async with async_session_maker() as session:
+                message = await session.get(Message, buffer.message_id)
+                if message is not None:
+                    message.content = buffer.text()
+                    # 内容可能和最后一个检查点相同,仍然要让监听器看到这次修改
+                    flag_modified(message, "content")
+                    message.status = status
+                    for name, value in values.items():
+                        setattr(message, name, value)
+                    await session.commit()
+        except Exception:
+            logger.exception("Failed to save message %s", buffer.message_id)
+            status, final = "failed", {"type": "error", "error": "Failed to save the reply"}
+        if status == "complete":
+            self._completed += 1
+        elif status == "failed":
+            self._failed += 1
+        buffer.finish(status, final)
+
+    def active(self, message_id: str) -> bool:
+        return message_id in self._live
+
+    def cancel(self, message_id: str) -> bool:
+        """停止生成;已生成的部分以 interrupted 状态保存"""
+        task = self._tasks.get(message_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def _unsubscribed(self, buffer: StreamBuffer) -> None:
+        buffer.subscribers -= 1
+        if buffer.subscribers > 0 or buffer.final is not None:
+            return
+        grace = config.stream_disconnect_grace_seconds
+        if grace <= 0:
+            self.cancel(buffer.message_id)
+        else:
+            asyncio.get_running_loop().call_later(grace, self._cancel_abandoned, buffer)
+
+    def _cancel_abandoned(self, buffer: StreamBuffer) -> None:
+        if buffer.subscribers == 0 and buffer.final is None:
+            logger.info("No client is reading message %s, cancelling generation", buffer.message_id)
+            self.cancel(buffer.message_id)
+
+    async def events(self, message_id: str, offset: int = 0) -> AsyncGenerator[tuple[int, Dict[str, Any]], None]:
+        """
+        从字符偏移量 offset 开始订阅回复,产出 (偏移量, 事件);偏移量是客户端收到该事件后
+        已有的字符数,用作 SSE 的事件 id。最后一个事件是 done 或 error。
+        """
+        if offset:
+            self._resumes += 1
+        buffer = self._live.get(message_id)
+        if buffer is None:
+            async for item in self._stored_events(message_id, offset):
+                yield item
+            return
+
+        # 客户端断开时响应任务被取消,生成器在 finally 中退订
+        buffer.subscribers += 1
+        try:
+            updated = buffer.updated
+            index = len(buffer.parts)
+            position = buffer.length
+            if offset < position:
+                yield position, {"content": "".join(buffer.parts[:index])[offset:]}
+            while True:
+                if index < len(buffer.parts):
+                    # 读得慢的订阅者一次拿到期间积累的全部片段,不会积压成大量小事件
+                    content = buffer.parts[index] if index + 1 == len(buffer.parts) else "".join(buffer.parts[index:])
+                    index = len(buffer.parts)
+                    position += len(content)
+                    if content:
+                        yield position, {"content": content}
+                    continue
+                if buffer.final is not None:
+                    yield position, buffer.final
+                    return
+                await updated.wait()
+                updated = buffer.updated
+        finally:
+            self._unsubscribed(buffer)
+
+    async def _stored_events(self, message_id: str, offset: int) -> AsyncGenerator[tuple[int, Dict[str, Any]], None]:
+        async with read_session_maker() as session:
+            row = (await session.execute(
+                select(Message.content, Message.status, Message.model_provider, Message.model_name)
+                .where(Message.id == message_id)
+            )).first()
+        if row is None:
+            yield offset, {"type": "error", "error": "Message not found"}
+            return
+        content = row.content or ""
+        if offset < len(content):
+            yield len(content), {"content": content[offset:]}
+        if row.status == "complete":
+            yield len(content), {
+                "type": "done", "message_id": message_id,
+                "model_provider": row.model_provider, "model_name": row.model_name,
+            }
+        elif row.status == "interrupted":
+            yield len(content), {"type": "interrupted", "message_id": message_id}
+        else:
+            yield len(content), {"type": "error", "error": "Stream did not complete", "status": row.status}
+
+    async def recover(self) -> int:
+        """启动时把上次进程退出前没有结束的流式回复标记为 interrupted"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                update(Message.__table__)
+                .where(Message.__table__.c.status == "streaming")
+                .values(status="interrupted")
+            )
+            await session.commit()
+        return result.rowcount or 0
+
+    async def stop(self) -> None:
+        """取消仍在生成的回复,已生成的部分以 interrupted 状态保存"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._live),
+            "started": self._started,
+            "completed": self._completed,
+            "failed": self._failed,
+            "interrupted": self._interrupted,
+            "tokens_saved_estimate": self._tokens_saved,
+            "checkpoints": self._checkpoints,
+            "resumes": self._resumes,
+        }
+
+durable_streams = DurableStreams()
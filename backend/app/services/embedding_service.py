@@ -0,0 +1,82 @@
+"""
+Embedding service
+
+语义搜索使用的文本向量化接口。默认的 HashingEmbedder 完全本地、确定性,
+不依赖任何模型文件;需要更好的效果时,可以通过 KS_EMBEDDING_MODEL 指定一个
+`module:factory`,factory 返回实现了 `name`、`dim`、`embed(texts)` 的对象
+(例如包装一个离线的 sentence-transformers 模型)。
+"""
+import hashlib
+import importlib
+import re
+from functools import lru_cache
+from typing import Protocol, Sequence
+
+import numpy as np
+
+from app.config import config
+
+class Embedder(Protocol):
+    name: str
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a float32 array of shape (len(texts), dim) with L2-normalized rows"""
+        ...
+
+_WORD = re.compile(r"[^\W\d_]+|\d+", re.UNICODE)
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+
+def _features(text: str) -> list[str]:
+    features = []
+    for word in _WORD.findall(text.lower()):
+        if _CJK.match(word):
+            # 中文没有空格分词,用单字和相邻双字作为特征
+            features.extend(word)
+            features.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            features.append(word)
+    return features
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+class HashingEmbedder:
+    """
+    Feature-hashing bag of words (signed, sublinear tf).
+
+    Deterministic across processes and machines, so stored vectors stay valid
+    between runs; captures lexical overlap rather than meaning.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+
+    def _bucket(self, feature: str) -> tuple[int, float]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return digest % self.dim, 1.0 if (digest >> 63) & 1 else -1.0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: dict[str, int] = {}
+            for feature in _features(text or ""):
+                counts[feature] = counts.get(feature, 0) + 1
+            for feature, count in counts.items():
+                bucket, sign = self._bucket(feature)
+                vectors[row, bucket] += sign * (1.0 + np.log(count))
+        return normalize(vectors)
+
+@lru_cache(maxsize=1)
+def get_embedder() -> Embedder:
+    """The configured embedder (created once per process)"""
+    spec = config.embedding_model
+    if spec == "hashing":
+        return HashingEmbedder(config.embedding_dim)
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"KS_EMBEDDING_MODEL must be 'hashing' or 'module:factory', got {spec!r}")
+    return getattr(importlib.import_module(module_name), attr)()
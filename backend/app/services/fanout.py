@@ -0,0 +1,167 @@
+"""
+Multi-model fan-out
+
+同一个问题同时发给多个模型对比回答:每个模型在自己的任务里流式生成,chunk 汇入同一个队列,
+由接口按到达顺序转成一个 SSE 流,每个事件带上模型的序号。总耗时取决于最慢的模型,而不是
+各模型耗时之和。
+
+每个模型完整结束后各自保存一条 assistant 消息;调用方可以中途取消单个模型,客户端断开时取消全部,
+被取消的模型已生成的部分以 interrupted 状态保存(和 durable_streams 一致),省下的 token 数按回复
+上限减去已生成的部分估算。
+"""
+import asyncio
+import logging
+import math
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+
+from app.config import config
+from app.services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class FanoutStream:
+    index: int
+    provider: str
+    model_name: str
+    task: Optional[asyncio.Task] = None
+    status: str = "pending"  # pending / streaming / done / failed / cancelled
+
+@dataclass
+class FanoutRun:
+    id: str
+    streams: list[FanoutStream]
+    events: asyncio.Queue = field(default_factory=asyncio.Queue)
+
+    def cancel(self, index: int) -> bool:
+        stream = self.streams[index]
+        if stream.task is None or stream.task.done():
+            return False
+        stream.task.cancel()
+        return True
+
+class FanoutRegistry:
+    """Active fan-out runs, so individual streams can be cancelled by id"""
+
+    def __init__(self):
+        self._runs: dict[str, FanoutRun] = {}
+
+        # Counters
+        self._started = 0
+        self._streams = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._tokens_saved = 0
+
+    def get(self, run_id: str) -> Optional[FanoutRun]:
+        return self._runs.get(run_id)
+
+    async def run(
+        self,
+        targets: list[tuple[str, str]],
+        produce: Callable[[FanoutStream], Awaitable[AsyncGenerator[Dict[str, Any], None]]],
+        finish: Callable[[FanoutStream, str, str], Awaitable[Dict[str, Any]]],
+        budget: Optional[int] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        并发运行 targets 中的每个 (provider, 模型),按到达顺序产出带 index 的事件。
+
+        produce(stream) 返回该模型的 chunk 流;finish(stream, 回答, 状态) 以 complete 或 interrupted
+        状态保存回答,返回附加到 done / cancelled 事件上的字段。budget 是回复的 token 上限,用于估算
+        取消省下的 token。第一个事件是 start(包含 run id),最后一个是 end。
+        """
+        run = FanoutRun(
+            id=str(uuid.uuid4()),
+            streams=[FanoutStream(index=i, provider=p, model_name=m) for i, (p, m) in enumerate(targets)]
+        )
+        self._runs[run.id] = run
+        self._started += 1
+        self._streams += len(run.streams)
+
+        async def pump(stream: FanoutStream) -> None:
+            parts = []
+            finishing = False
+            try:
+                stream.status = "streaming"
+                chunks = await produce(stream)
+                try:
+                    async for chunk in chunks:
+                        if chunk.get("type") == "content":
+                            content = chunk.get("content", "")
+                            parts.append(content)
+                            await run.events.put({"type": "content", "index": stream.index, "content": content})
+                finally:
+                    await chunks.aclose()
+                finishing = True
+                extra = await finish(stream, "".join(parts), "complete")
+                stream.status = "done"
+                self._completed += 1
+                await run.events.put({"type": "done", "index": stream.index, **extra})
+            except asyncio.CancelledError:
+                stream.status = "cancelled"
+                self._cancelled += 1
+                content = "".join(parts)
+                self._tokens_saved += max(0, (budget or config.context_reserve_tokens) - estimate_tokens(content))
+                event = {"type": "cancelled", "index": stream.index}
+                if content and not finishing:
+                    # 客户端断开时取消可能再次到达,shield 保证已生成的部分写完
+                    try:
+                        event.update(await asyncio.shield(finish(stream, content, "interrupted")))
+                    except Exception:
+                        logger.exception(
+                            "Failed to save interrupted fan-out reply of %s/%s", stream.provider, stream.model_name
+                        )
+                run.events.put_nowait(event)
+            except Exception as e:
+                stream.status = "failed"
+                self._failed += 1
+                logger.warning("Fan-out stream %s/%s failed: %s", stream.provider, stream.model_name, e)
+                await run.events.put({"type": "error", "index": stream.index, **_error_fields(e)})
+
+        try:
+            yield {
+                "type": "start",
+                "fanout_id": run.id,
+                "streams": [
+                    {"index": s.index, "model_provider": s.provider, "model_name": s.model_name} for s in run.streams
+                ],
+            }
+            for stream in run.streams:
+                stream.task = asyncio.create_task(pump(stream))
+            remaining = len(run.streams)
+            while remaining:
+                event = await run.events.get()
+                if event["type"] in ("done", "error", "cancelled"):
+                    remaining -= 1
+                yield event
+            yield {"type": "end"}
+        finally:
+            # 客户端断开(生成器被关闭)时取消仍在运行的模型;等待保存时可能再次被取消,先注销
+            self._runs.pop(run.id, None)
+            tasks = [s.task for s in run.streams if s.task is not None and not s.task.done()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._runs),
+            "runs": self._started,
+            "streams": self._streams,
+            "completed": self._completed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+            "tokens_saved_estimate": self._tokens_saved,
+        }
+
+def _error_fields(e: Exception) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {"error": str(e)}
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is not None:
+        fields["retry_after"] = math.ceil(retry_after)
+    return fields
+
+fanout_registry = FanoutRegistry()
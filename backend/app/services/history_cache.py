@@ -0,0 +1,275 @@
+"""
+Conversation history cache
+
+每轮对话都要把历史发给模型。HistoryCache 按对话缓存已经整理成 LLM 消息格式的历史
+(LRU,按估算的内存占用淘汰),热对话的一轮请求不再查询 messages 表。每个条目同时记录
+每条消息的 token 数、system 消息的位置和被知识点引用的消息,供上下文组装使用
+(见 app/services/context_window.py)。
+
+只包含已完成的消息(生成中或失败的流式回复不发给模型)。
+缓存只在写入提交后更新:新消息和生成完成(streaming → complete)的流式回复追加到已缓存的条目末尾,
+新增/删除知识点更新引用计数,编辑已完成的消息(包括标记为 superseded)、删除消息或删除对话时整条
+失效。加载期间如果该对话有新的提交,加载结果不会被缓存。
+"""
+import sys
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from app.config import config
+from app.models.conversation import Conversation, Message
+from app.models.knowledge import KnowledgePoint
+from app.services.tokens import count_tokens
+
+# 每条消息除正文外的大致开销(dict、role 字符串、各列表槽位、时间戳、id)
+_MESSAGE_OVERHEAD = 500
+
+def _message_size(content: str) -> int:
+    return sys.getsizeof(content) + _MESSAGE_OVERHEAD
+
+@dataclass
+class History:
+    """
+    One conversation's messages in created_at order, with parallel lists of
+    ids, timestamps and token counts. Read it synchronously (no awaits in
+    between); committed messages are appended in place.
+    """
+    messages: list[dict] = field(default_factory=list)
+    ids: list[str] = field(default_factory=list)
+    created_at: list[datetime] = field(default_factory=list)
+    tokens: list[int] = field(default_factory=list)
+    positions: dict[str, int] = field(default_factory=dict)
+    system_indexes: list[int] = field(default_factory=list)
+    referenced: Counter = field(default_factory=Counter)  # message id -> knowledge points
+    total_tokens: int = 0
+    size: int = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, message_id: str, role: str, content: str, created_at: datetime, token_count: Optional[int]) -> None:
+        if token_count is None:
+            token_count = count_tokens(content)
+        index = len(self.messages)
+        self.messages.append({"role": role, "content": content})
+        self.ids.append(message_id)
+        self.created_at.append(created_at)
+        self.tokens.append(token_count)
+        self.positions[message_id] = index
+        if role == "system":
+            self.system_indexes.append(index)
+        self.total_tokens += token_count
+        self.size += _message_size(content)
+
+    def referenced_indexes(self) -> list[int]:
+        return [self.positions[mid] for mid, count in self.referenced.items() if count > 0 and mid in self.positions]
+
+class HistoryCache:
+    """Bounded LRU of prompt-ready conversation histories"""
+
+    def __init__(self, max_bytes: int = config.history_cache_max_bytes):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, History] = OrderedDict()
+        self._size = 0
+        # 正在加载的对话 -> 加载期间是否有新的提交
+        self._loading: dict[str, bool] = {}
+
+        # Counters
+        self._hits = 0
+        self._misses = 0
+        self._appends = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    async def get(self, db: AsyncSession, conversation_id: str) -> History:
+        """The conversation's history; callers must not modify it"""
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            self._entries.move_to_end(conversation_id)
+            self._hits += 1
+            return entry
+
+        self._misses += 1
+        self._loading[conversation_id] = False
+        try:
+            result = await db.execute(
+                select(Message.id, Message.role, Message.content, Message.created_at, Message.token_count)
+                .where(Message.conversation_id == conversation_id, Message.status == "complete")
+                .order_by(Message.created_at.asc())
+            )
+            entry = History()
+            for row in result.all():
+                entry.append(*row)
+            result = await db.execute(
+                select(KnowledgePoint.message_id).where(KnowledgePoint.conversation_id == conversation_id)
+            )
+            entry.referenced.update(result.scalars().all())
+        finally:
+            changed = self._loading.pop(conversation_id, True)
+
+        if not changed:
+            self._store(conversation_id, entry)
+        return entry
+
+    def _store(self, conversation_id: str, entry: History) -> None:
+        if entry.size > self.max_bytes:
+            return
+        self.invalidate(conversation_id, count=False)
+        self._entries[conversation_id] = entry
+        self._size += entry.size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            self._evictions += 1
+
+    def _touch(self, conversation_id: str) -> Optional[History]:
+        if conversation_id in self._loading:
+            self._loading[conversation_id] = True
+        return self._entries.get(conversation_id)
+
+    def append(self, conversation_id: str, message_id: str, role: str, content: str,
+               created_at: datetime, token_count: Optional[int]) -> None:
+        """Apply a committed new message"""
+        entry = self._touch(conversation_id)
+        if entry is None:
+            return
+        if entry.created_at and created_at < entry.created_at[-1]:
+            # 并发写入乱序提交,按时间重新加载比在中间插入更简单
+            self.invalidate(conversation_id)
+            return
+        before = entry.size
+        entry.append(message_id, role, content, created_at, token_count)
+        self._size += entry.size - before
+        self._appends += 1
+        self._evict()
+
+    def reference(self, conversation_id: str, message_id: str, delta: int) -> None:
+        """Apply a committed knowledge point insert (+1) or delete (-1)"""
+        entry = self._touch(conversation_id)
+        if entry is not None:
+            entry.referenced[message_id] += delta
+
+    def invalidate(self, conversation_id: str, count: bool = True) -> None:
+        if conversation_id in self._loading:
+            self._loading[conversation_id] = True
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._size -= entry.size
+            if count:
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "appends": self._appends,
+            "invalidations": self._invalidations,
+            "evictions": self._evictions,
+        }
+
+history_cache = HistoryCache()
+
+# ============= Write path =============
+
+def _pending(target) -> Optional[list]:
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault("history_pending", [])
+
+def _changed(target, *attributes: str) -> bool:
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+@event.listens_for(Message, "after_insert")
+def _message_inserted(mapper, connection, target):
+    if target.status not in (None, "complete"):
+        return
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(("append", target.conversation_id, target.id, target.role, target.content,
+                        target.created_at, target.token_count))
+
+@event.listens_for(Message, "after_update")
+def _message_updated(mapper, connection, target):
+    if not _changed(target, "role", "content", "status", "created_at", "conversation_id"):
+        return
+    pending = _pending(target)
+    if pending is None:
+        return
+    state = inspect(target)
+    old_status = state.attrs["status"].history.deleted
+    was_complete = (old_status[0] if old_status else target.status) in (None, "complete")
+    if not was_complete and not _changed(target, "conversation_id"):
+        # 生成中的回复不在缓存里:完成时追加到末尾(不是最后一条时 append 会让条目失效),其他状态不影响缓存
+        if target.status == "complete":
+            pending.append(("append", target.conversation_id, target.id, target.role, target.content,
+                            target.created_at, target.token_count))
+        return
+    pending.append(("invalidate", target.conversation_id))
+    old_conversation = state.attrs["conversation_id"].history.deleted
+    pending.extend(("invalidate", cid) for cid in old_conversation if cid)
+
+@event.listens_for(Message, "after_delete")
+def _message_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(("invalidate", target.conversation_id))
+
+@event.listens_for(KnowledgePoint, "after_insert")
+def _knowledge_point_inserted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(("reference", target.conversation_id, target.message_id, 1))
+
+@event.listens_for(KnowledgePoint, "after_update")
+def _knowledge_point_updated(mapper, connection, target):
+    if _changed(target, "message_id", "conversation_id"):
+        pending = _pending(target)
+        if pending is not None:
+            pending.append(("invalidate", target.conversation_id))
+            old_conversation = inspect(target).attrs["conversation_id"].history.deleted
+            pending.extend(("invalidate", cid) for cid in old_conversation if cid)
+
+@event.listens_for(KnowledgePoint, "after_delete")
+def _knowledge_point_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(("reference", target.conversation_id, target.message_id, -1))
+
+@event.listens_for(Conversation, "after_delete")
+def _conversation_deleted(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.append(("invalidate", target.id))
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    for change in session.info.pop("history_pending", ()):
+        if change[0] == "append":
+            history_cache.append(*change[1:])
+        elif change[0] == "reference":
+            history_cache.reference(*change[1:])
+        else:
+            history_cache.invalidate(change[1])
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session):
+    session.info.pop("history_pending", None)
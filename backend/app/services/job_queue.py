@@ -0,0 +1,296 @@
+"""
+Background job queue
+
+不需要在请求里同步完成的维护工作(回复缓存淘汰、历史数据压缩等)交给这里,请求只负责把任务写进
+background_jobs 表,由 lifespan 中启动的 asyncio worker 在后台执行:
+
+- 优先级:数值小的先执行,同一优先级按 run_at 先后;
+- 去重:带 dedup_key 的任务同一时间最多排队一个,重复提交直接忽略(正在执行时可以再排一个);
+- 可见性超时:worker 领取任务时写入 locked_until = 现在 + 该类任务的 timeout,执行超过 timeout 的
+  任务被取消并按失败处理;进程崩溃时未完成的任务在租约到期后重新排队,不会丢失;
+- 失败重试:按指数退避(job_queue_backoff_base_seconds 起,每次翻倍,加随机抖动)重新排队,
+  达到 max_attempts 次后标记为 failed,错误保存在 last_error;
+- 正常退出时正在执行的任务放回队列,下次启动继续;已结束的任务保留 job_queue_retention_seconds 秒
+  供 /api/jobs 查看,之后由 job_queue.prune 任务清理。
+"""
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, event, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import config
+from app.db.database import async_session_maker
+from app.models.job import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+HIGH = 0
+NORMAL = 5
+LOW = 10
+
+# 租约比任务的 timeout 稍长,超时的任务先在本进程内按失败处理,不会同时被当成崩溃遗留重新排队
+_LEASE_MARGIN_SECONDS = 30
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+@dataclass
+class _Registration:
+    handler: Handler
+    timeout: float
+    max_attempts: int
+
+class JobQueue:
+    """Durable priority queue of deferred work backed by the background_jobs table"""
+
+    def __init__(self):
+        self._handlers: dict[str, _Registration] = {}
+        self._workers: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_requeue: Optional[datetime] = None
+
+        # Counters
+        self._enqueued = 0
+        self._deduplicated = 0
+        self._succeeded = 0
+        self._retried = 0
+        self._failed = 0
+        self._expired_leases = 0
+        self._running = 0
+
+    def register(
+        self, kind: str, handler: Handler, timeout: Optional[float] = None, max_attempts: Optional[int] = None
+    ) -> None:
+        """注册一类任务的处理函数;timeout 同时是可见性超时"""
+        self._handlers[kind] = _Registration(
+            handler=handler,
+            timeout=timeout or config.job_queue_visibility_timeout_seconds,
+            max_attempts=max_attempts or config.job_queue_max_attempts,
+        )
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: Optional[Dict[str, Any]] = None,
+        priority: int = NORMAL,
+        dedup_key: Optional[str] = None,
+        delay: float = 0,
+        session: Optional[AsyncSession] = None,
+    ) -> bool:
+        """
+        提交任务,返回是否新排队(相同 dedup_key 的任务已在排队时返回 False)。
+        传入 session 时任务随调用方的事务一起提交。
+        """
+        registration = self._handlers.get(kind)
+        now = datetime.utcnow()
+        statement = insert(BackgroundJob).values(
+            kind=kind,
+            payload=payload,
+            priority=priority,
+            dedup_key=dedup_key,
+            max_attempts=registration.max_attempts if registration else config.job_queue_max_attempts,
+            run_at=now + timedelta(seconds=delay),
+            created_at=now,
+        )
+        if dedup_key is not None:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[BackgroundJob.dedup_key], index_where=text("status = 'queued'")
+            )
+
+        if session is not None:
+            result = await session.execute(statement)
+            event.listen(session.sync_session, "after_commit", lambda _: self._wake(), once=True)
+        else:
+            async with async_session_maker() as session:
+                result = await session.execute(statement)
+                await session.commit()
+            self._wake()
+
+        if result.rowcount:
+            self._enqueued += 1
+            return True
+        self._deduplicated += 1
+        return False
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"job-queue-{i}") for i in range(config.job_queue_workers)
+        ]
+        await self.enqueue("job_queue.prune", priority=LOW, dedup_key="job_queue.prune")
+
+    async def stop(self) -> None:
+        """停止 worker;正在执行的任务放回队列"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                self._wakeup.clear()
+                await self._requeue_expired()
+                job = await self._claim()
+                if job is not None:
+                    await self._execute(*job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job queue worker error")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.job_queue_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _requeue_expired(self) -> None:
+        """租约已过期的任务(执行它的进程崩溃了)重新排队,每个轮询间隔最多检查一次"""
+        now = datetime.utcnow()
+        if self._last_requeue is not None and (now - self._last_requeue).total_seconds() < config.job_queue_poll_seconds:
+            return
+        self._last_requeue = now
+        async with async_session_maker() as session:
+            expired = (await session.execute(
+                select(BackgroundJob.id)
+                .where(BackgroundJob.status == "running", BackgroundJob.locked_until <= now)
+            )).scalars().all()
+        for job_id in expired:
+            await self._requeue(job_id, run_at=now, last_error="Visibility timeout expired")
+        if expired:
+            self._expired_leases += len(expired)
+            logger.warning("Requeued %d background jobs whose lease expired", len(expired))
+
+    async def _claim(self) -> Optional[tuple]:
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            row = (await session.execute(
+                select(BackgroundJob.id, BackgroundJob.kind)
+                .where(BackgroundJob.status == "queued", BackgroundJob.run_at <= now)
+                .order_by(BackgroundJob.priority, BackgroundJob.run_at)
+                .limit(1)
+            )).first()
+            if row is None:
+                return None
+            registration = self._handlers.get(row.kind)
+            timeout = registration.timeout if registration else config.job_queue_visibility_timeout_seconds
+            # 写连接只有一个,查询和领取之间不会有其他写入;status 条件是额外的保护
+            claimed = (await session.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == row.id, BackgroundJob.status == "queued")
+                .values(
+                    status="running",
+                    attempts=BackgroundJob.attempts + 1,
+                    locked_until=now + timedelta(seconds=timeout + _LEASE_MARGIN_SECONDS),
+                    started_at=now,
+                )
+                .returning(BackgroundJob.attempts, BackgroundJob.max_attempts, BackgroundJob.payload)
+                .execution_options(synchronize_session=False)
+            )).first()
+            await session.commit()
+        if claimed is None:
+            return None
+        return row.id, row.kind, registration, claimed.payload, claimed.attempts, claimed.max_attempts
+
+    async def _execute(self, job_id: str, kind: str, registration: Optional[_Registration],
+                       payload: Optional[Dict[str, Any]], attempts: int, max_attempts: int) -> None:
+        if registration is None:
+            await self._finish(job_id, "failed", last_error=f"No handler registered for {kind}")
+            self._failed += 1
+            return
+        if attempts > max_attempts:
+            # 只有租约过期后重新领取才会超过上限:任务多次让进程崩溃或卡住
+            await self._finish(job_id, "failed", last_error=f"Lease expired after {max_attempts} attempts")
+            self._failed += 1
+            return
+
+        self._running += 1
+        try:
+            await asyncio.wait_for(registration.handler(payload or {}), timeout=registration.timeout)
+        except asyncio.CancelledError:
+            # 服务退出:放回队列,这次不计入尝试次数
+            await self._requeue(job_id, attempts=attempts - 1)
+            raise
+        except Exception as e:
+            error = f"Timed out after {registration.timeout:g}s" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            if attempts < max_attempts:
+                backoff = min(
+                    config.job_queue_backoff_base_seconds * 2 ** (attempts - 1),
+                    config.job_queue_backoff_max_seconds
+                )
+                backoff *= 1 + random.uniform(0, config.llm_backoff_jitter)
+                logger.warning("Background job %s (%s) failed, retrying in %.1fs: %s", job_id, kind, backoff, error)
+                await self._requeue(job_id, last_error=error, run_at=datetime.utcnow() + timedelta(seconds=backoff))
+                self._retried += 1
+            else:
+                logger.error("Background job %s (%s) failed after %d attempts: %s", job_id, kind, attempts, error)
+                await self._finish(job_id, "failed", last_error=error)
+                self._failed += 1
+        else:
+            await self._finish(job_id, "done")
+            self._succeeded += 1
+        finally:
+            self._running -= 1
+
+    async def _requeue(self, job_id: str, **values) -> None:
+        try:
+            await self._update(job_id, status="queued", locked_until=None, **values)
+        except IntegrityError:
+            # 同一个 dedup_key 已经有任务在排队,由它完成这项工作
+            await self._finish(job_id, "superseded")
+
+    async def _finish(self, job_id: str, status: str, **values) -> None:
+        await self._update(job_id, status=status, locked_until=None, finished_at=datetime.utcnow(), **values)
+
+    async def _update(self, job_id: str, **values) -> None:
+        async with async_session_maker() as session:
+            await session.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def _prune(self, payload: Dict[str, Any]) -> None:
+        """删除保留期已过的已结束任务,然后安排下一次清理"""
+        cutoff = datetime.utcnow() - timedelta(seconds=config.job_queue_retention_seconds)
+        async with async_session_maker() as session:
+            result = await session.execute(
+                delete(BackgroundJob)
+                .where(BackgroundJob.finished_at <= cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info("Pruned %d finished background jobs", result.rowcount)
+        await self.enqueue(
+            "job_queue.prune", priority=LOW, dedup_key="job_queue.prune", delay=config.job_queue_prune_interval_seconds
+        )
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "running": self._running,
+            "enqueued": self._enqueued,
+            "deduplicated": self._deduplicated,
+            "succeeded": self._succeeded,
+            "retried": self._retried,
+            "failed": self._failed,
+            "expired_leases": self._expired_leases,
+        }
+
+job_queue = JobQueue()
+job_queue.register("job_queue.prune", job_queue._prune)
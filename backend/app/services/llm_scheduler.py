@@ -0,0 +1,282 @@
+"""
+LLM request scheduler
+
+所有模型调用在发出前经过这里排队,按 (provider, 模型) 分别限流:
+
+- 令牌桶:每分钟请求数(rpm)和每分钟 token 数(tpm),在模型配置的 extra_params 中设置,
+  例如 `{"rpm": 50, "tpm": 40000}`;未设置的维度不限。tpm 按提示词估算值加上回复上限预扣,
+  拿到实际 usage 后多退少补;
+- 优先级:交互式对话(INTERACTIVE)排在后台任务(BACKGROUND)之前,同一优先级先到先得;
+- 服务端返回 429 时按 Retry-After(没有则按指数退避)暂停整个队列,加随机抖动后重试;
+- 队列长度超过 llm_queue_max_depth 时直接拒绝(LLMRateLimited,接口返回 429 和 Retry-After)。
+
+排队等待时间计入 stats()。
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from app.config import config
+from app.services.settings_cache import settings_cache
+from app.services.tokens import estimate_tokens
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class LLMRateLimited(Exception):
+    """The request was shed or stayed rate limited; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds from Retry-After / retry-after-ms headers, None if absent"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.level = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.rate_per_minute, self.level + (now - self.updated) * self.rate_per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # 超过桶容量的单次请求只要求桶满,避免永远等不到
+        amount = min(amount, self.rate_per_minute)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.rate_per_minute
+
+    def consume(self, amount: float) -> None:
+        self.level -= amount
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    wake: asyncio.Event = field(compare=False, default_factory=asyncio.Event)
+
+class _Lane:
+    """Queue and buckets of one (provider, model)"""
+
+    def __init__(self):
+        self.waiters: list[_Waiter] = []
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        self.blocked_until = 0.0
+        self.failures = 0  # 连续 429 次数,用于指数退避
+
+    def configure(self, rpm: Optional[float], tpm: Optional[float]) -> None:
+        if (self.requests.rate_per_minute if self.requests else None) != rpm:
+            self.requests = TokenBucket(rpm) if rpm else None
+        if (self.tokens.rate_per_minute if self.tokens else None) != tpm:
+            self.tokens = TokenBucket(tpm) if tpm else None
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def consume(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(tokens)
+
+    def wake_head(self) -> None:
+        if self.waiters:
+            self.waiters[0].wake.set()
+
+class LLMScheduler:
+    """Admission control and rate limiting in front of every completion call"""
+
+    def __init__(self):
+        self._lanes: dict[tuple[str, str], _Lane] = {}
+        self._seq = itertools.count()
+        self._waits: deque[float] = deque(maxlen=1000)
+
+        # Counters
+        self._admitted = 0
+        self._shed = 0
+        self._throttled = 0
+        self._upstream_rate_limits = 0
+        self._wait_total = 0.0
+
+    def _lane(self, provider: str, model_name: str) -> _Lane:
+        lane = self._lanes.get((provider, model_name))
+        if lane is None:
+            lane = self._lanes[(provider, model_name)] = _Lane()
+        return lane
+
+    async def _limits(self, provider: str, model_name: str) -> tuple[Optional[float], Optional[float]]:
+        for entry in await settings_cache.model_configs(provider=provider, is_active=True):
+            if entry.model_id == model_name and entry.extra_params:
+                return entry.extra_params.get("rpm"), entry.extra_params.get("tpm")
+        return None, None
+
+    def _estimated_wait(self, lane: _Lane, now: float) -> float:
+        """给被拒绝的请求一个 Retry-After:暂停剩余时间加上按 rpm 排空队列所需时间"""
+        wait = max(0.0, lane.blocked_until - now)
+        if lane.requests is not None:
+            wait += len(lane.waiters) * 60 / lane.requests.rate_per_minute
+        return max(1.0, wait)
+
+    def check_admission(self, provider: str, model_name: str) -> None:
+        """队列已满时立即拒绝(在开始处理请求之前调用)"""
+        lane = self._lane(provider, model_name)
+        if len(lane.waiters) >= config.llm_queue_max_depth:
+            self._shed += 1
+            raise LLMRateLimited(
+                f"Too many queued requests for {provider}/{model_name}",
+                retry_after=self._estimated_wait(lane, time.monotonic())
+            )
+
+    async def acquire(
+        self, provider: str, model_name: str, messages: list[dict], max_tokens: Optional[int], priority: int = INTERACTIVE
+    ) -> int:
+        """等到 (provider, 模型) 的限额允许再返回,预扣 1 个请求和估算的 token 数(返回预扣的 token 数)"""
+        lane = self._lane(provider, model_name)
+        lane.configure(*await self._limits(provider, model_name))
+        self.check_admission(provider, model_name)
+
+        tokens = 0
+        if lane.tokens is not None:
+            tokens = sum(estimate_tokens(_text(m.get("content"))) for m in messages)
+            tokens += max_tokens or config.context_reserve_tokens
+
+        started = time.monotonic()
+        waiter = _Waiter(priority=priority, seq=next(self._seq))
+        previous_head = lane.waiters[0] if lane.waiters else None
+        heapq.heappush(lane.waiters, waiter)
+        if previous_head is not None and lane.waiters[0] is waiter:
+            # 插队到队首,让原队首重新排队
+            previous_head.wake.set()
+        try:
+            while True:
+                waiter.wake.clear()
+                if lane.waiters[0] is waiter:
+                    now = time.monotonic()
+                    wait = lane.wait_time(tokens, now)
+                    if wait <= 0:
+                        lane.consume(tokens)
+                        break
+                    self._throttled += 1
+                    try:
+                        await asyncio.wait_for(waiter.wake.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await waiter.wake.wait()
+        finally:
+            if waiter in lane.waiters:
+                lane.waiters.remove(waiter)
+                heapq.heapify(lane.waiters)
+            lane.wake_head()
+
+        waited = time.monotonic() - started
+        self._admitted += 1
+        self._wait_total += waited
+        self._waits.append(waited)
+        return tokens
+
+    def succeeded(self, provider: str, model_name: str, reserved: int = 0, used: Optional[int] = None) -> None:
+        """请求成功:清除退避计数;已知实际 token 用量时修正预扣(流式请求在结束时调用 settle)"""
+        lane = self._lanes.get((provider, model_name))
+        if lane is None:
+            return
+        lane.failures = 0
+        if used is not None:
+            self.settle(provider, model_name, reserved, used)
+
+    def settle(self, provider: str, model_name: str, reserved: int, used: int) -> None:
+        """用实际 token 用量修正预扣:多退少补"""
+        lane = self._lanes.get((provider, model_name))
+        if lane is not None and lane.tokens is not None and reserved:
+            lane.tokens.consume(used - reserved)
+
+    def refund(self, provider: str, model_name: str, reserved: int) -> None:
+        """请求没有被服务端处理(如返回 429):退还预扣的 token"""
+        self.settle(provider, model_name, reserved, 0)
+
+    def rate_limited(self, provider: str, model_name: str, retry_after: Optional[float]) -> float:
+        """服务端返回 429:暂停该队列,返回暂停秒数"""
+        self._upstream_rate_limits += 1
+        lane = self._lane(provider, model_name)
+        lane.failures += 1
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = min(config.llm_backoff_base_seconds * 2 ** (lane.failures - 1), config.llm_backoff_max_seconds)
+        # 抖动避免多个等待者在同一时刻一起重试
+        delay *= 1 + random.uniform(0, config.llm_backoff_jitter)
+        lane.blocked_until = max(lane.blocked_until, time.monotonic() + delay)
+        lane.wake_head()
+        return delay
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        now = time.monotonic()
+        return {
+            "admitted": self._admitted,
+            "shed": self._shed,
+            "throttled": self._throttled,
+            "upstream_rate_limits": self._upstream_rate_limits,
+            "queue_wait_seconds": {
+                "total": round(self._wait_total, 3),
+                "p50": round(waits[len(waits) // 2], 4) if waits else 0.0,
+                "p95": round(waits[int(len(waits) * 0.95)], 4) if waits else 0.0,
+                "max": round(waits[-1], 4) if waits else 0.0,
+            },
+            "lanes": [
+                {
+                    "provider": provider,
+                    "model": model_name,
+                    "queued": len(lane.waiters),
+                    "rpm": lane.requests.rate_per_minute if lane.requests else None,
+                    "tpm": lane.tokens.rate_per_minute if lane.tokens else None,
+                    "blocked_for": round(max(0.0, lane.blocked_until - now), 3),
+                }
+                for (provider, model_name), lane in self._lanes.items()
+            ],
+        }
+
+llm_scheduler = LLMScheduler()
@@ -1,11 +1,20 @@
 """
 LLM Service using LiteLLM for unified interface
 """
-import os
+import logging
 from typing import AsyncGenerator, Optional, Dict, Any
-from litellm import acompletion, ModelResponse
+from litellm import acompletion, get_model_info, ModelResponse
 from litellm.exceptions import APIError, Timeout, RateLimitError
 
+from app.config import config
+from app.services.llm_scheduler import llm_scheduler, LLMRateLimited, INTERACTIVE, parse_retry_after
+from app.services.prompt_cache import prompt_cache, policy_for
+from app.services.provider_clients import provider_clients
+from app.services.response_cache import response_cache
+from app.services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
 class LLMService:
     """统一的 LLM 服务接口"""
 
@@ -36,6 +45,26 @@ class LLMService:
         ]
     }
 
+    # 各模型的上下文窗口(输入 + 输出 token 数)
+    CONTEXT_WINDOWS = {
+        "gpt-4": 8192,
+        "gpt-4-turbo": 128000,
+        "gpt-4o": 128000,
+        "gpt-3.5-turbo": 16385,
+        "claude-3-5-sonnet-20241022": 200000,
+        "claude-3-opus-20240229": 200000,
+        "claude-3-sonnet-20240229": 200000,
+        "claude-3-haiku-20240307": 200000,
+        "gemini-pro": 32760,
+        "gemini-1.5-pro": 2097152,
+        "gemini-1.5-flash": 1048576,
+        "llama3.2": 131072,
+        "llama3.1": 131072,
+        "qwen2.5": 32768,
+        "mistral": 32768,
+    }
+    DEFAULT_CONTEXT_WINDOW = 8192
+
     @staticmethod
     def get_model_string(provider: str, model_name: str) -> str:
         """
@@ -74,6 +103,9 @@ class LLMService:
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         stream: bool = False,
+        stable_messages: Optional[int] = None,
+        cache: Optional[bool] = None,
+        priority: int = INTERACTIVE,
         **kwargs
     ) -> ModelResponse | AsyncGenerator[Dict[str, Any], None]:
         """
@@ -83,10 +115,13 @@ class LLMService:
             provider: 提供商 (openai, anthropic, google, ollama)
             model_name: 模型名称
             messages: 消息列表 [{"role": "user", "content": "..."}]
-            api_key: API 密钥(可选,如果不提供则从环境变量读取)
+            api_key: API 密钥(可选,如果不提供则读取环境变量)
             temperature: 温度参数
             max_tokens: 最大生成 token 数
             stream: 是否使用流式响应
+            stable_messages: 前多少条消息在下一轮会原样重发(用于提示词缓存),默认除最后一条外全部
+            cache: 是否使用回复缓存;None 表示仅在 temperature=0 时使用
+            priority: 排队优先级,INTERACTIVE(交互式对话)或 BACKGROUND(后台任务)
             **kwargs: 其他参数
 
         Returns:
@@ -95,49 +130,156 @@ class LLMService:
         # 构建模型字符串
         model = LLMService.get_model_string(provider, model_name)
 
-        # 设置 API Key
-        if api_key:
-            # 临时设置环境变量
-            env_name = LLMService.get_api_key_env_name(provider)
-            if env_name:
-                os.environ[env_name] = api_key
+        # 回复缓存:确定性的请求直接返回(或回放)之前的回复
+        cache_key = None
+        if response_cache.enabled_for(temperature, cache):
+            cache_key = response_cache.key(
+                provider, model_name, messages, {"temperature": temperature, "max_tokens": max_tokens, **kwargs}
+            )
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                if stream:
+                    return response_cache.replay(cached.content)
+                return LLMService._cached_response(model, cached)
 
-        try:
-            # 调用 LiteLLM
-            response = await acompletion(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=stream,
-                **kwargs
+        # 凭据显式传给 LiteLLM,连接复用池化的客户端(不修改环境变量)
+        api_key = provider_clients.resolve_api_key(provider, api_key)
+        client = provider_clients.get(provider, api_key, kwargs.get("api_base"))
+        if client is not None:
+            kwargs.setdefault("client", client)
+
+        # 提示词缓存:按模型策略标记稳定前缀,流式请求要求在最后一个 chunk 返回 usage
+        policy = policy_for(provider, model_name)
+        messages = prompt_cache.apply(policy, messages, stable_messages)
+        if stream and policy.mode != "none":
+            kwargs.setdefault("stream_options", {"include_usage": True})
+
+        # 调用 LiteLLM:先在调度器排队,服务端限流时暂停该模型的队列后重试。
+        # 排队和设置读取的错误原样抛出,只有模型调用本身的错误包装成下面的异常
+        attempts = 0
+        while True:
+            reserved = await llm_scheduler.acquire(provider, model_name, messages, max_tokens, priority)
+            try:
+                response = await acompletion(
+                    model=model,
+                    messages=messages,
+                    api_key=api_key,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=stream,
+                    **kwargs
+                )
+                break
+            except RateLimitError as e:
+                # 被拒绝的请求没有消耗 token,退还预扣,重试时重新预扣
+                llm_scheduler.refund(provider, model_name, reserved)
+                retry_after = parse_retry_after(getattr(getattr(e, "response", None), "headers", None))
+                delay = llm_scheduler.rate_limited(provider, model_name, retry_after)
+                attempts += 1
+                if attempts > config.llm_rate_limit_retries:
+                    raise LLMRateLimited(f"Rate limit exceeded: {str(e)}", retry_after=delay)
+            except Timeout as e:
+                # 超时(以及取消)的请求可能已经在服务端消耗了 token,预扣不退还
+                raise Exception(f"Request timeout: {str(e)}")
+            except APIError as e:
+                llm_scheduler.refund(provider, model_name, reserved)
+                raise Exception(f"API error: {str(e)}")
+            except Exception as e:
+                # 服务端拒绝(4xx / 5xx)或连接失败,没有生成内容
+                llm_scheduler.refund(provider, model_name, reserved)
+                raise Exception(f"LLM service error: {str(e)}")
+
+        if stream:
+            llm_scheduler.succeeded(provider, model_name)
+            chunks = LLMService._stream_response(
+                response, provider, model_name, reserved, reserved - (max_tokens or config.context_reserve_tokens)
             )
+            if cache_key:
+                return response_cache.record_stream(chunks, cache_key, provider, model_name)
+            return chunks
 
-            if stream:
-                return LLMService._stream_response(response)
-            else:
-                return response
+        usage = getattr(response, "usage", None)
+        llm_scheduler.succeeded(provider, model_name, reserved, usage.total_tokens if usage else None)
+        prompt_cache.record(usage)
+        if cache_key:
+            await response_cache.put(
+                cache_key, provider, model_name, response.choices[0].message.content,
+                {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens} if usage else None
+            )
+        return response
 
-        except RateLimitError as e:
-            raise Exception(f"Rate limit exceeded: {str(e)}")
-        except Timeout as e:
-            raise Exception(f"Request timeout: {str(e)}")
-        except APIError as e:
-            raise Exception(f"API error: {str(e)}")
-        except Exception as e:
-            raise Exception(f"LLM service error: {str(e)}")
+    @staticmethod
+    def _cached_response(model: str, cached) -> ModelResponse:
+        """把缓存的回复包装成和实时调用相同的 ModelResponse"""
+        response = ModelResponse(
+            model=model,
+            choices=[{"index": 0, "message": {"role": "assistant", "content": cached.content}, "finish_reason": "stop"}],
+            usage=cached.usage
+        )
+        response._hidden_params["cache_hit"] = True
+        return response
 
     @staticmethod
-    async def _stream_response(response):
-        """处理流式响应"""
-        async for chunk in response:
-            if chunk.choices and len(chunk.choices) > 0:
-                delta = chunk.choices[0].delta
-                if hasattr(delta, 'content') and delta.content:
-                    yield {
-                        "type": "content",
-                        "content": delta.content
-                    }
+    async def _stream_response(
+        response, provider: str, model_name: str, reserved: int = 0, prompt_estimate: int = 0
+    ):
+        """
+        处理流式响应;提前关闭(客户端断开、取消)时同时关闭上游连接。
+        结束时用最后一个 chunk 的 usage 修正调度器的 token 预扣,没有 usage 时按提示词估算加已生成的内容估算
+        """
+        used = None
+        parts: list[str] = []
+        try:
+            async for chunk in response:
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    prompt_cache.record(usage)
+                    used = usage.total_tokens
+                if chunk.choices and len(chunk.choices) > 0:
+                    delta = chunk.choices[0].delta
+                    if hasattr(delta, 'content') and delta.content:
+                        if reserved:
+                            parts.append(delta.content)
+                        yield {
+                            "type": "content",
+                            "content": delta.content
+                        }
+        finally:
+            await LLMService._close_upstream(response)
+            if reserved:
+                if used is None:
+                    used = max(0, prompt_estimate) + estimate_tokens("".join(parts))
+                llm_scheduler.settle(provider, model_name, reserved, used)
+
+    @staticmethod
+    async def _close_upstream(response) -> None:
+        """
+        关闭 LiteLLM 流式响应底层的 HTTP 流。OpenAI SDK 的流可以直接关闭;
+        LiteLLM 自己实现的 provider 只暴露按行读取的迭代器,关闭它即停止读取。
+        """
+        stream = getattr(response, "completion_stream", response)
+        for target in (stream, getattr(stream, "streaming_response", None)):
+            close = getattr(target, "aclose", None)
+            if close is None:
+                continue
+            try:
+                await close()
+            except Exception as e:
+                logger.debug("Closing upstream stream failed: %s", e)
+            return
+
+    @staticmethod
+    def get_context_window(provider: str, model_name: str) -> int:
+        """获取模型的上下文窗口,未知模型查询 LiteLLM 的模型信息,再退回默认值"""
+        window = LLMService.CONTEXT_WINDOWS.get(model_name)
+        if window:
+            return window
+        try:
+            info = get_model_info(LLMService.get_model_string(provider, model_name))
+            window = info.get("max_input_tokens") or info.get("max_tokens")
+        except Exception:
+            window = None
+        return window or LLMService.DEFAULT_CONTEXT_WINDOW
 
     @staticmethod
     def validate_model(provider: str, model_name: str) -> bool:
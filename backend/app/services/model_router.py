@@ -0,0 +1,270 @@
+"""
+Model routing: fallback chains and hedged requests
+
+一个模型慢或不可用时,对话不应一直挂到超时。
+
+- 回退链:模型配置的 extra_params 中 `"fallbacks": [...]` 列出备用模型(模型配置的 id、名称或
+  model_id)。主模型出错时依次尝试备用模型;
+- 对冲请求:主模型在截止时间内没有返回首个 token 时,同时向链上的下一个模型发出请求,先返回的
+  胜出,另一个被取消。截止时间取该模型最近首 token 延迟的 p95(样本不足时用默认值),限制在
+  [llm_hedge_min_delay, llm_hedge_max_delay] 之间。非流式请求只在 llm_hedge_completions 打开时
+  按完整回复的延迟对冲,使用单独的默认值和上限;BACKGROUND 优先级的请求从不对冲;
+- 路由:LatencyTracker 按模型记录最近一段时间的延迟和错误,错误率过高的模型排到链尾。
+
+实际回答的模型通过返回值交给调用方,记录到 Message.model_provider / model_name。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+
+from app.config import config
+from app.services.llm_scheduler import BACKGROUND
+from app.services.llm_service import LLMService
+from app.services.settings_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Target:
+    provider: str
+    model_name: str
+    api_key: Optional[str] = None
+
+class LatencyTracker:
+    """Rolling per-model latency samples and error outcomes"""
+
+    def __init__(self):
+        # (provider, model, kind) -> deque[(时间, 延迟秒数;出错为 None)]
+        self._samples: dict[tuple[str, str, str], deque] = {}
+
+    def _window(self, key: tuple[str, str, str]) -> deque:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=1000)
+        horizon = time.monotonic() - config.llm_latency_window_seconds
+        while samples and samples[0][0] < horizon:
+            samples.popleft()
+        return samples
+
+    def record(self, target: Target, kind: str, latency: Optional[float]) -> None:
+        self._window((target.provider, target.model_name, kind)).append((time.monotonic(), latency))
+
+    def quantile(self, target: Target, kind: str, q: float) -> Optional[float]:
+        latencies = sorted(
+            latency for _, latency in self._window((target.provider, target.model_name, kind)) if latency is not None
+        )
+        if len(latencies) < config.llm_latency_min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    def error_rate(self, target: Target) -> float:
+        outcomes = [
+            latency is None
+            for kind in ("first_token", "response")
+            for _, latency in self._window((target.provider, target.model_name, kind))
+        ]
+        if len(outcomes) < 4:
+            return 0.0
+        return sum(outcomes) / len(outcomes)
+
+    def stats(self) -> list[dict]:
+        result = []
+        for provider, model_name, kind in list(self._samples):
+            target = Target(provider, model_name)
+            samples = self._window((provider, model_name, kind))
+            latencies = sorted(latency for _, latency in samples if latency is not None)
+            result.append({
+                "provider": provider,
+                "model": model_name,
+                "kind": kind,
+                "samples": len(samples),
+                "errors": len(samples) - len(latencies),
+                "p50": round(latencies[len(latencies) // 2], 4) if latencies else None,
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4) if latencies else None,
+                "error_rate": round(self.error_rate(target), 4),
+            })
+        return result
+
+class ModelRouter:
+    """Runs a completion over a fallback chain, hedging slow first tokens"""
+
+    def __init__(self):
+        self.tracker = LatencyTracker()
+
+        # Counters
+        self._requests = 0
+        self._fallbacks = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._failures = 0
+
+    async def chain(self, provider: str, model_name: str, api_key: Optional[str] = None) -> list[Target]:
+        """主模型加上其模型配置中 fallbacks 列出的启用中的模型,出错多的排到最后"""
+        primary = Target(provider, model_name, api_key or await settings_cache.api_key_for(provider, model_name))
+        targets = [primary]
+        configs = await settings_cache.model_configs(is_active=True)
+        primary_config = next(
+            (entry for entry in configs if entry.provider == provider and entry.model_id == model_name), None
+        )
+        fallbacks = (primary_config.extra_params or {}).get("fallbacks", []) if primary_config else []
+        for ref in fallbacks:
+            entry = next((e for e in configs if ref in (e.id, e.name, e.model_id)), None)
+            if entry is None:
+                logger.warning("Fallback model %r of %s/%s is not an active model config", ref, provider, model_name)
+                continue
+            target = Target(
+                entry.provider, entry.model_id,
+                entry.api_key or await settings_cache.api_key_for(entry.provider, entry.model_id)
+            )
+            if all((t.provider, t.model_name) != (target.provider, target.model_name) for t in targets):
+                targets.append(target)
+        # 稳定排序:健康的模型保持配置顺序
+        return sorted(targets, key=lambda t: self.tracker.error_rate(t) >= config.llm_unhealthy_error_rate)
+
+    def hedge_delay(self, target: Target, kind: str) -> float:
+        if kind == "response":
+            default, maximum = config.llm_hedge_completion_default_delay, config.llm_hedge_completion_max_delay
+        else:
+            default, maximum = config.llm_hedge_default_delay, config.llm_hedge_max_delay
+        delay = self.tracker.quantile(target, kind, config.llm_hedge_quantile) or default
+        return min(max(delay, config.llm_hedge_min_delay), maximum)
+
+    async def _timed(self, target: Target, kind: str, attempt: Callable[[Target], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        try:
+            result = await attempt(target)
+        except asyncio.CancelledError:
+            # 对冲中输掉的请求不算错误
+            raise
+        except Exception:
+            self.tracker.record(target, kind, None)
+            raise
+        self.tracker.record(target, kind, time.monotonic() - started)
+        return result
+
+    async def _race(
+        self,
+        chain: list[Target],
+        kind: str,
+        attempt: Callable[[Target], Awaitable[Any]],
+        discard: Callable[[Any], Awaitable[None]],
+        hedge: bool = True,
+    ) -> tuple[Any, Target]:
+        """按链路顺序尝试,hedge 为真时必要时对冲;返回 (结果, 实际回答的模型)"""
+        self._requests += 1
+        remaining = list(chain)
+        pending: dict[asyncio.Task, Target] = {}
+        errors: list[Exception] = []
+        hedged: set[Target] = set()
+        deadline = None
+
+        def launch(hedge: bool = False) -> None:
+            nonlocal deadline
+            target = remaining.pop(0)
+            if hedge:
+                hedged.add(target)
+            pending[asyncio.create_task(self._timed(target, kind, attempt))] = target
+            deadline = time.monotonic() + self.hedge_delay(target, kind)
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if remaining and hedge and config.llm_hedge_enabled:
+                    timeout = max(0.0, deadline - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._hedges += 1
+                    launch(hedge=True)
+                    continue
+                winner = None
+                for task in done:
+                    target = pending.pop(task)
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        logger.warning("%s/%s failed: %s", target.provider, target.model_name, task.exception())
+                    elif winner is None:
+                        winner = (task.result(), target)
+                    else:
+                        await discard(task.result())
+                if winner is not None:
+                    if winner[1] in hedged:
+                        self._hedge_wins += 1
+                    return winner
+                if not pending and remaining:
+                    self._fallbacks += 1
+                    launch()
+            self._failures += 1
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    result = await task
+                except BaseException:
+                    continue
+                await discard(result)
+
+    async def completion(self, chain: list[Target], messages: list[Dict[str, Any]], **params) -> tuple[Any, Target]:
+        """非流式补全,返回 (ModelResponse, 实际回答的模型)"""
+        async def attempt(target: Target):
+            return await LLMService.chat_completion(
+                provider=target.provider, model_name=target.model_name, messages=messages,
+                api_key=target.api_key, stream=False, **params
+            )
+
+        async def discard(response) -> None:
+            pass
+
+        hedge = config.llm_hedge_completions and params.get("priority") != BACKGROUND
+        return await self._race(chain, "response", attempt, discard, hedge)
+
+    async def stream(
+        self, chain: list[Target], messages: list[Dict[str, Any]], **params
+    ) -> tuple[AsyncGenerator[Dict[str, Any], None], Target]:
+        """流式补全,以首个 chunk 为准进行对冲;返回 (chunk 生成器, 实际回答的模型)"""
+        async def attempt(target: Target):
+            stream = await LLMService.chat_completion(
+                provider=target.provider, model_name=target.model_name, messages=messages,
+                api_key=target.api_key, stream=True, **params
+            )
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+            return stream, first
+
+        async def discard(result) -> None:
+            await result[0].aclose()
+
+        hedge = params.get("priority") != BACKGROUND
+        (stream, first), target = await self._race(chain, "first_token", attempt, discard, hedge)
+        return _prepend(first, stream), target
+
+    def stats(self) -> dict:
+        return {
+            "requests": self._requests,
+            "fallbacks": self._fallbacks,
+            "hedges": self._hedges,
+            "hedge_wins": self._hedge_wins,
+            "failures": self._failures,
+            "models": self.tracker.stats(),
+        }
+
+async def _prepend(first: Optional[Dict[str, Any]], stream: AsyncGenerator[Dict[str, Any], None]):
+    try:
+        if first is not None:
+            yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+
+model_router = ModelRouter()
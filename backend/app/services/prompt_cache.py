@@ -0,0 +1,148 @@
+"""
+Provider prompt caching
+
+长对话每轮都会重发同样的前缀(system 消息 + 之前的历史)。Anthropic 和 OpenAI 都支持在服务端缓存
+提示词前缀,命中时首 token 延迟和输入费用都大幅下降:
+
+- Anthropic 需要在请求里显式标记缓存断点(content block 上的 `cache_control`),
+  这里在最后一条 system 消息和稳定历史的末尾各放一个断点。下一轮的前缀包含上一轮的断点,
+  Anthropic 会向前查找并命中;
+- OpenAI 对超过 1024 token 的前缀自动缓存,不需要改请求,只记录命中情况。
+
+每个模型用哪种方式由 PromptCachePolicy 决定(见 POLICIES)。缓存命中的 token 数从响应的
+usage 中读取,计入 stats()。
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from app.config import config
+from app.services.tokens import estimate_tokens
+
+@dataclass(frozen=True)
+class PromptCachePolicy:
+    mode: str  # breakpoints(显式标记)、automatic(服务端自动)、none
+    min_tokens: int = 1024  # 前缀短于该值时服务端不会缓存
+    max_breakpoints: int = 4
+
+NO_CACHE = PromptCachePolicy(mode="none")
+
+# 按 (provider, 模型名前缀) 匹配,前缀最长的优先;空前缀是该 provider 的默认值
+POLICIES = {
+    ("anthropic", ""): PromptCachePolicy(mode="breakpoints", min_tokens=1024),
+    ("anthropic", "claude-3-haiku"): PromptCachePolicy(mode="breakpoints", min_tokens=2048),
+    ("anthropic", "claude-3-5-haiku"): PromptCachePolicy(mode="breakpoints", min_tokens=2048),
+    ("openai", ""): PromptCachePolicy(mode="automatic", min_tokens=1024),
+}
+
+_EPHEMERAL = {"type": "ephemeral"}
+
+def policy_for(provider: str, model_name: str) -> PromptCachePolicy:
+    if not config.prompt_cache_enabled:
+        return NO_CACHE
+    matches = [
+        (len(prefix), policy) for (p, prefix), policy in POLICIES.items()
+        if p == provider and model_name.startswith(prefix)
+    ]
+    return max(matches, key=lambda match: match[0])[1] if matches else NO_CACHE
+
+def _mark(message: dict) -> dict:
+    """A copy of the message whose last content block carries a cache breakpoint"""
+    content = message["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content, "cache_control": _EPHEMERAL}]
+    else:
+        blocks = [dict(block) for block in content]
+        blocks[-1]["cache_control"] = _EPHEMERAL
+    return {**message, "content": blocks}
+
+def _text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+def _long_enough(messages: list[dict], min_tokens: int) -> bool:
+    texts = [_text(message) for message in messages]
+    chars = sum(len(text) for text in texts)
+    # 每个 token 至少一个字符、最多约四个字符,只有落在中间时才需要估算
+    if chars < min_tokens:
+        return False
+    if chars >= min_tokens * 4:
+        return True
+    return sum(estimate_tokens(text) for text in texts) >= min_tokens
+
+class PromptCache:
+    """Adds cache breakpoints to requests and records cached-token usage"""
+
+    def __init__(self):
+        # Counters
+        self._requests = 0
+        self._marked_requests = 0
+        self._breakpoints = 0
+        self._usage_reports = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+        self._cache_creation_tokens = 0
+
+    def apply(self, policy: PromptCachePolicy, messages: list[dict], stable: Optional[int] = None) -> list[dict]:
+        """
+        给请求的稳定前缀加缓存断点
+
+        Args:
+            policy: 模型的缓存策略
+            messages: 要发送的消息(不会被修改,需要标记的消息会被复制)
+            stable: 前多少条消息在下一轮仍会原样出现,默认除最后一条以外的全部
+
+        Returns:
+            要发送的消息列表
+        """
+        self._requests += 1
+        if policy.mode != "breakpoints":
+            return messages
+        if stable is None:
+            stable = len(messages) - 1
+        if stable <= 0:
+            return messages
+        if not _long_enough(messages[:stable], policy.min_tokens):
+            return messages
+
+        breakpoints = []
+        last_system = max((i for i in range(stable) if messages[i]["role"] == "system"), default=None)
+        if last_system is not None and last_system != stable - 1:
+            breakpoints.append(last_system)
+        breakpoints.append(stable - 1)
+        breakpoints = breakpoints[-policy.max_breakpoints:]
+
+        marked = list(messages)
+        for index in breakpoints:
+            marked[index] = _mark(messages[index])
+        self._marked_requests += 1
+        self._breakpoints += len(breakpoints)
+        return marked
+
+    def record(self, usage: Any) -> None:
+        """从响应的 usage 中记录缓存命中情况"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or getattr(usage, "cache_read_input_tokens", None) or 0
+        created = getattr(details, "cache_creation_tokens", None) or getattr(usage, "cache_creation_input_tokens", None) or 0
+        self._usage_reports += 1
+        self._prompt_tokens += getattr(usage, "prompt_tokens", None) or 0
+        self._cached_tokens += cached
+        self._cache_creation_tokens += created
+
+    def stats(self) -> dict:
+        return {
+            "enabled": config.prompt_cache_enabled,
+            "requests": self._requests,
+            "marked_requests": self._marked_requests,
+            "breakpoints": self._breakpoints,
+            "usage_reports": self._usage_reports,
+            "prompt_tokens": self._prompt_tokens,
+            "cached_tokens": self._cached_tokens,
+            "cache_creation_tokens": self._cache_creation_tokens,
+            "cached_ratio": round(self._cached_tokens / self._prompt_tokens, 4) if self._prompt_tokens else 0.0,
+        }
+
+prompt_cache = PromptCache()
@@ -0,0 +1,192 @@
+"""
+Provider HTTP clients
+
+每个 (provider, base_url, API Key) 对应一个长期存在的 httpx.AsyncClient,连接池保持 keep-alive,
+后续请求复用已建立的 TLS 连接。凭据通过参数显式传给 LiteLLM,不再写进进程环境变量
+(并发请求使用不同 Key 时会互相覆盖)。
+
+LiteLLM 对不同 provider 接受的 client 类型不同:OpenAI 走官方 SDK,需要 AsyncOpenAI;
+其余 provider 使用 LiteLLM 自己的 AsyncHTTPHandler。两者都包装同一个池化的 httpx 客户端。
+
+连接复用情况通过 httpcore 的 trace 扩展统计:每个请求计数,每次新建 TCP 连接计数。
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+from openai import AsyncOpenAI
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# 未指定 base_url 时各 provider 的默认地址(用于预热连接)
+DEFAULT_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com",
+    "google": "https://generativelanguage.googleapis.com",
+    "ollama": "http://localhost:11434",
+}
+
+API_KEY_ENV_NAMES = {
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "google": "GEMINI_API_KEY",
+}
+
+class _PooledHandler(AsyncHTTPHandler):
+    """AsyncHTTPHandler over an existing pooled client (the base class would build its own)"""
+
+    def __init__(self, client: httpx.AsyncClient, alias: str):
+        self.client = client
+        self.timeout = client.timeout
+        self.event_hooks = None
+        self.client_alias = alias
+
+@dataclass
+class _Entry:
+    provider: str
+    base_url: Optional[str]
+    http: httpx.AsyncClient
+    client: Any  # AsyncOpenAI 或 AsyncHTTPHandler
+    requests: int = 0
+    connections: int = 0
+
+    async def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.connections += 1
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+class ProviderClients:
+    """Registry of pooled keep-alive clients, one per (provider, base_url, key)"""
+
+    def __init__(self):
+        self._entries: dict[tuple, _Entry] = {}
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def resolve_api_key(provider: str, api_key: Optional[str]) -> Optional[str]:
+        """显式传入的 Key 优先,否则读取环境变量(只读,不修改)"""
+        if api_key:
+            return api_key
+        env_name = API_KEY_ENV_NAMES.get(provider)
+        return os.environ.get(env_name) if env_name else None
+
+    def _new_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.llm_pool_max_connections,
+                max_keepalive_connections=config.llm_pool_max_keepalive,
+                keepalive_expiry=config.llm_pool_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                config.llm_read_timeout,
+                connect=config.llm_connect_timeout,
+                pool=config.llm_pool_timeout,
+            ),
+            follow_redirects=True,
+        )
+
+    def _entry(self, provider: str, api_key: Optional[str], base_url: Optional[str]) -> _Entry:
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else None
+        registry_key = (provider, base_url, key_hash)
+        entry = self._entries.get(registry_key)
+        if entry is None:
+            http = self._new_http_client()
+            if provider == "openai":
+                client = AsyncOpenAI(
+                    api_key=api_key, base_url=base_url, http_client=http,
+                    timeout=http.timeout, max_retries=config.llm_max_retries
+                )
+            else:
+                client = _PooledHandler(http, alias=provider)
+            entry = _Entry(provider=provider, base_url=base_url, http=http, client=client)
+            http.event_hooks["request"].append(entry._on_request)
+            self._entries[registry_key] = entry
+        return entry
+
+    def get(self, provider: str, api_key: Optional[str], base_url: Optional[str] = None) -> Any:
+        """The client to pass to LiteLLM as `client=`; None when OpenAI has no key (LiteLLM reports the error)"""
+        if provider == "openai" and not api_key:
+            return None
+        return self._entry(provider, api_key, base_url).client
+
+    async def warmup(self, targets: list[tuple[str, Optional[str], Optional[str]]]) -> None:
+        """为 (provider, api_key, base_url) 预先建立连接,失败只记录日志"""
+        async def connect(provider: str, api_key: Optional[str], base_url: Optional[str]) -> None:
+            if self.get(provider, api_key, base_url) is None:
+                return
+            entry = self._entry(provider, api_key, base_url)
+            url = base_url or DEFAULT_BASE_URLS.get(provider)
+            if not url:
+                return
+            parts = urlsplit(url)
+            try:
+                # 任何响应(包括 404)都说明连接已建立并留在池中
+                await entry.http.head(f"{parts.scheme}://{parts.netloc}/", timeout=config.llm_connect_timeout)
+            except httpx.HTTPError as e:
+                logger.info("Warmup of %s (%s) failed: %s", provider, parts.netloc, e)
+
+        await asyncio.gather(*(connect(*target) for target in targets))
+
+    async def configured_targets(self) -> list[tuple[str, Optional[str], Optional[str]]]:
+        """已配置 Key 的 provider:启用的模型配置、保存的 API Key 和环境变量"""
+        from app.services.settings_cache import settings_cache
+
+        targets = set()
+        for entry in await settings_cache.model_configs(is_active=True):
+            api_key = self.resolve_api_key(entry.provider, await settings_cache.api_key_for(entry.provider, entry.model_id))
+            if api_key or entry.provider == "ollama":
+                targets.add((entry.provider, api_key, None))
+        for entry in await settings_cache.api_keys():
+            if entry.has_key:
+                targets.add((entry.provider, entry.encrypted_key, None))
+        for provider in API_KEY_ENV_NAMES:
+            api_key = self.resolve_api_key(provider, None)
+            if api_key:
+                targets.add((provider, api_key, None))
+        return sorted(targets, key=lambda target: target[0])
+
+    def start_warmup(self, targets: list[tuple[str, Optional[str], Optional[str]]]) -> None:
+        """在后台预热,不阻塞启动"""
+        if targets:
+            self._warmup_task = asyncio.create_task(self.warmup(targets))
+
+    async def close(self) -> None:
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            await asyncio.gather(self._warmup_task, return_exceptions=True)
+            self._warmup_task = None
+        entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            await entry.http.aclose()
+
+    def stats(self) -> dict:
+        requests = sum(entry.requests for entry in self._entries.values())
+        connections = sum(entry.connections for entry in self._entries.values())
+        return {
+            "clients": len(self._entries),
+            "requests": requests,
+            "connections_opened": connections,
+            "reuse_ratio": round(1 - connections / requests, 4) if requests else 0.0,
+            "by_client": [
+                {
+                    "provider": entry.provider,
+                    "base_url": entry.base_url,
+                    "requests": entry.requests,
+                    "connections_opened": entry.connections,
+                }
+                for entry in self._entries.values()
+            ],
+        }
+
+provider_clients = ProviderClients()
@@ -0,0 +1,190 @@
+"""
+Response cache
+
+探索时经常重复问同一个问题(比如在另一个对话里再次展开同一段选中文本)。确定性的请求
+(temperature=0,或调用方显式要求缓存)的回复保存在 `response_cache` 表中,键是请求的规范化
+哈希:provider、模型、消息和采样参数。
+
+- 条目超过 TTL 后失效,总大小超过 response_cache_max_bytes 时按最近使用时间淘汰(写入后由后台任务执行);
+- 命中只读数据库,最近使用时间先记在内存里,下次写入时一并落盘;
+- 流式请求命中时按小片段回放成和实时流相同的 chunk,前端无法区分。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app.config import config
+from app.db.database import async_session_maker, read_session_maker
+from app.models.cache import ResponseCacheEntry
+from app.services.job_queue import LOW, job_queue
+
+logger = logging.getLogger(__name__)
+
+# 不影响回复内容、不参与缓存键的参数
+_TRANSPORT_PARAMS = {"api_key", "api_base", "base_url", "client", "timeout", "stream", "stream_options", "metadata"}
+
+# 每个条目除正文外的大致开销(键、索引、其他列)
+_ENTRY_OVERHEAD = 200
+
+@dataclass(frozen=True)
+class CachedResponse:
+    content: str
+    usage: Optional[dict]
+
+class ResponseCache:
+    """SQLite-backed cache of deterministic completions"""
+
+    def __init__(self):
+        # key -> (最近一次命中时间, 命中次数),尚未写回数据库
+        self._touched: dict[str, tuple[datetime, int]] = {}
+        self._lock = asyncio.Lock()
+
+        # Counters
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._expired = 0
+        self._evictions = 0
+
+    @staticmethod
+    def enabled_for(temperature: float, cache: Optional[bool]) -> bool:
+        """cache=None 时只缓存 temperature=0 的请求;True/False 强制开关"""
+        if not config.response_cache_enabled or cache is False:
+            return False
+        return cache is True or temperature == 0
+
+    @staticmethod
+    def key(provider: str, model_name: str, messages: list[Dict[str, Any]], params: Dict[str, Any]) -> str:
+        """请求的规范化哈希,参数顺序和 JSON 格式不影响结果"""
+        canonical = json.dumps(
+            {
+                "provider": provider,
+                "model": model_name,
+                "messages": messages,
+                "params": {k: v for k, v in params.items() if v is not None and k not in _TRANSPORT_PARAMS},
+            },
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        async with read_session_maker() as session:
+            row = (await session.execute(
+                select(ResponseCacheEntry.content, ResponseCacheEntry.usage, ResponseCacheEntry.expires_at)
+                .where(ResponseCacheEntry.key == key)
+            )).first()
+        now = datetime.utcnow()
+        if row is None or row.expires_at <= now:
+            self._misses += 1
+            return None
+        _, hits = self._touched.get(key, (now, 0))
+        self._touched[key] = (now, hits + 1)
+        self._hits += 1
+        return CachedResponse(content=row.content, usage=row.usage)
+
+    async def put(self, key: str, provider: str, model_name: str, content: str, usage: Optional[dict] = None) -> None:
+        if not content:
+            return
+        now = datetime.utcnow()
+        size = len(content.encode("utf-8")) + _ENTRY_OVERHEAD
+        values = dict(
+            key=key, provider=provider, model_name=model_name, content=content, usage=usage,
+            size_bytes=size, hits=0, created_at=now, last_used_at=now,
+            expires_at=now + timedelta(seconds=config.response_cache_ttl_seconds),
+        )
+        statement = insert(ResponseCacheEntry).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ResponseCacheEntry.key],
+            set_={name: statement.excluded[name] for name in values if name not in ("key", "hits")}
+        )
+        try:
+            async with self._lock, async_session_maker() as session:
+                await self._flush_touched(session)
+                await session.execute(statement)
+                # 淘汰要统计全表大小,放到后台任务里做,不占用回复的写事务
+                await job_queue.enqueue("response_cache.evict", priority=LOW, dedup_key="response_cache.evict", session=session)
+                await session.commit()
+            self._stores += 1
+        except Exception:
+            # 缓存写入失败不影响回复本身
+            logger.exception("Failed to store cached response")
+
+    async def _flush_touched(self, session) -> None:
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        table = ResponseCacheEntry.__table__
+        await session.execute(
+            update(table)
+            .where(table.c.key == bindparam("_key"))
+            .values(last_used_at=bindparam("_used"), hits=table.c.hits + bindparam("_hits")),
+            [{"_key": key, "_used": used, "_hits": hits} for key, (used, hits) in touched.items()]
+        )
+
+    async def evict(self, payload: Dict[str, Any]) -> None:
+        """删除过期条目,总大小超过上限时按最近使用时间淘汰(后台任务 response_cache.evict)"""
+        async with self._lock, async_session_maker() as session:
+            await self._evict(session, datetime.utcnow())
+            await session.commit()
+
+    async def _evict(self, session, now: datetime) -> None:
+        expired = await session.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.expires_at <= now))
+        self._expired += expired.rowcount or 0
+
+        total = (await session.execute(select(func.coalesce(func.sum(ResponseCacheEntry.size_bytes), 0)))).scalar()
+        excess = total - config.response_cache_max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        result = await session.stream(
+            select(ResponseCacheEntry.key, ResponseCacheEntry.size_bytes).order_by(ResponseCacheEntry.last_used_at.asc())
+        )
+        async for key, size in result:
+            victims.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        await result.close()
+        for start in range(0, len(victims), 500):
+            await session.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.key.in_(victims[start:start + 500])))
+        self._evictions += len(victims)
+
+    async def replay(self, content: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """以和实时流相同的 chunk 格式回放缓存的回复"""
+        size = max(1, config.response_cache_replay_chunk_chars)
+        for start in range(0, len(content), size):
+            yield {"type": "content", "content": content[start:start + size]}
+            await asyncio.sleep(0)
+
+    async def record_stream(
+        self, stream: AsyncGenerator[Dict[str, Any], None], key: str, provider: str, model_name: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """透传实时流,完整结束后把回复写入缓存(中途断开的不缓存)"""
+        parts = []
+        async for chunk in stream:
+            if chunk.get("type") == "content":
+                parts.append(chunk.get("content", ""))
+            yield chunk
+        await self.put(key, provider, model_name, "".join(parts))
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "enabled": config.response_cache_enabled,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "stores": self._stores,
+            "expired": self._expired,
+            "evictions": self._evictions,
+        }
+
+response_cache = ResponseCache()
+job_queue.register("response_cache.evict", response_cache.evict)
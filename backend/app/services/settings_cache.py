@@ -0,0 +1,283 @@
+"""
+Settings cache
+
+ModelConfig、AppSettings、APIKeyStorage 三张表很小、几乎只读,却在每次对话时都要查询。
+SettingsCache 把三张表整体读成一份不可变快照(typed dataclass),之后的查询直接命中内存。
+
+失效:
+- 本进程通过 ORM 写这三张表时,事务提交后立即失效;
+- 其他进程(或绕过 ORM 的写入)由版本号发现:每次查询先在一个专用只读连接上读
+  `PRAGMA data_version`(只读内存中的 WAL 头,开销是微秒级),只有数据库有过提交时才去读
+  `settings_revision` —— 迁移 0008 建的触发器在三张表每次写入后递增它。
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from app.config import config
+from app.db.database import read_session_maker
+from app.models.settings import ModelConfig, AppSettings, APIKeyStorage, SettingsRevision
+# The first ORM query configures every mapper, so all models (and the names
+# their relationships refer to) must be imported, not only the settings ones
+from app.models import conversation, knowledge, settings, space, search, cache, batch, job  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ModelConfigEntry:
+    id: str
+    name: str
+    provider: str
+    model_id: str
+    api_key: Optional[str]
+    base_url: Optional[str]
+    default_temperature: str
+    default_max_tokens: Optional[str]
+    extra_params: Optional[dict]
+    is_active: bool
+    is_default: bool
+    created_at: datetime
+    updated_at: datetime
+
+    @property
+    def has_api_key(self) -> bool:
+        return bool(self.api_key)
+
+@dataclass(frozen=True)
+class AppSettingEntry:
+    id: str
+    key: str
+    value: Optional[str]  # 原始字符串
+    value_type: str
+    category: str
+    description: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    typed_value: Any = None  # 按 value_type 解码后的值
+
+@dataclass(frozen=True)
+class APIKeyEntry:
+    provider: str
+    encrypted_key: Optional[str]
+    is_valid: bool
+    last_validated: Optional[datetime]
+
+    @property
+    def has_key(self) -> bool:
+        return bool(self.encrypted_key)
+
+@dataclass
+class _Snapshot:
+    revision: int
+    model_configs: dict[str, ModelConfigEntry] = field(default_factory=dict)
+    app_settings: dict[str, AppSettingEntry] = field(default_factory=dict)
+    api_keys: dict[str, APIKeyEntry] = field(default_factory=dict)
+
+def decode_setting(value: Optional[str], value_type: str) -> Any:
+    """Decode an AppSettings value according to its value_type"""
+    if value is None:
+        return None
+    try:
+        if value_type == "number":
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+        if value_type == "boolean":
+            return value.strip().lower() in ("true", "1", "yes", "on")
+        if value_type == "json":
+            return json.loads(value)
+    except ValueError:
+        logger.warning("Setting value %r is not a valid %s; using the raw string", value, value_type)
+    return value
+
+def _columns(row, entry_type) -> dict:
+    return {name: getattr(row, name) for name in entry_type.__dataclass_fields__ if hasattr(row, name)}
+
+class SettingsCache:
+    """Read-through cache of the settings tables, shared by all requests in the process"""
+
+    def __init__(self, session_maker=read_session_maker):
+        self._session_maker = session_maker
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = asyncio.Lock()
+        self._watch: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._revision: Optional[int] = None
+        # 每次失效递增;加载期间发生过失效的快照不会被缓存
+        self._generation = 0
+
+        # Counters
+        self._hits = 0
+        self._misses = 0
+        self._loads = 0
+        self._invalidations = 0
+        self._external_invalidations = 0
+
+    def invalidate(self):
+        if self._snapshot is not None:
+            self._invalidations += 1
+        self._snapshot = None
+        self._generation += 1
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
+        self._data_version = None
+        self._revision = None
+
+    def _check_external_writes(self):
+        """Drop the snapshot when another connection changed the settings tables"""
+        try:
+            if self._watch is None:
+                self._watch = sqlite3.connect(
+                    f"file:{config.database_path}?mode=ro", uri=True, check_same_thread=False
+                )
+            data_version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            row = self._watch.execute("SELECT revision FROM settings_revision WHERE id = 1").fetchone()
+            revision = row[0] if row else None
+            if revision != self._revision:
+                self._revision = revision
+                if self._snapshot is not None:
+                    self._external_invalidations += 1
+                self.invalidate()
+        except sqlite3.Error:
+            # 无法确认版本时宁可重新加载
+            logger.exception("Settings version check failed")
+            self.close()
+            self.invalidate()
+
+    async def _load(self) -> _Snapshot:
+        async with self._session_maker() as session:
+            revision = (await session.execute(
+                select(SettingsRevision.revision).where(SettingsRevision.id == 1)
+            )).scalar() or 0
+            snapshot = _Snapshot(revision=revision)
+            for row in (await session.execute(select(ModelConfig))).scalars():
+                snapshot.model_configs[row.id] = ModelConfigEntry(**_columns(row, ModelConfigEntry))
+            for row in (await session.execute(select(AppSettings))).scalars():
+                snapshot.app_settings[row.key] = AppSettingEntry(
+                    **_columns(row, AppSettingEntry), typed_value=decode_setting(row.value, row.value_type)
+                )
+            for row in (await session.execute(select(APIKeyStorage))).scalars():
+                snapshot.api_keys[row.provider] = APIKeyEntry(**_columns(row, APIKeyEntry))
+        self._loads += 1
+        return snapshot
+
+    async def _get(self) -> _Snapshot:
+        self._check_external_writes()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self._hits += 1
+            return snapshot
+        async with self._lock:
+            if self._snapshot is not None:
+                self._hits += 1
+                return self._snapshot
+            self._misses += 1
+            generation = self._generation
+            snapshot = await self._load()
+            if generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+
+    # ============= Model configs =============
+
+    async def model_configs(self, provider: Optional[str] = None, is_active: Optional[bool] = None) -> list[ModelConfigEntry]:
+        """Default first, then newest first"""
+        entries = [
+            entry for entry in (await self._get()).model_configs.values()
+            if (provider is None or entry.provider == provider)
+            and (is_active is None or entry.is_active == is_active)
+        ]
+        entries.sort(key=lambda entry: entry.created_at or datetime.min, reverse=True)
+        entries.sort(key=lambda entry: bool(entry.is_default), reverse=True)
+        return entries
+
+    async def model_config(self, config_id: str) -> Optional[ModelConfigEntry]:
+        return (await self._get()).model_configs.get(config_id)
+
+    async def default_model_config(self) -> Optional[ModelConfigEntry]:
+        for entry in (await self._get()).model_configs.values():
+            if entry.is_default and entry.is_active:
+                return entry
+        return None
+
+    async def api_key_for(self, provider: str, model_id: Optional[str] = None) -> Optional[str]:
+        """Key of a matching active model config, else the provider key, else None (env var)"""
+        snapshot = await self._get()
+        if model_id is not None:
+            for entry in snapshot.model_configs.values():
+                if entry.provider == provider and entry.model_id == model_id and entry.is_active and entry.api_key:
+                    return entry.api_key
+        stored = snapshot.api_keys.get(provider)
+        return stored.encrypted_key if stored and stored.encrypted_key else None
+
+    # ============= App settings =============
+
+    async def app_settings(self, category: Optional[str] = None) -> list[AppSettingEntry]:
+        entries = [
+            entry for entry in (await self._get()).app_settings.values()
+            if category is None or entry.category == category
+        ]
+        return sorted(entries, key=lambda entry: (entry.category or "", entry.key))
+
+    async def app_setting(self, key: str) -> Optional[AppSettingEntry]:
+        return (await self._get()).app_settings.get(key)
+
+    async def setting_value(self, key: str, default: Any = None) -> Any:
+        entry = await self.app_setting(key)
+        return default if entry is None or entry.typed_value is None else entry.typed_value
+
+    # ============= API keys =============
+
+    async def api_keys(self) -> list[APIKeyEntry]:
+        return list((await self._get()).api_keys.values())
+
+    async def api_key(self, provider: str) -> Optional[APIKeyEntry]:
+        return (await self._get()).api_keys.get(provider)
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "loads": self._loads,
+            "invalidations": self._invalidations,
+            "external_invalidations": self._external_invalidations,
+            "revision": self._snapshot.revision if self._snapshot else None,
+        }
+
+settings_cache = SettingsCache()
+
+# ============= Write-path invalidation =============
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["settings_changed"] = True
+
+for _model in (ModelConfig, AppSettings, APIKeyStorage):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _mark_changed)
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    if session.info.pop("settings_changed", False):
+        settings_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _session_rolled_back(session):
+    session.info.pop("settings_changed", None)
@@ -0,0 +1,54 @@
+"""
+Token counting
+
+消息写入时计算一次 token 数并存到 Message.token_count,组装上下文时直接累加,不再重复分词。
+使用 cl100k_base 编码(LiteLLM 自带词表文件,离线可用);对其他厂商的模型是近似值,
+组装上下文时另留余量。tiktoken 不可用时退回按字符估算。
+"""
+import re
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event, inspect
+
+from app.models.conversation import Message
+
+# 聊天格式中每条消息除正文外的固定开销(role、分隔符)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK = re.compile(r"[　-鿿가-힯豈-﫿＀-￯]")
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import litellm  # noqa: F401  (points tiktoken at LiteLLM's bundled BPE files)
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def estimate_tokens(text: str) -> int:
+    """Rough count without a tokenizer: one token per CJK character, four characters otherwise"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def message_tokens(token_count: int) -> int:
+    """Cost of one chat message whose content has `token_count` tokens"""
+    return token_count + MESSAGE_OVERHEAD_TOKENS
+
+@event.listens_for(Message, "before_insert")
+def _count_on_insert(mapper, connection, target):
+    target.token_count = count_tokens(target.content)
+
+@event.listens_for(Message, "before_update")
+def _count_on_update(mapper, connection, target):
+    if inspect(target).attrs["content"].history.has_changes():
+        target.token_count = count_tokens(target.content)
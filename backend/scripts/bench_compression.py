@@ -0,0 +1,113 @@
+"""
+Benchmark: database size and read throughput with and without CompressedText
+
+Builds two scratch databases with the same synthetic chat history (short user
+prompts, long assistant answers full of code blocks) — one storing
+Message.content as plain Text, one as CompressedText — and reports file size,
+insert time and full-history read throughput.
+
+    cd backend
+    python scripts/bench_compression.py --messages 20000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, insert, select  # noqa: E402
+
+from app.db.types import CompressedText  # noqa: E402
+
+CODE = '''```python
+def build_index(rows, key="id"):
+    """Index rows by key for O(1) lookup."""
+    index = {}
+    for row in rows:
+        index.setdefault(row[key], []).append(row)
+    return index
+```
+'''
+PROSE = [
+    "这段代码的时间复杂度是 O(n),因为每一行只会被访问一次。",
+    "The important detail is that the dictionary keeps insertion order, so results stay stable.",
+    "如果数据量很大,可以考虑把索引结构换成按页加载的 B-tree。",
+    "Note how setdefault avoids a second lookup compared to an explicit membership test.",
+]
+
+def synthetic_messages(count: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append(rng.choice(PROSE)[: rng.randint(20, 80)])
+        else:
+            parts = []
+            for _ in range(rng.randint(3, 12)):
+                parts.append(rng.choice(PROSE))
+                if rng.random() < 0.6:
+                    parts.append(CODE.replace("rows", rng.choice(["rows", "items", "records"])))
+            messages.append("\n\n".join(parts))
+    return messages
+
+def run(column_type, path: Path, bodies: list[str]) -> dict:
+    engine = create_engine(f"sqlite:///{path}")
+    metadata = MetaData()
+    messages = Table(
+        "messages", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("conversation_id", String(36)),
+        Column("content", column_type, nullable=False),
+    )
+    metadata.create_all(engine)
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(insert(messages), [
+            {"conversation_id": f"conv-{i // 200}", "content": body} for i, body in enumerate(bodies)
+        ])
+    insert_seconds = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        total_chars = sum(len(body) for body in conn.execute(select(messages.c.content)).scalars())
+    read_seconds = time.perf_counter() - start
+    engine.dispose()
+
+    return {
+        "size_mb": path.stat().st_size / 1e6,
+        "insert_s": insert_seconds,
+        "read_s": read_seconds,
+        "rows_per_s": len(bodies) / read_seconds,
+        "chars": total_chars,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    bodies = synthetic_messages(args.messages)
+    raw_mb = sum(len(b.encode()) for b in bodies) / 1e6
+    print(f"{args.messages} messages, {raw_mb:.1f} MB of UTF-8 text")
+    print(f"{'storage':<16}{'db size MB':>12}{'insert s':>10}{'read s':>10}{'rows/s':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, column_type in (("Text", Text), ("CompressedText", CompressedText)):
+            results[name] = run(column_type, Path(tmp) / f"{name}.db", bodies)
+            r = results[name]
+            print(f"{name:<16}{r['size_mb']:>12.1f}{r['insert_s']:>10.2f}{r['read_s']:>10.2f}{r['rows_per_s']:>12.0f}")
+
+    assert results["Text"]["chars"] == results["CompressedText"]["chars"]
+    ratio = results["CompressedText"]["size_mb"] / results["Text"]["size_mb"]
+    print(f"size ratio: {ratio:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: insert throughput and index size for UUID primary key schemes
+
+Builds scratch databases with the shape of the messages table (UUID primary
+key, conversation id reference, the (conversation_id, created_at, id) history
+index) and inserts the same number of rows in group-commit sized
+transactions with each id scheme:
+
+  uuid4-text   random UUIDv4 as 36-character text (the old scheme)
+  uuid4-blob   random UUIDv4 as 16-byte BLOBs
+  uuid7-blob   time-ordered UUIDv7 as 16-byte BLOBs (the new default)
+
+Reports insert throughput over the whole run and over the last batches (when
+the B-tree no longer fits in the page cache), the file size and the size of
+each B-tree from dbstat.
+
+    cd backend
+    python scripts/bench_ids.py --rows 1000000
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.ids import uuid7  # noqa: E402
+
+SCHEMES = {
+    "uuid4-text": ("VARCHAR(36)", lambda: str(uuid.uuid4())),
+    "uuid4-blob": ("BLOB", lambda: uuid.uuid4().bytes),
+    "uuid7-blob": ("BLOB", lambda: uuid7().bytes),
+}
+
+def run(scheme: str, path: Path, rows: int, batch_size: int, conversations: int, cache_kib: int) -> dict:
+    column_type, new_id = SCHEMES[scheme]
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(f"PRAGMA cache_size={-cache_kib}")
+    db.execute(f"CREATE TABLE messages (id {column_type} PRIMARY KEY NOT NULL, "
+               f"conversation_id {column_type} NOT NULL, role VARCHAR(20), content TEXT, created_at DATETIME)")
+    db.execute("CREATE INDEX ix_messages_conversation_id_created_at_id ON messages (conversation_id, created_at, id)")
+    conversation_ids = [new_id() for _ in range(conversations)]
+
+    started = time.perf_counter()
+    clock = datetime(2024, 1, 1)
+    tail_rows, tail_seconds = 0, 0.0
+    tail_start = rows - rows // 10
+    for start in range(0, rows, batch_size):
+        batch = []
+        for i in range(start, min(rows, start + batch_size)):
+            clock += timedelta(milliseconds=10)
+            batch.append((new_id(), conversation_ids[i % conversations], "user", "hello", clock.isoformat()))
+        batch_started = time.perf_counter()
+        with db:
+            db.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", batch)
+        if start >= tail_start:
+            tail_rows += len(batch)
+            tail_seconds += time.perf_counter() - batch_started
+    seconds = time.perf_counter() - started
+
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    btrees = dict(db.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    db.close()
+    return {
+        "rows_per_s": rows / seconds,
+        "tail_rows_per_s": tail_rows / tail_seconds if tail_seconds else 0.0,
+        "size_mb": path.stat().st_size / 1e6,
+        "pk_mb": btrees.get("sqlite_autoindex_messages_1", 0) / 1e6,
+        "history_mb": btrees.get("ix_messages_conversation_id_created_at_id", 0) / 1e6,
+        "table_mb": btrees.get("messages", 0) / 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=64, help="rows per transaction (group commit size)")
+    parser.add_argument("--conversations", type=int, default=5000)
+    parser.add_argument("--cache-kib", type=int, default=8 * 1024, help="page cache per connection")
+    args = parser.parse_args()
+
+    print(f"{args.rows} rows, {args.batch_size} rows per transaction, {args.cache_kib} KiB page cache")
+    print(f"{'scheme':<12}{'rows/s':>10}{'last 10% rows/s':>17}{'db MB':>8}{'table MB':>10}{'pk MB':>8}{'history MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scheme in SCHEMES:
+            r = run(scheme, Path(tmp) / f"{scheme}.db", args.rows, args.batch_size, args.conversations, args.cache_kib)
+            print(f"{scheme:<12}{r['rows_per_s']:>10.0f}{r['tail_rows_per_s']:>17.0f}{r['size_mb']:>8.1f}"
+                  f"{r['table_mb']:>10.1f}{r['pk_mb']:>8.1f}{r['history_mb']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: SSE framing of token streams, one frame per delta vs SSEEncoder
+
+Runs many concurrent synthetic token streams (deltas of one or two
+characters arriving every few milliseconds, as providers send them) through
+both encoders and reports frames, bytes, frames/sec and CPU time per 1k
+tokens. The "framing only" column subtracts the cost of generating the
+synthetic streams. Frames go through Starlette's StreamingResponse into a
+local socket, one chunked write per frame as the ASGI server does; the frame
+count is also what a client would have to parse.
+
+    cd backend
+    python scripts/bench_sse.py --streams 200 --tokens 400 --interval-ms 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.responses import StreamingResponse  # noqa: E402
+
+from app.api.sse import SSEEncoder, orjson  # noqa: E402
+
+WORDS = ["the", "index", "函数", "返回", "value", "of", "B-tree", "页", "缓存", "query", "，", "。", "\n"]
+
+def deltas(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    text = " ".join(rng.choice(WORDS) for _ in range(count))
+    result, i = [], 0
+    while i < len(text) and len(result) < count:
+        size = rng.randint(1, 2)
+        result.append(text[i:i + size])
+        i += size
+    return result
+
+async def source(parts: list[str], interval: float):
+    position = 0
+    yield 0, {"type": "start", "message_id": "bench"}
+    for part in parts:
+        await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+        position += len(part)
+        yield position, {"content": part}
+    yield position, {"type": "done", "message_id": "bench"}
+
+async def raw(events):
+    # No framing and nothing sent: the cost of the synthetic streams themselves
+    async for _ in events:
+        pass
+    yield b""
+
+async def naive(events):
+    # The previous chat_stream framing: one json.dumps and one frame per delta
+    async for position, event in events:
+        yield f"id: {position}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+
+async def serve(frames, totals: dict) -> None:
+    """Send the frames through Starlette's StreamingResponse into a socket, chunked like the ASGI server"""
+    server_sock, client_sock = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=server_sock)
+    reader, client_writer = await asyncio.open_connection(sock=client_sock)
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        body = message.get("body")
+        if body:
+            totals["frames"] += 1
+            totals["bytes"] += len(body)
+            writer.write(b"%x\r\n%s\r\n" % (len(body), body))
+            await writer.drain()
+
+    async def drain_client():
+        while await reader.read(65536):
+            pass
+
+    client = asyncio.create_task(drain_client())
+    await StreamingResponse(frames, media_type="text/event-stream")({"type": "http"}, receive, send)
+    writer.close()
+    await client
+    client_writer.close()
+
+async def run(name: str, streams: list[list[str]], interval: float) -> dict:
+    totals = {"frames": 0, "bytes": 0}
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    framing = {"source only": raw, "per-delta": naive, "coalesced": lambda events: SSEEncoder().encode(events)}[name]
+    await asyncio.gather(*(serve(framing(source(parts, interval)), totals) for parts in streams))
+    totals["wall_s"] = time.perf_counter() - wall
+    totals["cpu_s"] = time.process_time() - cpu
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=400, help="deltas per stream")
+    parser.add_argument("--interval-ms", type=float, default=5.0, help="mean gap between deltas")
+    args = parser.parse_args()
+
+    streams = [deltas(args.tokens, seed) for seed in range(args.streams)]
+    tokens = sum(len(parts) for parts in streams)
+    print(f"{args.streams} streams x {args.tokens} deltas, ~{args.interval_ms} ms apart; "
+          f"JSON: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'framing':<13}{'frames':>10}{'KB':>10}{'frames/s':>12}{'wall s':>9}{'CPU ms/1k tok':>15}{'framing only':>14}")
+    results = {}
+    for name in ("source only", "per-delta", "coalesced"):
+        r = results[name] = asyncio.run(run(name, streams, args.interval_ms / 1000))
+        cpu = r["cpu_s"] / tokens * 1e6
+        framing = cpu - results["source only"]["cpu_s"] / tokens * 1e6
+        print(f"{name:<13}{r['frames']:>10}{r['bytes'] / 1e3:>10.0f}{r['frames'] / r['wall_s']:>12.0f}"
+              f"{r['wall_s']:>9.2f}{cpu:>15.2f}{framing:>14.2f}")
+    print(f"frames ratio: {results['coalesced']['frames'] / results['per-delta']['frames']:.2f}")
+
+if __name__ == "__main__":
+    main()
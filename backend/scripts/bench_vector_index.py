@@ -0,0 +1,95 @@
+"""
+Benchmark: semantic search query latency at 100k and 1M vectors
+
+Fills an in-memory VectorIndex with clustered random unit vectors (a rough
+stand-in for real embeddings, which are far from uniform) and reports query
+latency for the exact NumPy scan and for the IVF index, plus IVF recall@k
+against the exact results.
+
+    cd backend
+    python scripts/bench_vector_index.py --sizes 100000 1000000 --dim 256
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from app.config import config  # noqa: E402
+from app.db.vector_index import VectorIndex  # noqa: E402
+from app.services.embedding_service import normalize  # noqa: E402
+
+def clustered_vectors(count: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = normalize(rng.standard_normal((clusters, dim), dtype=np.float32))
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100_000):
+        end = min(count, start + 100_000)
+        noise = rng.standard_normal((end - start, dim), dtype=np.float32) * 0.06
+        vectors[start:end] = centers[rng.integers(0, clusters, end - start)] + noise
+    return normalize(vectors)
+
+def build_index(vectors: np.ndarray) -> VectorIndex:
+    index = VectorIndex(vectors.shape[1])
+    for start in range(0, len(vectors), 100_000):
+        chunk = vectors[start:start + 100_000]
+        index.add([("message", str(start + i), "c") for i in range(len(chunk))], chunk)
+    return index
+
+def timed_queries(index: VectorIndex, queries: np.ndarray, k: int) -> tuple[list, np.ndarray]:
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append({hit.ref_id for hit in hits})
+    return results, np.array(latencies)
+
+def run(size: int, dim: int, queries: int, k: int, seed: int = 7) -> dict:
+    rng = np.random.default_rng(seed)
+    vectors = clustered_vectors(size, dim, clusters=max(64, size // 1000), rng=rng)
+    query_vectors = normalize(vectors[rng.integers(0, size, queries)] + rng.standard_normal((queries, dim), dtype=np.float32) * 0.05)
+
+    started = time.perf_counter()
+    index = build_index(vectors)
+    load_s = time.perf_counter() - started
+    exact, exact_ms = timed_queries(index, query_vectors, k)
+
+    started = time.perf_counter()
+    index.install_ivf(*index.train())
+    train_s = time.perf_counter() - started
+    approx, ivf_ms = timed_queries(index, query_vectors, k)
+    recall = np.mean([len(a & e) / k for a, e in zip(approx, exact)])
+
+    return {
+        "size": size,
+        "load_s": load_s,
+        "exact_p50": np.percentile(exact_ms, 50),
+        "exact_p95": np.percentile(exact_ms, 95),
+        "ivf_lists": index.ivf_lists,
+        "train_s": train_s,
+        "ivf_p50": np.percentile(ivf_ms, 50),
+        "ivf_p95": np.percentile(ivf_ms, 95),
+        "recall": recall,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=config.embedding_dim)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"dim={args.dim} k={args.k} probes={config.vector_ivf_probes}")
+    print(f"{'vectors':>9} {'load s':>7} {'exact p50/p95 ms':>17} {'lists':>6} {'train s':>8} "
+          f"{'ivf p50/p95 ms':>15} {'recall@k':>9}")
+    for size in args.sizes:
+        r = run(size, args.dim, args.queries, args.k)
+        print(f"{r['size']:>9} {r['load_s']:>7.1f} {r['exact_p50']:>8.1f}/{r['exact_p95']:<8.1f} "
+              f"{r['ivf_lists']:>6} {r['train_s']:>8.1f} {r['ivf_p50']:>7.2f}/{r['ivf_p95']:<7.2f} {r['recall']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
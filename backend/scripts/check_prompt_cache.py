@@ -0,0 +1,155 @@
+"""
+Check: prompt-caching hints on the wire
+
+Starts a local stand-in for the Anthropic Messages API and the OpenAI Chat
+Completions API, sends a long conversation through LLMService.chat_completion
+(non-streaming and streaming) and checks the request payloads the providers
+would receive:
+
+  anthropic   cache_control breakpoints on the system prompt and on the last
+              history message, none on the new user message
+  openai      the payload is unchanged (caching is automatic)
+
+The stand-in reports cached prompt tokens in its usage, which must show up in
+prompt_cache.stats(). Exits non-zero on the first failed check.
+
+    cd backend
+    python scripts/check_prompt_cache.py
+"""
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.database import close_db, init_db  # noqa: E402
+from app.services.llm_service import LLMService  # noqa: E402
+from app.services.prompt_cache import prompt_cache  # noqa: E402
+from app.services.provider_clients import provider_clients  # noqa: E402
+from app.services.settings_cache import settings_cache  # noqa: E402
+
+CACHED_TOKENS = 1500
+requests: list[tuple[str, dict]] = []
+
+def anthropic_response(payload: dict) -> dict:
+    return {
+        "id": "msg_1", "type": "message", "role": "assistant", "model": payload["model"],
+        "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn",
+        "usage": {"input_tokens": 20, "output_tokens": 1,
+                  "cache_read_input_tokens": CACHED_TOKENS, "cache_creation_input_tokens": 0},
+    }
+
+def anthropic_events(payload: dict) -> list[tuple[str, dict]]:
+    message = anthropic_response(payload)
+    message["content"] = []
+    return [
+        ("message_start", {"type": "message_start", "message": message}),
+        ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+        ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "ok"}}),
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 1}}),
+        ("message_stop", {"type": "message_stop"}),
+    ]
+
+def openai_response(payload: dict) -> dict:
+    return {
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": payload["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 2000, "completion_tokens": 1, "total_tokens": 2001,
+                  "prompt_tokens_details": {"cached_tokens": CACHED_TOKENS}},
+    }
+
+class StandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        requests.append((self.path, payload))
+        if self.path.endswith("/messages") and payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for name, data in anthropic_events(payload):
+                self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+            return
+        body = json.dumps(anthropic_response(payload) if self.path.endswith("/messages") else openai_response(payload))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        sys.exit(1)
+
+def conversation() -> list[dict]:
+    messages = [{"role": "system", "content": "You are a patient tutor. " * 200}]
+    for i in range(10):
+        messages.append({"role": "user", "content": f"question {i} " + "context " * 100})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "detail " * 100})
+    messages.append({"role": "user", "content": "the new question"})
+    return messages
+
+def has_breakpoint(content) -> bool:
+    return isinstance(content, list) and any("cache_control" in block for block in content)
+
+async def run():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    messages = conversation()
+    original = json.dumps(messages)
+
+    for stream in (False, True):
+        requests.clear()
+        response = await LLMService.chat_completion(
+            "anthropic", "claude-3-5-sonnet-20241022", messages,
+            api_key="test", max_tokens=16, stream=stream, api_base=base
+        )
+        if stream:
+            async for _ in response:
+                pass
+        path, payload = requests[-1]
+        label = "anthropic stream" if stream else "anthropic"
+        check(path.endswith("/v1/messages"), f"{label}: request reached the stand-in ({path})")
+        system = payload["system"]
+        check(isinstance(system, list) and "cache_control" in system[-1], f"{label}: system prompt has a breakpoint")
+        marked = [i for i, m in enumerate(payload["messages"]) if has_breakpoint(m["content"])]
+        check(marked == [len(payload["messages"]) - 2], f"{label}: breakpoint on the last history message only ({marked})")
+    check(json.dumps(messages) == original, "caller's messages were not modified")
+
+    requests.clear()
+    await LLMService.chat_completion("openai", "gpt-4o", messages, api_key="test", api_base=base)
+    path, payload = requests[-1]
+    check(path.endswith("/chat/completions"), f"openai: request reached the stand-in ({path})")
+    check(not any(has_breakpoint(m["content"]) for m in payload["messages"]), "openai: payload has no breakpoints")
+
+    short = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}, {"role": "user", "content": "bye"}]
+    requests.clear()
+    await LLMService.chat_completion("anthropic", "claude-3-5-sonnet-20241022", short, api_key="test", max_tokens=16, api_base=base)
+    check(not any(has_breakpoint(m["content"]) for m in requests[-1][1]["messages"]), "anthropic: short prefix is not marked")
+
+    stats = prompt_cache.stats()
+    print(json.dumps(stats, indent=2))
+    check(stats["usage_reports"] == 4, "usage recorded for every response")
+    check(stats["cached_tokens"] == 4 * CACHED_TOKENS, "cached tokens recorded from usage")
+    server.shutdown()
+
+async def main():
+    # The scheduler reads per-model limits from the settings tables
+    await init_db()
+    try:
+        await run()
+    finally:
+        await provider_clients.close()
+        settings_cache.close()
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())